@@ -0,0 +1,46 @@
+# Compares min, max, avg and count of one region fetched as four queries and as one agg() query,
+# against a local stub server that takes a fixed time per query to scan the subset.
+#
+# Usage: python benchmarks/bench_batched_aggregations.py [scan_milliseconds] [repetitions]
+import os
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+sys.path.insert(0, os.path.join(root_dir, 'tests'))
+
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+SUBSET = 'Lat(30:60), Long(0:40), ansi("2014-01":"2014-12")'
+
+def main():
+    scan_seconds = (float(sys.argv[1]) if len(sys.argv) > 1 else 20) / 1e3
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    def responder(query):
+        time.sleep(scan_seconds)
+        return b'{"-12.5 31 9.75 1042"}' if query.rstrip().endswith('}') else b'9.75'
+
+    with StubServer(responder) as stub, DatabaseConnection(stub.url, coalesce=False) as dbc:
+        def cube():
+            return Datacube(dbc).coverage_instance("AvgLandTemp", "c").subset(SUBSET, '$c')
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            separate = {'min': cube().min().execute(), 'max': cube().max().execute(),
+                        'avg': cube().avg().execute(), 'count': cube().count().execute()}
+        separate_time = (time.perf_counter() - start) / repetitions
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            batched = cube().agg(['min', 'max', 'avg', 'count']).execute()
+        batched_time = (time.perf_counter() - start) / repetitions
+    print(f'simulated scan:  {scan_seconds * 1e3:.0f} ms per query')
+    print(f'four queries:    {separate_time * 1e3:.1f} ms')
+    print(f'one agg() query: {batched_time * 1e3:.1f} ms')
+    print(f'speed-up:        {separate_time / batched_time:.2f}x')
+
+if __name__ == '__main__':
+    main()
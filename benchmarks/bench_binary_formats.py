@@ -0,0 +1,40 @@
+# Compares transfer size and decode time of a float grid encoded as CSV and as the binary formats.
+#
+# Usage: python benchmarks/bench_binary_formats.py [rows] [columns]
+import os
+import sys
+import timeit
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+sys.path.insert(0, os.path.join(root_dir, 'tests'))
+
+import numpy as np
+from byte_to_list_module import byte_to_grid
+from binary_format_module import decode_raw, decode_geotiff, decode_netcdf
+from helper_methods import make_geotiff, make_netcdf
+
+def to_csv(grid):
+    # rasdaman style: one brace group per row
+    return ','.join('{' + ','.join(f'{value:.6g}' for value in row) + '}' for row in grid).encode('utf-8')
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 1440
+    grid = np.random.default_rng(0).uniform(-40, 40, (rows, columns)).astype(np.float32)
+    payloads = [
+        ('CSV, byte_to_grid', to_csv(grid), byte_to_grid),
+        ('BINARY', grid.astype('<f4').tobytes(), lambda content: decode_raw(content, '<f4', (rows, columns))),
+        ('GEOTIFF', make_geotiff(grid), decode_geotiff),
+        ('NETCDF', make_netcdf({'lat': rows, 'lon': columns}, {'AvgLandTemp': (['lat', 'lon'], grid)}), decode_netcdf),
+    ]
+    csv_bytes = len(payloads[0][1])
+    csv_time = min(timeit.repeat(lambda: byte_to_grid(payloads[0][1]), number=1, repeat=3))
+    print(f'grid: {rows} x {columns} float32')
+    print(f'{"format":<20} {"bytes":>12} {"decode":>12} {"vs CSV (size / time)":>22}')
+    for name, content, decode in payloads:
+        seconds = min(timeit.repeat(lambda: decode(content), number=1, repeat=3))
+        print(f'{name:<20} {len(content):>12} {seconds * 1e3:>9.3f} ms {csv_bytes / len(content):>9.1f}x / {csv_time / seconds:.0f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# Compares byte_to_list with the vectorized byte_to_array across CSV payload sizes.
+#
+# Usage: python benchmarks/bench_byte_to_array.py
+import os
+import sys
+import random
+import timeit
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+
+from byte_to_list_module import byte_to_list, byte_to_array
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+def make_payload(cells):
+    rng = random.Random(0)
+    return ' '.join(f'{rng.uniform(-50, 50):.4f}' for _ in range(cells)).encode('utf-8')
+
+def best_of(function, payload, repeat):
+    return min(timeit.repeat(lambda: function(payload), number=1, repeat=repeat))
+
+def main():
+    print(f'{"cells":>10} {"byte_to_list":>14} {"byte_to_array":>14} {"speed-up":>9}')
+    for cells in SIZES:
+        payload = make_payload(cells)
+        repeat = 5 if cells < 1000000 else 3
+        as_list = best_of(byte_to_list, payload, repeat)
+        as_array = best_of(byte_to_array, payload, repeat)
+        print(f'{cells:>10} {as_list * 1e3:>11.2f} ms {as_array * 1e3:>11.2f} ms {as_list / as_array:>8.2f}x')
+
+if __name__ == '__main__':
+    main()
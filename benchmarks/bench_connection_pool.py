@@ -0,0 +1,39 @@
+# Compares the per-query latency of one-off requests.post calls with the pooled keep-alive
+# session of DatabaseConnection, both against a local stub WCPS server.
+#
+# Usage: python benchmarks/bench_connection_pool.py [number_of_queries]
+import os
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+sys.path.insert(0, os.path.join(root_dir, 'tests'))
+
+import requests
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+QUERY = 'for $c in (AvgLandTemp) return avg($c[Lat(53.08), Long(8.80), ansi("2014-01":"2014-12")])'
+
+def time_per_query(send, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        send(QUERY)
+    return (time.perf_counter() - start) / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with StubServer(lambda query: b'17.5') as stub:
+        unpooled = time_per_query(lambda q: requests.post(stub.url, data={'query': q}, verify=False), n)
+        unpooled_connections = stub.connections_opened
+        with DatabaseConnection(stub.url) as dbc:
+            pooled = time_per_query(dbc.send_query, n)
+        pooled_connections = stub.connections_opened - unpooled_connections
+    print(f'queries:             {n}')
+    print(f'requests.post:       {unpooled * 1e3:.3f} ms/query, {unpooled_connections} connections')
+    print(f'pooled session:      {pooled * 1e3:.3f} ms/query, {pooled_connections} connections')
+    print(f'speed-up:            {unpooled / pooled:.2f}x')
+
+if __name__ == '__main__':
+    main()
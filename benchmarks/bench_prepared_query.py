@@ -0,0 +1,38 @@
+# Compares rendering the same query shape with changing bounds through the Datacube builder and
+# through a prepared query template.
+#
+# Usage: python benchmarks/bench_prepared_query.py [queries]
+import os
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+    bounds = [(low % 170 - 85, low % 170 - 80, 10 + low % 20) for low in range(count)]
+
+    start = time.perf_counter()
+    built = [Datacube(dbc).coverage_instance("AvgLandTemp", "c").subset(f'Lat({low}:{high}), Long(0:40)', '$c')
+             .count(f'$c > {threshold}').construct_query() for low, high, threshold in bounds]
+    builder_time = time.perf_counter() - start
+
+    prepared = Datacube(dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(${low}:${high}), Long(0:40)', '$c') \
+        .count('$c > ${threshold}').prepare()
+    start = time.perf_counter()
+    bound = prepared.bind_many({'low': low, 'high': high, 'threshold': threshold} for low, high, threshold in bounds)
+    prepared_time = time.perf_counter() - start
+
+    assert bound == built
+    print(f'queries:  {count}')
+    print(f'builder:  {builder_time / count * 1e6:.2f} us per query')
+    print(f'prepared: {prepared_time / count * 1e6:.2f} us per query')
+    print(f'speed-up: {builder_time / prepared_time:.2f}x')
+
+if __name__ == '__main__':
+    main()
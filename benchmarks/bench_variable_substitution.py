@@ -0,0 +1,48 @@
+# Compares replacing the variables of a long expression with their subsets one variable at a time
+# (a pass over the expression per variable) and in a single tokenizing pass.
+#
+# Usage: python benchmarks/bench_variable_substitution.py [variables] [repeats]
+import os
+import re
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+
+from query_ast_module import substitute_variables, variable_index
+
+def replace_per_variable(expression, subsets):
+    # A pass per variable; the lookahead keeps '$c1' from matching inside '$c10'
+    for var, subset in subsets:
+        if subset is not None:
+            expression = re.sub(re.escape(var) + r'(?![A-Za-z0-9_])', lambda match: f'{var}[{subset}]', expression)
+    return expression
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    subsets = tuple((f'$c{index}', f'Lat({index % 90}:{index % 90 + 1}), Long(0:40)') for index in range(count))
+    # A switch body with a case per variable, encoded like Datacube.switch() queries are
+    cases = ' '.join(f'case $c{index} > {index} return {{red: {index % 255}; green: 0; blue: 0}}' for index in range(count))
+    expression = f'encode(switch {cases} default return {{red: 0; green: 0; blue: 0}}, "image/png")'
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        replaced = replace_per_variable(expression, subsets)
+    per_variable_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        substituted = substitute_variables(expression, subsets)
+    single_pass_time = time.perf_counter() - start
+
+    assert substituted == replaced
+    print(f'variables:   {count}, expression: {len(expression)} characters')
+    print(f'per variable: {per_variable_time / repeats * 1e3:.3f} ms per expression')
+    print(f'single pass:  {single_pass_time / repeats * 1e3:.3f} ms per expression')
+    print(f'speed-up:     {per_variable_time / single_pass_time:.2f}x')
+    print(f'index cache:  {variable_index.cache_info()}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, but needed by every decoder in this module
+    np = None
+
+# TIFF field types and their sizes in bytes
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8}
+# struct codes of the TIFF field types that hold integers
+TIFF_INTEGER_CODES = {1: 'B', 3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i', 16: 'Q'}
+# TIFF SampleFormat values mapped to NumPy kind characters
+TIFF_SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+# netCDF classic external types mapped to big-endian NumPy dtypes
+NETCDF_DTYPES = {1: '>i1', 2: 'S1', 3: '>i2', 4: '>i4', 5: '>f4', 6: '>f8',
+                 7: '>u1', 8: '>u2', 9: '>u4', 10: '>i8', 11: '>u8'}
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+def require_numpy():
+    """
+    Raises an ImportError if NumPy isn't installed.
+    """
+    if np is None:
+        raise ImportError("NumPy is required for binary result formats.")
+
+def decode_raw(content, dtype, shape=None):
+    """
+    Decodes an application/octet-stream result, which holds the bare cell values in row-major order.
+        The array is a zero-copy, read-only view on the response bytes.
+
+    Parameters:
+        content (bytes): The body of the server's response.
+        dtype (str or numpy.dtype): The cell type of the result, e.g. '<f4' for rasdaman float cells.
+        shape (tuple of int, optional): The grid shape. If None, a one-dimensional array is returned.
+
+    Returns:
+        numpy.ndarray: The decoded values.
+
+    Raises:
+        ImportError: If NumPy isn't installed.
+        ValueError: If the number of bytes doesn't match the dtype or shape.
+
+    Example:
+        >>> decode_raw(response.content, '<f4', (180, 360)).shape
+        (180, 360)
+    """
+    require_numpy()
+    dtype = np.dtype(dtype)
+    if len(content) % dtype.itemsize:
+        raise ValueError("Response size is not a multiple of the cell size.")
+    values = np.frombuffer(content, dtype=dtype)
+    if shape is not None:
+        values = values.reshape(shape)
+    return values
+
+def read_tiff_tags(content):
+    """
+    Reads the tags of the first image file directory of a classic TIFF file.
+
+    Parameters:
+        content (bytes): The TIFF file.
+
+    Returns:
+        tuple: The byte order character ('<' or '>') and a dict mapping tag numbers to tuples of values.
+
+    Raises:
+        ValueError: If the content is not a classic TIFF file.
+    """
+    if content[:4] == b'II*\x00':
+        order = '<'
+    elif content[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        raise ValueError("Response is not a classic TIFF file.")
+    (ifd_offset,) = struct.unpack_from(order + 'I', content, 4)
+    (entry_count,) = struct.unpack_from(order + 'H', content, ifd_offset)
+    tags = {}
+    for i in range(entry_count):
+        tag, field_type, count, value_offset = struct.unpack_from(order + 'HHII', content, ifd_offset + 2 + 12 * i)
+        if field_type not in TIFF_INTEGER_CODES:
+            continue  # Only integer tags are needed to locate the pixels
+        size = TIFF_TYPE_SIZES[field_type] * count
+        # Values of up to four bytes are stored in the entry itself
+        position = ifd_offset + 2 + 12 * i + 8 if size <= 4 else value_offset
+        tags[tag] = struct.unpack_from(f'{order}{count}{TIFF_INTEGER_CODES[field_type]}', content, position)
+    return order, tags
+
+def decode_geotiff(content):
+    """
+    Decodes an uncompressed (Geo)TIFF result into an array of shape (rows, columns) or
+        (rows, columns, bands). When the strips lie back to back in the file, which is how servers
+        usually write them, the array is a zero-copy view on the response bytes; otherwise the strips
+        or tiles are copied into a new array.
+
+    Parameters:
+        content (bytes): The body of the server's response.
+
+    Returns:
+        numpy.ndarray: The decoded raster.
+
+    Raises:
+        ImportError: If NumPy isn't installed.
+        ValueError: If the file is compressed or uses a layout the reader doesn't support.
+    """
+    require_numpy()
+    order, tags = read_tiff_tags(content)
+    if tags.get(259, (1,))[0] != 1:
+        raise ValueError("Only uncompressed TIFF files are supported.")
+    width, height = tags[256][0], tags[257][0]
+    bands = tags.get(277, (1,))[0]
+    bits = tags.get(258, (8,))[0]
+    kind = TIFF_SAMPLE_KINDS.get(tags.get(339, (1,))[0])
+    if kind is None or bits % 8:
+        raise ValueError("Unsupported TIFF sample format.")
+    dtype = np.dtype(f'{order}{kind}{bits // 8}')
+    planar = tags.get(284, (1,))[0] == 2
+    plane_shape = (bands, height, width) if planar else (height, width, bands)
+
+    if 324 in tags:
+        if planar:
+            raise ValueError("Tiled TIFF files with separate planes are not supported.")
+        tile_width, tile_height = tags[322][0], tags[323][0]
+        raster = np.empty(plane_shape, dtype=dtype)
+        tiles_across = -(-width // tile_width)
+        for index, offset in enumerate(tags[324]):
+            top, left = divmod(index, tiles_across)
+            top, left = top * tile_height, left * tile_width
+            tile = np.frombuffer(content, dtype=dtype, count=tile_width * tile_height * bands,
+                                 offset=offset).reshape(tile_height, tile_width, bands)
+            # Edge tiles are padded to the full tile size
+            raster[top:top + tile_height, left:left + tile_width] = tile[:height - top, :width - left]
+    else:
+        offsets, byte_counts = tags[273], tags[279]
+        cells = width * height * bands
+        contiguous = all(offsets[i] + byte_counts[i] == offsets[i + 1] for i in range(len(offsets) - 1))
+        if contiguous:
+            raster = np.frombuffer(content, dtype=dtype, count=cells, offset=offsets[0])
+        else:
+            raster = np.frombuffer(b''.join(content[o:o + n] for o, n in zip(offsets, byte_counts)),
+                                   dtype=dtype, count=cells)
+        raster = raster.reshape(plane_shape)
+
+    if planar:
+        raster = raster.transpose(1, 2, 0)
+    return raster[:, :, 0] if bands == 1 else raster
+
+class NetCDFHeaderReader:
+    def __init__(self, content):
+        """
+        Reads the header of a netCDF classic (CDF-1, CDF-2 or CDF-5) file.
+
+        Parameters:
+            content (bytes): The netCDF file.
+
+        Raises:
+            ValueError: If the content is not a netCDF classic file.
+        """
+        if content[:3] != b'CDF' or content[3] not in (1, 2, 5):
+            raise ValueError("Response is not a netCDF classic file.")
+        self.content = content
+        self.position = 4
+        self.version = content[3]
+        # Sizes and counts are 64 bit in CDF-5, offsets are 64 bit in CDF-2 and CDF-5
+        self.size_code = '>Q' if self.version == 5 else '>I'
+        self.offset_code = '>I' if self.version == 1 else '>Q'
+
+    def read(self, code):
+        (value,) = struct.unpack_from(code, self.content, self.position)
+        self.position += struct.calcsize(code)
+        return value
+
+    def read_name(self):
+        length = self.read(self.size_code)
+        name = self.content[self.position:self.position + length].decode('utf-8')
+        self.position += -(-length // 4) * 4
+        return name
+
+    def read_list_header(self, expected_tag):
+        tag = self.read('>I')
+        count = self.read(self.size_code)
+        if tag not in (0, expected_tag):
+            raise ValueError("Malformed netCDF header.")
+        return count
+
+    def skip_attributes(self):
+        for _ in range(self.read_list_header(NC_ATTRIBUTE)):
+            self.read_name()
+            nc_type = self.read('>I')
+            count = self.read(self.size_code)
+            self.position += -(-count * np.dtype(NETCDF_DTYPES[nc_type]).itemsize // 4) * 4
+
+def decode_netcdf(content):
+    """
+    Decodes a netCDF classic result into a dict of arrays, one per variable. Every array, including
+        record variables, is a zero-copy strided view on the response bytes.
+
+    Parameters:
+        content (bytes): The body of the server's response.
+
+    Returns:
+        dict: Variable names mapped to numpy.ndarray values in the shape of their dimensions.
+
+    Raises:
+        ImportError: If NumPy isn't installed.
+        ValueError: If the content is not a netCDF classic file (netCDF-4 files are HDF5 based).
+
+    Example:
+        >>> decode_netcdf(response.content)['AvgLandTemp'].shape
+        (180, 360)
+    """
+    require_numpy()
+    reader = NetCDFHeaderReader(content)
+    record_count = reader.read(reader.size_code)
+    dimensions = []
+    for _ in range(reader.read_list_header(NC_DIMENSION)):
+        dimensions.append((reader.read_name(), reader.read(reader.size_code)))
+    reader.skip_attributes()
+
+    variables = []
+    for _ in range(reader.read_list_header(NC_VARIABLE)):
+        name = reader.read_name()
+        dim_ids = [reader.read(reader.size_code) for _ in range(reader.read(reader.size_code))]
+        reader.skip_attributes()
+        nc_type = reader.read('>I')
+        var_size = reader.read(reader.size_code)
+        begin = reader.read(reader.offset_code)
+        variables.append((name, dim_ids, np.dtype(NETCDF_DTYPES[nc_type]), var_size, begin))
+
+    def is_record(dim_ids):
+        # Record variables have the unlimited dimension, stored with length 0, as their first dimension
+        return bool(dim_ids) and dimensions[dim_ids[0]][1] == 0
+
+    # Record variables are interleaved: one record of every record variable after another
+    record_vars = [var for var in variables if is_record(var[1])]
+    if len(record_vars) == 1:
+        # A single record variable isn't padded
+        record_size = int(np.prod([dimensions[i][1] for i in record_vars[0][1][1:]])) * record_vars[0][2].itemsize
+    else:
+        record_size = sum(var[3] for var in record_vars)
+
+    arrays = {}
+    for name, dim_ids, dtype, var_size, begin in variables:
+        shape = tuple(record_count if is_record(dim_ids) and i == 0 else dimensions[d][1] for i, d in enumerate(dim_ids))
+        strides = [dtype.itemsize]
+        for length in reversed(shape[1:]):
+            strides.insert(0, strides[0] * length)
+        if is_record(dim_ids):
+            strides[0] = record_size
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=content, offset=begin, strides=tuple(strides) if shape else ())
+    return arrays
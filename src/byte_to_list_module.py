@@ -1,6 +1,23 @@
+import array
+import codecs
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, byte_to_array falls back to the array module
+    np = None
+
+# array module typecodes used by byte_to_array when NumPy isn't installed
+ARRAY_TYPECODES = {'float64': 'd', 'float32': 'f'}
+
+# Translation table blanking out the CSV structure so that only the numbers are left
+CSV_STRUCTURE = bytes.maketrans(b'{},"', b'    ')
+# The same for decoded text, used while streaming
+CSV_STRUCTURE_TEXT = str.maketrans('{},"', '    ')
+
 def byte_to_list(byte_str):
     """
     Converts a byte string into a list of floats. Useful for parsing numeric data returned from a server.
+        Whitespace and the CSV structure characters '{', '}', ',' and '"' separate the numbers.
 
     Parameters:
         byte_str (bytes): The byte string to be converted.
@@ -12,7 +29,7 @@ def byte_to_list(byte_str):
         >>> byte_to_list(b'1.0,2.0,3.0')
         [1.0, 2.0, 3.0]
     """
-    decoded_str = byte_str.decode('utf-8')  # decode the byte string
+    decoded_str = byte_str.translate(CSV_STRUCTURE).decode('utf-8')  # decode the byte string
     # Split the string by whitespace and remove any empty strings
     str_list = filter(None, decoded_str.split())
     # Convert the list of strings to floats
@@ -22,4 +39,183 @@ def byte_to_list(byte_str):
             num_list.append(float(num_str))
         except ValueError:
             pass  # Ignore non-numeric values
-    return num_list
\ No newline at end of file
+    return num_list
+
+def iter_numbers(chunks):
+    """
+    Streaming counterpart of byte_to_list. Decodes byte chunks as they arrive and yields the floats
+        found in them, so only the current chunk and one partial token are ever held in memory.
+        Numbers (and multi-byte characters) split across chunk boundaries are joined back together.
+        The CSV structure characters separate tokens like whitespace does, so results without any
+        whitespace, e.g. b'{1,2,3}', only ever hold back one number.
+
+    Parameters:
+        chunks (iterable of bytes): The byte chunks, e.g. from Response.iter_content().
+
+    Yields:
+        float: The numeric values in order. Non-numeric tokens are skipped, as in byte_to_list.
+
+    Example:
+        >>> list(iter_numbers([b'1.5 2', b'0.5 x 3']))
+        [1.5, 20.5, 3.0]
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    tail = ''
+    for chunk in chunks:
+        text = tail + decoder.decode(chunk).translate(CSV_STRUCTURE_TEXT)
+        tokens = text.split()
+        # A token touching the end of the chunk may continue in the next one, so hold it back
+        if tokens and not text[-1].isspace():
+            tail = tokens.pop()
+        else:
+            tail = ''
+        for num_str in tokens:
+            try:
+                yield float(num_str)
+            except ValueError:
+                pass  # Ignore non-numeric values
+    for num_str in (tail + decoder.decode(b'', final=True).translate(CSV_STRUCTURE_TEXT)).split():
+        try:
+            yield float(num_str)
+        except ValueError:
+            pass  # Ignore non-numeric values
+
+def fill_buffer(chunks, buffer):
+    """
+    Decodes byte chunks like iter_numbers, writing the values into a preallocated buffer
+        instead of building a new list.
+
+    Parameters:
+        chunks (iterable of bytes): The byte chunks to decode.
+        buffer (mutable sequence): The destination, e.g. a list, an array.array('d') or a NumPy array.
+
+    Returns:
+        int: The number of values written from the start of the buffer.
+
+    Raises:
+        ValueError: If the chunks contain more values than the buffer can hold.
+
+    Example:
+        >>> buffer = array.array('d', bytes(8 * 4))
+        >>> fill_buffer([b'1.0 2', b'.0 3.0'], buffer)
+        3
+    """
+    capacity = len(buffer)
+    count = 0
+    for value in iter_numbers(chunks):
+        if count == capacity:
+            raise ValueError("Buffer is too small for the decoded values.")
+        buffer[count] = value
+        count += 1
+    return count
+
+def byte_to_array(byte_str, dtype='float64'):
+    """
+    Converts a byte string into a contiguous array of numbers. Gives the same values as byte_to_list,
+        but parses all tokens in one vectorized NumPy call instead of one float() call per token.
+
+    Parameters:
+        byte_str (bytes): The byte string to be converted.
+        dtype (str or numpy.dtype, optional): The type of the returned values, float64 by default.
+
+    Returns:
+        numpy.ndarray: A one-dimensional array of the given dtype. Without NumPy installed,
+            an array.array of the matching typecode is returned instead.
+
+    Raises:
+        ValueError: If NumPy isn't installed and dtype is neither 'float64' nor 'float32'.
+
+    Example:
+        >>> byte_to_array(b'1.0 2.0 x 3.0')
+        array([1., 2., 3.])
+    """
+    byte_str = byte_str.translate(CSV_STRUCTURE)
+    if np is None:
+        if str(dtype) not in ARRAY_TYPECODES:
+            raise ValueError("Only float64 and float32 are supported without NumPy.")
+        return array.array(ARRAY_TYPECODES[str(dtype)], byte_to_list(byte_str))
+    # Splitting bytes only matches str.split() on ASCII input, anything else takes the exact path
+    if byte_str.isascii():
+        try:
+            # NumPy converts bytes with the same rules as float(), but without a Python-level loop
+            return np.array(byte_str.split(), dtype=np.float64).astype(dtype, copy=False)
+        except ValueError:
+            pass  # Some tokens aren't numeric, so they have to be skipped one by one
+    return np.fromiter(iter_numbers([byte_str]), dtype=np.float64).astype(dtype, copy=False)
+
+def byte_to_grid(byte_str, dtype='float64'):
+    """
+    Converts a rasdaman CSV result into an N-dimensional array of the encoded shape. Each level of
+        '{}' nesting becomes one axis, and struct (multiband) cells like "a b c" become a trailing band axis.
+        The structure is read with vectorized passes over the bytes, the values are parsed by byte_to_array.
+
+    Parameters:
+        byte_str (bytes): The CSV encoded result, e.g. b'{{1,2,3},{4,5,6}}'.
+        dtype (str or numpy.dtype, optional): The type of the returned values, float64 by default.
+
+    Returns:
+        numpy.ndarray: The values in the shape of the grid, with a band axis appended for struct cells.
+
+    Raises:
+        ImportError: If NumPy isn't installed.
+        ValueError: If braces or quotes are unbalanced, a value isn't a number or the grid is not regular:
+            every group at a depth must hold as many groups or cells as the others, and every struct
+            cell as many values.
+
+    Example:
+        >>> byte_to_grid(b'{"1 2","3 4","5 6"},{"7 8","9 10","11 12"}').shape
+        (2, 3, 2)
+    """
+    if np is None:
+        raise ImportError("NumPy is required for shape-aware decoding.")
+    buf = np.frombuffer(byte_str, dtype=np.uint8)
+    opens = buf == ord('{')
+    # Nesting depth after every byte, so an opening brace sits at the depth of the group it opens
+    depth = np.cumsum(opens.astype(np.int64) - (buf == ord('}')))
+    if depth.size and (depth[-1] != 0 or depth.min() < 0):
+        raise ValueError("Unbalanced braces in CSV result.")
+    values = byte_to_array(byte_str, dtype)
+    max_depth = int(depth.max()) if depth.size else 0
+
+    # Tokens start after whitespace or structure; a struct cell is a quoted group of tokens, other cells are single tokens
+    quote = buf == ord('"')
+    separator = np.isin(buf, np.frombuffer(b' \t\n\r\x0b\x0c{},"', dtype=np.uint8))
+    token_starts = ~separator & np.concatenate(([True], separator[:-1]))
+    quotes = int(np.count_nonzero(quote))
+    if quotes % 2:
+        raise ValueError("Unbalanced quotes in CSV result.")
+    if quotes:
+        in_quotes = (np.cumsum(quote) % 2 == 1) & ~quote
+        if np.any(token_starts & ~in_quotes):
+            raise ValueError("Values outside of struct cells in CSV result.")
+        cell_starts = np.flatnonzero(quote)[::2]
+        # The tokens of every cell, counted from the cell its position falls into
+        per_cell = np.bincount(np.searchsorted(cell_starts, np.flatnonzero(token_starts), side='right') - 1,
+                               minlength=cell_starts.size)
+        if np.unique(per_cell).size > 1:
+            raise ValueError("Struct cells don't have the same number of bands.")
+        band_axis = (int(per_cell[0]),)
+    else:
+        cell_starts = np.flatnonzero(token_starts)
+        band_axis = ()
+    if values.size != int(np.count_nonzero(token_starts)):
+        raise ValueError("CSV result holds values that aren't numbers.")
+    cells = cell_starts.size
+    if max_depth == 0:
+        return values.reshape((cells,) + band_axis)
+    if np.any(depth[cell_starts] != max_depth):
+        raise ValueError("CSV result is not a regular grid.")
+
+    # Every group of a level must have as many children as the others, checked level by level
+    shape = []
+    for level in range(1, max_depth + 2):
+        parent_opens = np.flatnonzero(opens & (depth == level - 1)) if level > 1 else np.array([0])
+        children = np.flatnonzero(opens & (depth == level)) if level <= max_depth else cell_starts
+        per_parent = np.bincount(np.searchsorted(parent_opens, children, side='right') - 1, minlength=parent_opens.size)
+        if np.unique(per_parent).size > 1:
+            raise ValueError("CSV result is not a regular grid.")
+        shape.append(int(per_parent[0]))
+    # A single group wrapping everything is just the outer brace pair, not an axis of length 1
+    if shape[0] == 1:
+        shape = shape[1:]
+    return values.reshape(tuple(shape) + band_axis)
@@ -0,0 +1,96 @@
+from query_fingerprint_module import fingerprint_query
+from query_optimizer_module import optimize_query
+from query_result_module import QueryResult
+
+class CompiledQuery:
+    __slots__ = ('dbc', 'query', 'settings', 'decoder', 'optimize', 'text')
+
+    def __init__(self, dbc, query, settings, decoder, optimize=False):
+        """
+        A configured query that is rendered once and can be executed any number of times, created by
+            Datacube.compile(). Unlike Datacube.execute() nothing is reset, and since the query tree,
+            its text and the settings never change, one instance can be executed from several threads
+            at once. Variants with another subset share the unchanged parts of the tree.
+
+        Parameters:
+            dbc (DatabaseConnection): The connection the query is sent over.
+            query (Query): The query tree, see Datacube.build_query().
+            settings (dict): The decoding settings, see Datacube.result_settings().
+            decoder (callable): Decodes a response body, see Datacube.decode_response().
+            optimize (bool, optional): Whether the text is rendered from the optimized tree, see
+                query_optimizer_module.optimize_query(). Variants are optimized again from their own tree.
+        """
+        self.dbc = dbc
+        self.query = query
+        self.settings = settings
+        self.decoder = decoder
+        self.optimize = optimize
+        self.text = (optimize_query(query)[0] if optimize else query).render()
+
+    def __setattr__(self, name, value):
+        # Attributes are only set once, by __init__
+        if hasattr(self, name):
+            raise AttributeError("Compiled queries are immutable.")
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return f"CompiledQuery({self.text!r})"
+
+    def with_subset(self, subset, var_name=None):
+        """
+        Derives a compiled query with the subset of one variable replaced, without rebuilding or
+            re-validating the rest of the query.
+
+        Parameters:
+            subset (str): The new subset, e.g. 'Lat(30:60)'.
+            var_name (str, optional): The variable, e.g. '$c'. May be left out if the query has one variable.
+
+        Returns:
+            CompiledQuery: The variant; this instance is unchanged.
+
+        Raises:
+            TypeError: If subset or var_name is not a string.
+            ValueError: If the variable is not part of the query, or var_name is left out for several variables.
+
+        Example:
+            >>> monthly = datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80), ansi("2014-01")', '$c').compile()
+            >>> [monthly.with_subset(f'Lat(53.08), Long(8.80), ansi("2014-{month:02}")').execute() for month in range(1, 13)]
+        """
+        if not isinstance(subset, str):
+            raise TypeError("Subset must be a string.")
+        if var_name is None:
+            if len(self.query.subsets) != 1:
+                raise ValueError("Variable name must be given for queries with several variables.")
+            var_name = self.query.subsets[0][0]
+        elif not isinstance(var_name, str):
+            raise TypeError("Variable name must be a string.")
+        return CompiledQuery(self.dbc, self.query.with_subset(var_name, subset), self.settings, self.decoder, self.optimize)
+
+    def fingerprint(self):
+        """
+        Computes the canonical fingerprint of the query text, see fingerprint_query().
+        """
+        return fingerprint_query(self.text)
+
+    def execute(self, return_type=None):
+        """
+        Sends the query and decodes the result like Datacube.execute(). The query cache and the
+            coalescing of the dbc apply; the coverage cache is not consulted.
+
+        Parameters:
+            return_type (str, optional): How numeric results are returned, see Datacube.decode_response().
+
+        Returns:
+            The decoded result, see Datacube.decode_response().
+        """
+        response = self.dbc.send_query(self.text)
+        return self.decoder(response.content, return_type=return_type, **self.settings)
+
+    def execute_lazy(self):
+        """
+        Sends the query and returns the undecoded result, see Datacube.execute_lazy().
+
+        Returns:
+            QueryResult: The result.
+        """
+        return QueryResult(self.dbc.send_query(self.text).content, self.settings, self.decoder)
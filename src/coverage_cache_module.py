@@ -0,0 +1,243 @@
+import threading
+from collections import OrderedDict
+from subset_module import parse_subset
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, without it nothing is cached
+    np = None
+
+# How far a bound may be from a cell edge and still count as lying on it, in cells
+EDGE_TOLERANCE = 1e-6
+
+class CoverageEntry:
+    __slots__ = ('coverage', 'dims', 'fixed', 'resolutions', 'directions', 'grid')
+
+    def __init__(self, coverage, dims, fixed, resolutions, directions, grid):
+        """
+        A grid fetched from a coverage, with the extents it covers.
+
+        Parameters:
+            coverage (str): The name of the coverage.
+            dims (list of AxisSubset): The trimmed axes, in the order of the grid's dimensions.
+            fixed (dict): The names of the sliced axes mapped to their AxisSubset.
+            resolutions (list of float): The cell size along every numeric trimmed axis, None for other axes.
+            directions (list of int): 1 if the cells of a trimmed axis are stored from low to high
+                coordinates, -1 if from high to low, None for axes with text bounds.
+            grid (numpy.ndarray): The read-only grid.
+        """
+        self.coverage = coverage
+        self.dims = dims
+        self.fixed = fixed
+        self.resolutions = resolutions
+        self.directions = directions
+        self.grid = grid
+
+    def region(self, axes):
+        """
+        Maps the axis subsets of a request onto indices of the grid.
+
+        Parameters:
+            axes (list of AxisSubset): The parsed subset of the request.
+
+        Returns:
+            tuple or None: An index into the grid selecting the request, or None if the grid doesn't
+                contain it exactly, e.g. when a bound falls inside a cell.
+        """
+        requested = {axis.axis: axis for axis in axes}
+        if len(requested) != len(axes) or set(requested) != {axis.axis for axis in self.dims} | set(self.fixed):
+            return None
+        for name, fixed in self.fixed.items():
+            if requested[name].is_slice is False or requested[name].low != fixed.low:
+                return None
+        index = []
+        for axis, resolution, direction in zip(self.dims, self.resolutions, self.directions):
+            request = requested[axis.axis]
+            if resolution is None:
+                # Axes with text bounds, like dates, are only reused as a whole
+                if (request.low, request.high, request.trim) != (axis.low, axis.high, axis.trim):
+                    return None
+                index.append(slice(None))
+                continue
+            if not request.is_numeric():
+                return None
+            cells = self.grid.shape[len(index)]
+            # Cells are counted from the first one stored, which is the highest coordinate on descending axes
+            bounds = [request.low] if request.is_slice else [request.low, request.high]
+            offsets = sorted((bound - axis.low) / resolution if direction > 0 else (axis.high - bound) / resolution
+                             for bound in bounds)
+            if request.is_slice:
+                # A point on a cell edge could belong to either cell, so the server is asked instead
+                if not 0 <= offsets[0] < cells or abs(offsets[0] - round(offsets[0])) < EDGE_TOLERANCE:
+                    return None
+                index.append(int(offsets[0]))
+                continue
+            low, high = offsets
+            if abs(low - round(low)) > EDGE_TOLERANCE or abs(high - round(high)) > EDGE_TOLERANCE:
+                return None
+            low, high = round(low), round(high)
+            if not 0 <= low < high <= cells:
+                return None
+            index.append(slice(low, high))
+        return tuple(index)
+
+class CoverageCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, resolutions=None, axis_orders=None, directions=None):
+        """
+        Initializes a cache of fetched grids indexed by coverage name and axis extents. A request whose
+            subset lies within a cached grid is answered by slicing that grid locally, and simple
+            aggregations over it are computed locally as well.
+
+            Mapping coordinates onto cells needs the grid metadata of the coverage: the order of its axes
+            in results, and the cell size and storage direction of every numeric axis (latitudes are often
+            stored north first). It is taken from the CoverageDescription given to store(), see
+            coverage_catalog_module, and can be given or overridden per coverage here. Grids whose metadata
+            is unknown, or whose trims don't start and end on cell edges, aren't cached.
+
+        Parameters:
+            max_bytes (int, optional): The maximum total size of the cached grids.
+            resolutions (dict, optional): Coverage names mapped to dicts of axis names and cell sizes,
+                e.g. {'AvgLandTemp': {'Lat': 1.0, 'Long': 1.0}}.
+            axis_orders (dict, optional): Coverage names mapped to the order of their axes in results, e.g.
+                {'AvgLandTemp': ['ansi', 'Lat', 'Long']}.
+            directions (dict, optional): Coverage names mapped to dicts of axis names and storage directions,
+                1 for cells from low to high coordinates and -1 from high to low, e.g. {'AvgLandTemp': {'Lat': -1, 'Long': 1}}.
+
+        Raises:
+            TypeError: If max_bytes is not an integer, or resolutions, axis_orders or directions is not a dict.
+            ValueError: If max_bytes is negative.
+
+        Example:
+            >>> cache = CoverageCache()
+            >>> dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows", coverage_cache=cache)
+        """
+        if not isinstance(max_bytes, int) or isinstance(max_bytes, bool):
+            raise TypeError("Cache size must be an integer.")
+        if max_bytes < 0:
+            raise ValueError("Cache size can't be negative.")
+        if resolutions is not None and not isinstance(resolutions, dict):
+            raise TypeError("Resolutions must be a dict.")
+        if axis_orders is not None and not isinstance(axis_orders, dict):
+            raise TypeError("Axis orders must be a dict.")
+        if directions is not None and not isinstance(directions, dict):
+            raise TypeError("Directions must be a dict.")
+        self.max_bytes = max_bytes
+        self.resolutions = dict(resolutions or {})
+        self.axis_orders = dict(axis_orders or {})
+        self.directions = dict(directions or {})
+        self.entries = OrderedDict()  # (coverage, subset) -> CoverageEntry, least recently used first
+        self.current_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def axis_metadata(self, coverage, name, description=None):
+        """
+        Looks up the cell size and storage direction of an axis, preferring the values given to the cache
+            over those of the description.
+
+        Returns:
+            tuple: The resolution and the direction, each None if unknown.
+        """
+        axis = description.axis_index.get(name) if description is not None else None
+        resolution = self.resolutions.get(coverage, {}).get(name, axis.resolution if axis is not None else None)
+        direction = self.directions.get(coverage, {}).get(name, axis.direction if axis is not None else None)
+        return resolution, direction
+
+    def store(self, coverage, subset, grid, description=None):
+        """
+        Adds a fetched grid to the cache.
+
+        Parameters:
+            coverage (str): The name of the coverage.
+            subset (str): The subset the grid was fetched with.
+            grid (numpy.ndarray): The grid in the shape of the result, see byte_to_grid().
+            description (CoverageDescription, optional): The metadata of the coverage, see
+                CoverageCatalog.describe().
+
+        Returns:
+            bool: True if the grid was cached, False if its extents can't be mapped onto cells (open bounds,
+                unknown axis order, resolution or direction, a shape that doesn't match the subset) or it is too large.
+        """
+        if np is None:
+            return False
+        axes = parse_subset(subset)
+        fixed = {axis.axis: axis for axis in axes if axis.is_slice}
+        trimmed = {axis.axis: axis for axis in axes if not axis.is_slice}
+        order = self.axis_orders.get(coverage, description.grid_order if description is not None else None)
+        if order is not None:
+            dims = [trimmed[name] for name in order if name in trimmed]
+            if len(dims) != len(trimmed):
+                return False
+        elif len(trimmed) == 1:
+            dims = list(trimmed.values())
+        else:
+            return False
+        grid = np.array(grid)  # A private copy, so callers can't change cached values
+        if grid.ndim < len(dims) or len(fixed) + len(trimmed) != len(axes):
+            return False
+        resolutions = []
+        directions = []
+        for position, axis in enumerate(dims):
+            if isinstance(axis.low, str) and isinstance(axis.high, str):
+                resolutions.append(None)
+                directions.append(None)
+                continue
+            if not axis.is_numeric() or axis.high <= axis.low or grid.shape[position] == 0:
+                return False
+            resolution, direction = self.axis_metadata(coverage, axis.axis, description)
+            if resolution is None or direction not in [1, -1]:
+                return False
+            if abs((axis.high - axis.low) / resolution - grid.shape[position]) > EDGE_TOLERANCE:
+                return False
+            resolutions.append((axis.high - axis.low) / grid.shape[position])
+            directions.append(direction)
+        if grid.nbytes > self.max_bytes:
+            return False
+        grid.setflags(write=False)
+        with self._lock:
+            key = (coverage, subset)
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key).grid.nbytes
+            self.entries[key] = CoverageEntry(coverage, dims, fixed, resolutions, directions, grid)
+            self.current_bytes += grid.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.grid.nbytes
+                self.stats['evictions'] += 1
+        return True
+
+    def lookup(self, coverage, subset):
+        """
+        Answers a request from a cached grid that contains it.
+
+        Parameters:
+            coverage (str): The name of the coverage.
+            subset (str): The subset of the request.
+
+        Returns:
+            numpy.ndarray or None: A read-only view of the requested cells in the shape the server would
+                return them, or None if no cached grid contains the request.
+        """
+        try:
+            axes = parse_subset(subset)
+        except ValueError:
+            return None
+        with self._lock:
+            for key, entry in reversed(self.entries.items()):
+                if entry.coverage != coverage:
+                    continue
+                index = entry.region(axes)
+                if index is not None:
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry.grid[index]
+            self.stats['misses'] += 1
+            return None
+
+    def clear(self):
+        """
+        Removes every cached grid. The counters are kept.
+        """
+        with self._lock:
+            self.entries.clear()
+            self.current_bytes = 0
@@ -0,0 +1,576 @@
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from subset_module import parse_subset, parse_time
+
+# Coordinates in WCS documents are separated by spaces; time coordinates are quoted
+COORDINATE_PATTERN = re.compile(r'"[^"]*"|\S+')
+# Fractions of a second, which the time formats of subset_module don't have
+SECOND_FRACTION_PATTERN = re.compile(r'\.\d+(?=Z?$)')
+
+# Sizes in bytes of the OGC data types of coverage bands
+DATA_TYPE_BYTES = {'unsignedByte': 1, 'signedByte': 1, 'char': 1, 'boolean': 1, 'unsignedShort': 2, 'signedShort': 2,
+                   'unsignedInt': 4, 'signedInt': 4, 'unsignedLong': 8, 'signedLong': 8, 'float32': 4, 'float64': 8,
+                   'cint16': 4, 'cint32': 8, 'cfloat32': 8, 'cfloat64': 16}
+
+# How far a bound may lie outside the extent of an axis and still count as inside, in cells
+EDGE_TOLERANCE = 1e-6
+
+def local_name(element):
+    """
+    Returns the tag of an XML element without its namespace, e.g. 'Envelope' for gml:Envelope.
+    """
+    return element.tag.rsplit('}', 1)[-1]
+
+def find(element, name):
+    """
+    Returns the first descendant of an element with a local name, or None.
+    """
+    return next((child for child in element.iter() if local_name(child) == name), None)
+
+def coordinate(text):
+    """
+    Reads one coordinate: a float, or the string of a quoted (time) coordinate.
+    """
+    if text.startswith('"'):
+        return text.strip('"')
+    return float(text)
+
+def time_value(text):
+    """
+    Parses a time coordinate, also with fractions of a second as servers write them.
+    """
+    return parse_time(SECOND_FRACTION_PATTERN.sub('', text.strip('"')))[0]
+
+class AxisDescription:
+    __slots__ = ('name', 'low', 'high', 'size', 'resolution', 'uom', 'coefficients', 'direction')
+
+    def __init__(self, name, low, high, size, resolution=None, uom=None, coefficients=None, direction=None):
+        """
+        Describes one axis of a coverage.
+
+        Parameters:
+            name (str): The axis label used in subsets, e.g. 'Lat'.
+            low (float or str): The lower bound of the extent; strings for time axes.
+            high (float or str): The upper bound of the extent.
+            size (int): The number of grid cells along the axis.
+            resolution (float, optional): The cell size of a regular numeric axis.
+            uom (str, optional): The unit of measure, e.g. 'degree'.
+            coefficients (list, optional): The coordinates of the cells of an irregular axis.
+            direction (int, optional): The order the cells are stored in, from the sign of the offset vector:
+                1 from low to high coordinates, -1 from high to low (e.g. north-first latitudes), None if unknown.
+        """
+        self.name = name
+        self.low = low
+        self.high = high
+        self.size = size
+        self.resolution = resolution
+        self.uom = uom
+        self.coefficients = coefficients
+        self.direction = direction
+
+    def __repr__(self):
+        return f"AxisDescription({self.name!r}, {self.low!r}, {self.high!r}, {self.size!r})"
+
+    def is_numeric(self):
+        return isinstance(self.low, float) and isinstance(self.high, float)
+
+    def cells(self, axis_subset):
+        """
+        Counts the cells of the axis a subset selects: 1 for a slice, the cells a trim overlaps otherwise.
+            Time trims are counted on the coefficients of irregular axes and estimated from the share of the
+            extent on regular ones.
+
+        Parameters:
+            axis_subset (AxisSubset): The subset of this axis.
+
+        Returns:
+            int: The number of cells.
+
+        Raises:
+            ValueError: If the subset lies outside of the extent or can't be compared with it.
+        """
+        bounds = [axis_subset.low] if axis_subset.is_slice else [axis_subset.low, axis_subset.high]
+        numeric = self.is_numeric()
+        if any(bound is not None and not isinstance(bound, float if numeric else str) for bound in bounds):
+            raise ValueError(f"Axis {self.name} takes {'numeric' if numeric else 'time'} coordinates.")
+        convert = float if numeric else time_value
+        try:
+            low, high = convert(self.low), convert(self.high)
+            values = [convert(bound) if bound is not None else None for bound in bounds]
+        except ValueError:
+            raise ValueError(f"Subset of axis {self.name} can't be compared with its extent.")
+        # The tolerance is a share of a cell, so float noise in bounds read from XML doesn't count as outside
+        slack = (self.resolution or 0) * EDGE_TOLERANCE
+        for value in values:
+            if value is not None and (value < low or value > high) and not (numeric and low - slack <= value <= high + slack):
+                raise ValueError(f"Subset of axis {self.name} is outside of its extent {self.low}:{self.high}.")
+        if axis_subset.is_slice:
+            return 1
+        start = values[0] if values[0] is not None else low
+        end = values[1] if values[1] is not None else high
+        if end < start:
+            raise ValueError(f"Subset of axis {self.name} ends before it starts.")
+        if self.coefficients:
+            points = [time_value(point) if isinstance(point, str) else point for point in self.coefficients]
+            return sum(1 for point in points if start <= point <= end)
+        if self.is_numeric() and self.resolution:
+            first = math.floor((start - low) / self.resolution + EDGE_TOLERANCE)
+            last = math.ceil((end - low) / self.resolution - EDGE_TOLERANCE)
+            return max(1, min(last, self.size) - max(first, 0))
+        share = (end - start) / (high - low) if high != low else 1
+        return max(1, min(self.size, math.ceil(share * self.size)))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class CoverageDescription:
+    __slots__ = ('coverage_id', 'crs', 'axes', 'bands', 'subtype', 'axis_index', 'grid_order')
+
+    def __init__(self, coverage_id, crs, axes, bands, subtype=None, grid_order=None):
+        """
+        The metadata of a coverage: its CRS, axes and bands, as parsed from a DescribeCoverage response.
+
+        Parameters:
+            coverage_id (str): The name of the coverage.
+            crs (str): The CRS of the coverage, usually a URL.
+            axes (list of AxisDescription): The axes, in the order of the CRS.
+            bands (list of tuple): Pairs of band names and OGC data types (None if not given).
+            subtype (str, optional): The coverage type, e.g. 'RectifiedGridCoverage'.
+            grid_order (list of str, optional): The axis labels in the order the grid stores them, which is
+                the order of the dimensions of results. Defaults to the order of the axes.
+        """
+        self.coverage_id = coverage_id
+        self.crs = crs
+        self.axes = tuple(axes)
+        self.bands = tuple((name, data_type) for name, data_type in bands)
+        self.subtype = subtype
+        self.axis_index = {axis.name: axis for axis in self.axes}
+        self.grid_order = tuple(grid_order) if grid_order is not None else tuple(axis.name for axis in self.axes)
+
+    def __repr__(self):
+        return f"CoverageDescription({self.coverage_id!r}, axes={[axis.name for axis in self.axes]})"
+
+    def axis(self, name):
+        """
+        Returns the description of an axis.
+
+        Raises:
+            ValueError: If the coverage has no such axis.
+        """
+        axis = self.axis_index.get(name)
+        if axis is None:
+            raise ValueError(f"Coverage {self.coverage_id} has no axis {name}.")
+        return axis
+
+    def bounds(self, name):
+        """
+        Returns the extent of an axis as a (low, high) tuple.
+        """
+        axis = self.axis(name)
+        return axis.low, axis.high
+
+    @property
+    def grid_shape(self):
+        """
+        The number of cells along every axis, in the order of the axes.
+        """
+        return tuple(axis.size for axis in self.axes)
+
+    @property
+    def cell_bytes(self):
+        """
+        The size of one cell over all bands in bytes, or None if a band's data type is unknown.
+        """
+        sizes = [DATA_TYPE_BYTES.get(data_type) for _, data_type in self.bands]
+        return sum(sizes) if sizes and None not in sizes else None
+
+    def subset_shape(self, subset=None):
+        """
+        Computes the shape of the grid a subset selects: sliced axes are left out, trimmed axes have the
+            cells of the trim and axes the subset doesn't name keep their whole size.
+
+        Parameters:
+            subset (str, optional): A subset such as 'Lat(0:10), ansi("2014-01")'. None selects everything.
+
+        Returns:
+            tuple of int: The cells along every remaining axis, in the order of the axes.
+
+        Raises:
+            ValueError: If the subset can't be parsed, names an axis twice or an unknown axis, or lies
+                outside of the coverage.
+
+        Example:
+            >>> description.subset_shape('Lat(0:10), Long(0:20), ansi("2014-01")')
+            (100, 200)
+        """
+        axes = parse_subset(subset) if subset is not None else []
+        requested = {}
+        for axis_subset in axes:
+            if axis_subset.axis in requested:
+                raise ValueError(f"Axis {axis_subset.axis} is subset twice.")
+            self.axis(axis_subset.axis)
+            requested[axis_subset.axis] = axis_subset
+        shape = []
+        for axis in self.axes:
+            axis_subset = requested.get(axis.name)
+            if axis_subset is None:
+                shape.append(axis.size)
+            elif not axis_subset.is_slice:
+                shape.append(axis.cells(axis_subset))
+            else:
+                axis.cells(axis_subset)
+        return tuple(shape)
+
+    def validate_subset(self, subset):
+        """
+        Checks a subset against the axes and extents of the coverage.
+
+        Raises:
+            ValueError: If the subset doesn't fit the coverage, see subset_shape().
+        """
+        self.subset_shape(subset)
+        return True
+
+    def to_dict(self):
+        return {'coverage_id': self.coverage_id, 'crs': self.crs, 'axes': [axis.to_dict() for axis in self.axes],
+                'bands': [list(band) for band in self.bands], 'subtype': self.subtype, 'grid_order': list(self.grid_order)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['coverage_id'], data['crs'], [AxisDescription(**axis) for axis in data['axes']],
+                   data['bands'], data['subtype'], data.get('grid_order'))
+
+def exception_text(xml):
+    """
+    Returns the message of an OWS exception report, or None if the document is no exception report.
+    """
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError:
+        return None
+    if local_name(root) != 'ExceptionReport':
+        return None
+    exception = find(root, 'ExceptionText')
+    return exception.text.strip() if exception is not None and exception.text else 'unknown'
+
+def offset_directions(element, labels):
+    """
+    Reads the offset vectors of a grid: every vector steps along one CRS axis, its sign is the direction
+        the cells of that axis are stored in, and the order of the vectors is the order of the grid axes.
+
+    Returns:
+        tuple: Axis labels mapped to 1 or -1, and the list of labels in grid order (empty without vectors).
+    """
+    directions, order = {}, []
+    for vector in element.iter():
+        if local_name(vector) != 'offsetVector':
+            continue
+        components = [float(text) for text in (vector.text or '').split()]
+        steps = [position for position, component in enumerate(components) if component != 0]
+        if len(components) != len(labels) or len(steps) != 1:
+            # Rotated or malformed grids have no single direction per axis
+            return {}, []
+        label = labels[steps[0]]
+        directions[label] = 1 if components[steps[0]] > 0 else -1
+        order.append(label)
+    return directions, order
+
+def parse_coverage_descriptions(xml):
+    """
+    Parses a WCS 2.0 DescribeCoverage response.
+
+    Parameters:
+        xml (bytes or str): The response body.
+
+    Returns:
+        dict: Coverage names mapped to their CoverageDescription.
+
+    Raises:
+        ValueError: If the document is not a coverage description, e.g. an exception report.
+    """
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError:
+        raise ValueError("Coverage description can't be parsed.")
+    if local_name(root) == 'ExceptionReport':
+        raise ValueError(f"Server reported an error: {exception_text(xml)}")
+    descriptions = {}
+    for element in root.iter():
+        if local_name(element) != 'CoverageDescription':
+            continue
+        coverage_id = find(element, 'CoverageId')
+        envelope = find(element, 'Envelope')
+        if coverage_id is None or envelope is None:
+            raise ValueError("Coverage description can't be parsed.")
+        labels = envelope.get('axisLabels', '').split()
+        uoms = envelope.get('uomLabels', '').split() or [None] * len(labels)
+        lows = [coordinate(text) for text in COORDINATE_PATTERN.findall(find(envelope, 'lowerCorner').text or '')]
+        highs = [coordinate(text) for text in COORDINATE_PATTERN.findall(find(envelope, 'upperCorner').text or '')]
+        # The grid may list its axes in another order than the envelope
+        domain, grid = find(element, 'domainSet'), find(element, 'GridEnvelope')
+        if domain is None or grid is None:
+            raise ValueError("Coverage description can't be parsed.")
+        grid_labels = find(domain, 'axisLabels')
+        grid_labels = grid_labels.text.split() if grid_labels is not None else labels
+        sizes = {label: int(high) - int(low) + 1
+                 for label, low, high in zip(grid_labels, find(grid, 'low').text.split(), find(grid, 'high').text.split())}
+        # Irregular axes list the coordinates of their cells
+        coefficients = {}
+        for grid_axis in element.iter():
+            if local_name(grid_axis) != 'GeneralGridAxis':
+                continue
+            spanned, values = find(grid_axis, 'gridAxesSpanned'), find(grid_axis, 'coefficients')
+            if spanned is not None and values is not None and (values.text or '').strip():
+                coefficients[spanned.text.strip()] = [coordinate(text) for text in COORDINATE_PATTERN.findall(values.text)]
+        if len(lows) != len(labels) or len(highs) != len(labels) or set(sizes) != set(labels):
+            raise ValueError("Coverage description can't be parsed.")
+        directions, order = offset_directions(domain, labels)
+        if set(order) != set(labels) or len(order) != len(labels):
+            directions, order = {}, None
+        axes = []
+        for label, uom, low, high in zip(labels, uoms, lows, highs):
+            numeric = isinstance(low, float) and isinstance(high, float)
+            resolution = (high - low) / sizes[label] if numeric and label not in coefficients else None
+            axes.append(AxisDescription(label, low, high, sizes[label], resolution, uom, coefficients.get(label),
+                                        directions.get(label)))
+        bands = []
+        for field in element.iter():
+            if local_name(field) == 'field':
+                quantity = next(iter(field), None)
+                definition = quantity.get('definition', '') if quantity is not None else ''
+                bands.append((field.get('name'), definition.rsplit('/', 1)[-1] or None))
+        subtype = find(element, 'CoverageSubtype')
+        description = CoverageDescription(coverage_id.text.strip(), envelope.get('srsName'), axes, bands,
+                                          subtype.text.strip() if subtype is not None else None, order or grid_labels)
+        descriptions[description.coverage_id] = description
+    if not descriptions:
+        raise ValueError("Coverage description can't be parsed.")
+    return descriptions
+
+def parse_capabilities(xml):
+    """
+    Parses a WCS 2.0 GetCapabilities response.
+
+    Returns:
+        list of str: The names of the offered coverages.
+
+    Raises:
+        ValueError: If the document is not a capabilities document.
+    """
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError:
+        raise ValueError("Capabilities can't be parsed.")
+    if local_name(root) != 'Capabilities':
+        raise ValueError("Capabilities can't be parsed.")
+    return [element.text.strip() for summary in root.iter() if local_name(summary) == 'CoverageSummary'
+            for element in summary if local_name(element) == 'CoverageId']
+
+class CoverageCatalog:
+    def __init__(self, dbc, directory=None, ttl=24 * 3600, capabilities_ttl=3600, clock=time.time):
+        """
+        Initializes a catalog of coverage metadata fetched with WCS DescribeCoverage and GetCapabilities
+            requests over the session of a dbc. Every document is fetched once and kept in memory and,
+            if a directory is given, on disk until its TTL runs out, so axes, extents and grid sizes can
+            be looked up without asking the server again.
+
+        Parameters:
+            dbc (DatabaseConnection): The connection whose endpoint and session are used.
+            directory (str, optional): A directory for the on-disk tier. If None, only memory is used.
+            ttl (float, optional): Seconds a coverage description stays valid. None keeps it forever.
+            capabilities_ttl (float, optional): Seconds the list of coverages stays valid. None keeps it forever.
+            clock (callable, optional): Returns the current time in seconds; wall-clock time by default.
+
+        Raises:
+            TypeError: If directory is given but not a string.
+
+        Example:
+            >>> catalog = CoverageCatalog(dbc, directory='.wcps_catalog')
+            >>> catalog.describe('AvgLandTemp').subset_shape('Lat(0:10), Long(0:20), ansi("2014-01")')
+            (100, 200)
+        """
+        if directory is not None and not isinstance(directory, str):
+            raise TypeError("Directory must be a string.")
+        self.dbc = dbc
+        self.directory = directory
+        self.ttl = ttl
+        self.capabilities_ttl = capabilities_ttl
+        self.clock = clock
+        self.entries = {}  # key -> (value, expires_at); descriptions are kept parsed, so lookups don't convert
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'expirations': 0, 'requests_sent': 0}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def describe(self, coverage_id):
+        """
+        Returns the description of a coverage, fetching it if it isn't cached.
+
+        Returns:
+            CoverageDescription: The metadata of the coverage.
+
+        Raises:
+            ValueError: If the server doesn't describe the coverage.
+        """
+        return self.prefetch([coverage_id])[coverage_id]
+
+    def prefetch(self, coverage_ids):
+        """
+        Makes sure several coverages are described, fetching all missing ones in a single request.
+
+        Returns:
+            dict: Coverage names mapped to their CoverageDescription.
+        """
+        found = {}
+        missing = []
+        for coverage_id in coverage_ids:
+            description = self._get(('describe', coverage_id), CoverageDescription.from_dict)
+            if description is None:
+                missing.append(coverage_id)
+            else:
+                found[coverage_id] = description
+        if missing:
+            fetched = parse_coverage_descriptions(self.fetch({'request': 'DescribeCoverage', 'coverageId': ','.join(missing)}))
+            for coverage_id in missing:
+                if coverage_id not in fetched:
+                    raise ValueError(f"Coverage {coverage_id} wasn't described by the server.")
+                self._put(('describe', coverage_id), fetched[coverage_id], self.ttl, CoverageDescription.to_dict)
+                found[coverage_id] = fetched[coverage_id]
+        return found
+
+    def coverage_ids(self):
+        """
+        Returns the names of the coverages the server offers, from its capabilities.
+        """
+        ids = self._get(('capabilities',))
+        if ids is None:
+            ids = parse_capabilities(self.fetch({'request': 'GetCapabilities'}))
+            self._put(('capabilities',), ids, self.capabilities_ttl)
+        return list(ids)
+
+    def axis_bounds(self, coverage_id, axis):
+        """
+        Returns the extent of an axis of a coverage as a (low, high) tuple.
+        """
+        return self.describe(coverage_id).bounds(axis)
+
+    def grid_shape(self, coverage_id, subset=None):
+        """
+        Returns the number of cells along the axes of a coverage, or of the part a subset selects,
+            see CoverageDescription.subset_shape().
+        """
+        return self.describe(coverage_id).subset_shape(subset)
+
+    def validate_subset(self, coverage_id, subset):
+        """
+        Checks a subset against the axes and extents of a coverage.
+
+        Raises:
+            ValueError: If the subset doesn't fit the coverage.
+        """
+        return self.describe(coverage_id).validate_subset(subset)
+
+    def fetch(self, params):
+        """
+        Sends a WCS request to the endpoint of the dbc.
+
+        Parameters:
+            params (dict): The request parameters besides service and version.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            ValueError: If the server doesn't answer with status 200, with the message of its exception
+                report if the body is one and the status code otherwise.
+        """
+        with self._lock:
+            self.stats['requests_sent'] += 1
+        query = {'service': 'WCS', 'version': '2.0.1'}
+        query.update(params)
+        response = self.dbc.get_session().get(self.dbc.server_url, params=query, verify=False)
+        if response.status_code != 200:
+            message = exception_text(response.content)
+            if message is not None:
+                raise ValueError(f"Server reported an error: {message} (status {response.status_code})")
+            raise ValueError(f"Request failed with status {response.status_code}.")
+        return response.content
+
+    def clear(self):
+        """
+        Removes every entry from memory and disk. The counters are kept.
+        """
+        with self._lock:
+            self.entries.clear()
+        if self.directory is not None:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except FileNotFoundError:
+                        pass
+
+    def _key(self, parts):
+        return hashlib.sha256('\0'.join((self.dbc.server_url,) + parts).encode('utf-8')).hexdigest()
+
+    def _get(self, parts, decode=None):
+        key = self._key(parts)
+        now = self.clock()
+        with self._lock:
+            if key in self.entries:
+                value, expires_at = self.entries[key]
+                if expires_at is None or expires_at > now:
+                    self.stats['hits'] += 1
+                    return value
+                del self.entries[key]
+                self.stats['expirations'] += 1
+        # The file is read and decoded without holding the lock
+        entry = self._read_disk(key, now)
+        if entry is not None and decode is not None:
+            entry = (decode(entry[0]), entry[1])
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self.entries[key] = entry
+            return entry[0]
+
+    def _put(self, parts, value, ttl, encode=None):
+        key = self._key(parts)
+        expires_at = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            self.entries[key] = (value, expires_at)
+        if self.directory is not None:
+            self._write_disk(key, encode(value) if encode is not None else value, expires_at)
+
+    def _read_disk(self, key, now):
+        # Called without the lock; only the counters are changed under it
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key + '.json')
+        try:
+            with open(path, encoding='utf-8') as entry_file:
+                entry = json.load(entry_file)
+            if entry['expires_at'] is not None and entry['expires_at'] <= now:
+                with self._lock:
+                    self.stats['expirations'] += 1
+                os.remove(path)
+                return None
+            return entry['value'], entry['expires_at']
+        except (OSError, ValueError, KeyError):
+            return None  # Missing or damaged entries count as misses
+
+    def _write_disk(self, key, value, expires_at):
+        # Called without the lock; written to a temporary file and renamed, so readers never see a partial entry
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'w', encoding='utf-8') as temp_file:
+            json.dump({'expires_at': expires_at, 'value': value}, temp_file)
+        os.replace(temp_path, os.path.join(self.directory, key + '.json'))
@@ -1,35 +1,242 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from query_cache_module import QueryCache, CachedResponse
+from query_fingerprint_module import fingerprint_query
+from coverage_cache_module import CoverageCache
+from coverage_catalog_module import CoverageCatalog
+
+class InFlightQuery:
+    def __init__(self):
+        """
+        Holds the outcome of a query that is being sent, so concurrent callers of the same query can wait for it.
+        """
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def wait(self):
+        """
+        Blocks until the query has finished, then returns its response or raises its exception.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
 
 class DatabaseConnection:
     # initalizing our dbc by providing it with the service endpoint, from which we can get a datacube
-    def __init__(self, url):
+    def __init__(self, url, pool_size=10, cache=None, coalesce=True, coverage_cache=None):
         """
         Initializes a new dbc instance which is used to manage connections and send queries to a WCPS server.
+            Connections are kept alive and pooled, so every Datacube sharing this dbc reuses the same sockets.
+
+        Parameters:
+            url (str): The endpoint of the WCPS server.
+            pool_size (int, optional): The maximum number of keep-alive connections kept open per host.
+            cache (QueryCache, optional): A cache of raw results consulted before a query is sent.
+            coalesce (bool, optional): If True, concurrent calls with identical queries share one request to the
+                server and all receive its response or exception. With a cache, equivalent queries (same
+                fingerprint_query()) are shared as well, since they are fingerprinted for the cache anyway.
+            coverage_cache (CoverageCache, optional): A cache of fetched grids, from which Datacube instances
+                answer requests for parts of grids fetched before without a query.
+
+        Raises:
+            TypeError: If url is not a string, pool_size is not an integer, cache is not a QueryCache
+                or coverage_cache is not a CoverageCache.
+            ValueError: If pool_size is smaller than 1.
 
             >>> database_connection = dbc("https://ows.rasdaman.org/rasdaman/ows")
         """
         if not isinstance(url, str):
             raise TypeError("Value entered must be a string.")
+        if not isinstance(pool_size, int) or isinstance(pool_size, bool):
+            raise TypeError("Pool size must be an integer.")
+        if pool_size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        if cache is not None and not isinstance(cache, QueryCache):
+            raise TypeError("Cache must be a QueryCache instance.")
+        if coverage_cache is not None and not isinstance(coverage_cache, CoverageCache):
+            raise TypeError("Coverage cache must be a CoverageCache instance.")
         self.server_url = url
-    
-    def send_query(self, wcps_query):
+        self.pool_size = pool_size
+        self.cache = cache
+        self.coalesce = coalesce
+        self.coverage_cache = coverage_cache
+        self.catalog = None
+        self.session = None
+        self.executor = None
+        self.in_flight = {}
+        self.stats = {'requests_sent': 0, 'coalesced': 0}
+        self._session_lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+
+    def get_session(self):
+        """
+        Returns the pooled HTTP session of this dbc, opening it on first use or after close().
+
+        Returns:
+            requests.Session: A session whose adapters keep up to pool_size connections alive per host.
+        """
+        # Double-checked so that concurrent first queries don't open two pools
+        if self.session is None:
+            with self._session_lock:
+                if self.session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self.session = session
+        return self.session
+
+    def get_catalog(self):
+        """
+        Returns the coverage metadata catalog of this dbc, creating an in-memory one on first use. A catalog
+            with a disk tier or other TTLs can be assigned to the catalog attribute instead.
+
+        Returns:
+            CoverageCatalog: The catalog, see coverage_catalog_module.
+        """
+        with self._session_lock:
+            if self.catalog is None:
+                self.catalog = CoverageCatalog(self)
+            return self.catalog
+
+    def get_executor(self):
+        """
+        Returns the worker pool used by send_query_async, opening it on first use or after close().
+            It has one worker per pooled connection, so async callers never wait on a full connection pool.
+
+        Returns:
+            ThreadPoolExecutor: The worker pool of this dbc.
+        """
+        if self.executor is None:
+            with self._session_lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='wcps-query')
+        return self.executor
+
+    def send_query(self, wcps_query, stream=False):
         """
         Sends a WCPS query to the server and retrieves the response.
 
+        Parameters:
+            wcps_query (str): The WCPS query to send.
+            stream (bool, optional): If True, the body is not downloaded up front and can be consumed in chunks
+                with Response.iter_content(). The response must then be closed to return its connection to the pool.
+                Streamed bodies are served from the cache when present, but not stored in it.
+
         Returns:Response: A response object from the requests library containing the server's response to the query.
+            On a cache hit, a CachedResponse holding the same bytes.
 
 
         """
         if not isinstance(wcps_query, str):
             raise TypeError("Value entered must be a string.")
+        # The query is canonicalized once, for both the cache and coalescing; without a cache only identical texts are shared
+        fingerprint = None
+        if self.cache is not None:
+            fingerprint = fingerprint_query(wcps_query)
+            content = self.cache.get(self.server_url, wcps_query, fingerprint)
+            if content is not None:
+                return CachedResponse(content)
+        # A streamed body can only be read once, so streams are never shared
+        if not self.coalesce or stream:
+            return self.post_query(wcps_query, stream, fingerprint)
+        key = (self.server_url, fingerprint if fingerprint is not None else wcps_query)
+        with self._flight_lock:
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                flight = self.in_flight[key] = InFlightQuery()
+                leader = True
+        if not leader:
+            return flight.wait()
+        try:
+            flight.response = self.post_query(wcps_query, stream, fingerprint)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._flight_lock:
+                del self.in_flight[key]
+            flight.done.set()
+        return flight.response
+
+    def post_query(self, wcps_query, stream=False, fingerprint=None):
+        """
+        Posts a WCPS query to the server, bypassing coalescing, and stores a successful result in the cache.
+
+        Parameters:
+            wcps_query (str): The WCPS query to send.
+            stream (bool, optional): If True, the body is left on the connection, see send_query().
+            fingerprint (str, optional): The fingerprint of the query, if already computed, see QueryCache.make_key().
+
+        Returns:
+            Response: The server's response.
+
+        Raises:
+            Exception: If the request fails or the server doesn't answer with status 200.
+        """
+        with self._flight_lock:
+            self.stats['requests_sent'] += 1
         # getting a response from the server
         try:
             # 'verify=False' is used to skip SSL certificate verification;
-            response = requests.post(self.server_url, data = {'query': wcps_query}, verify = False)
-            if response.status_code == 200:
-                return response
-            else:
+            response = self.get_session().post(self.server_url, data = {'query': wcps_query}, verify = False, stream = stream)
+            if response.status_code != 200:
+                response.close()
                 raise ValueError("Not correct query")
         except:
             raise Exception("Something is wrong...")
-         # General exception handling to catch potential issues like network 
+         # General exception handling to catch potential issues like network
+        # Only successful, fully downloaded bodies are cached
+        if self.cache is not None and not stream:
+            self.cache.put(self.server_url, wcps_query, response.content, fingerprint)
+        return response
+
+    async def send_query_async(self, wcps_query):
+        """
+        Awaitable counterpart of send_query. The blocking request runs on the dbc worker pool over the
+            same pooled session, so the event loop stays free while waiting for the server.
+
+        Parameters:
+            wcps_query (str): The WCPS query to send.
+
+        Returns:
+            Response: The same response object send_query would return.
+
+        Raises:
+            TypeError: If wcps_query is not a string.
+
+        Example:
+            >>> response = await database_connection.send_query_async('for $c in (AvgLandTemp) return 1')
+        """
+        if not isinstance(wcps_query, str):
+            raise TypeError("Value entered must be a string.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), self.send_query, wcps_query)
+
+    def close(self):
+        """
+        Closes all pooled connections and the async worker pool. The dbc stays usable, new pools are
+            opened by the next query.
+        """
+        with self._session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -1,33 +1,142 @@
 from database_connection_object_module import DatabaseConnection
-from byte_to_list_module import byte_to_list
+from byte_to_list_module import byte_to_list, byte_to_array, byte_to_grid, iter_numbers, fill_buffer, CSV_STRUCTURE
+from binary_format_module import decode_raw, decode_geotiff, decode_netcdf
+from query_fingerprint_module import fingerprint_query
+from query_ast_module import Query, Binding, VariableList, Expression, RawExpression, Aggregation, Struct, Encode, substitute_variables
+from prepared_query_module import PreparedQuery
+from compiled_query_module import CompiledQuery
+from query_result_module import QueryResult
+from query_optimizer_module import optimize_query
+from subset_module import AxisSubset, parse_subset, format_subset, split_axis, time_steps
+from time_series_store_module import TimeSeriesStore
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import inspect
+import itertools
+import math
+import os
 import re
+import tempfile
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only tiled execution and stacked time series need it here
+    np = None
+
+# Variable names are '$' followed by an identifier
+VARIABLE_PATTERN = re.compile(r'\$[a-zA-Z_][a-zA-Z0-9_]*')
+
+# Aggregations that can be computed on a cached grid; count() counts non-zero (true) cells like WCPS
+LOCAL_AGGREGATIONS = {'MIN': lambda grid: grid.min(), 'MAX': lambda grid: grid.max(), 'AVG': lambda grid: grid.mean(),
+                      'SUM': lambda grid: grid.sum(), 'COUNT': lambda grid: np.count_nonzero(grid)}
+
+# Bindings written by coverage_instance(), e.g. '$c in (AvgLandTemp)'
+BINDING_PATTERN = re.compile(r'(\$[a-zA-Z_][a-zA-Z0-9_]*) in \((.*)\)', re.DOTALL)
+
+# Typical width of one CSV value with its separator in bytes, by OGC data type of the band
+CSV_CELL_BYTES = {'unsignedByte': 4, 'signedByte': 5, 'char': 4, 'boolean': 2, 'unsignedShort': 6, 'signedShort': 7,
+                  'unsignedInt': 11, 'signedInt': 12, 'unsignedLong': 21, 'signedLong': 21, 'float32': 12, 'float64': 20}
+CSV_DEFAULT_CELL_BYTES = 20
+
+# Headers and metadata the encodings add to the cell values; PNG and JPEG are compressed, their estimate is an upper bound
+FORMAT_OVERHEAD_BYTES = {'CSV': 0, 'BINARY': 0, 'GEOTIFF': 1024, 'NETCDF': 4096, 'PNG': 1024, 'JPEG': 1024}
+
+def writes_state(method):
+    """
+    Marks a Datacube method that changes the instance, including the executing methods, which reset it.
+        On a copy-on-write instance the method works on a private copy instead, which is changed in place
+        during the call (so nested calls see each other's changes) and is copy-on-write itself afterwards.
+        For coroutine methods the call lasts until the coroutine is done, not until it is created.
+    """
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def coroutine_wrapper(self, *args, **kwargs):
+            if not self.copy_on_write:
+                return await method(self, *args, **kwargs)
+            cube = self.copy(copy_on_write=False)
+            try:
+                return await method(cube, *args, **kwargs)
+            finally:
+                cube.copy_on_write = True
+        return coroutine_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.copy_on_write:
+            return method(self, *args, **kwargs)
+        cube = self.copy(copy_on_write=False)
+        try:
+            return method(cube, *args, **kwargs)
+        finally:
+            cube.copy_on_write = True
+    return wrapper
+
+def new_file_mode(path):
+    """
+    Finds the permissions a file written to path should get: those of the file it replaces, or the default
+        for new files under the umask of the process.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        pass
+    # Linux lists the umask in /proc; setting it to read it elsewhere isn't thread-safe, but nothing else is
+    try:
+        with open('/proc/self/status') as status:
+            umask = next((int(line.split()[1], 8) for line in status if line.startswith('Umask:')), None)
+    except OSError:
+        umask = None
+    if umask is None:
+        umask = os.umask(0o022)
+        os.umask(umask)
+    return 0o666 & ~umask
 
 class Datacube:
-    def __init__(self, dbc_used):
+    def __init__(self, dbc_used, optimize=False, copy_on_write=False):
         """
         Initializes a Datacube instance with a DatabaseConnection object.
 
         Parameters:
             dbc_used (DatabaseConnection): The DatabaseConnection object used for querying.
+            optimize (bool, optional): Whether queries are rewritten by the optimizer before they are
+                sent, see optimized_query(). Like the dbc, the setting is kept by reset().
+            copy_on_write (bool, optional): If True, the instance is never changed: builder methods return
+                a changed copy and executing leaves it as it is. One configured copy-on-write instance can
+                then be shared by many threads, each deriving its own query from it, see copy().
 
         Raises:
-            TypeError: If dbc_used is not an instance of DatabaseConnection.
+            TypeError: If dbc_used is not an instance of DatabaseConnection, or optimize or copy_on_write is not a bool.
         """
         if not isinstance(dbc_used, DatabaseConnection):
             raise TypeError("dbc instance not passed")
+        if not isinstance(optimize, bool):
+            raise TypeError("Optimize must be a bool.")
+        if not isinstance(copy_on_write, bool):
+            raise TypeError("Copy on write must be a bool.")
         
         self.dbc = dbc_used
+        self.optimize = optimize
+        self.copy_on_write = copy_on_write
+        self.optimization_report = None
         self.variables = []
         self.variable_names = []
         self.subsets = []
         self.aggregation = None
         self.aggregation_condition = None
+        self.aggregations = []
         self.format = None
+        self.cell_type = None
+        self.grid_shape = None
         self.encode_as = None
         self.filter = None
+        self.filter_condition = None
         self.transformation = None
         self.switch_str = None
         
+    @writes_state
     def reset(self):
         """
         Resets the attributes of the Datacube instance to their default values,
@@ -41,12 +150,50 @@ class Datacube:
         self.subsets = []
         self.aggregation = None
         self.aggregation_condition = None
+        self.aggregations = []
         self.format = None
+        self.cell_type = None
+        self.grid_shape = None
         self.encode_as = None
         self.filter = None
+        self.filter_condition = None
         self.transformation = None
         self.switch_str = None
         return self
+
+    def copy(self, copy_on_write=None):
+        """
+        Creates an independent Datacube with the same connection and settings, whose builder state can be
+            changed without affecting this instance. Copies are cheap: the lists are copied, the strings,
+            tuples and Coverage objects in them are shared.
+
+        Parameters:
+            copy_on_write (bool, optional): The copy_on_write setting of the copy. Defaults to the one of this instance.
+
+        Returns:
+            Datacube: The copy.
+
+        Example:
+            >>> shared = Datacube(dbc, copy_on_write=True).coverage_instance("AvgLandTemp", "c").set_format("CSV")
+            >>> # in every request handler, possibly on many threads at once
+            >>> shared.subset(f'Lat({lat}), Long({long})', '$c').avg().execute()
+        """
+        cube = Datacube(self.dbc, self.optimize, self.copy_on_write if copy_on_write is None else copy_on_write)
+        cube.variables = list(self.variables)
+        cube.variable_names = list(self.variable_names)
+        cube.subsets = list(self.subsets)
+        cube.aggregation = self.aggregation
+        cube.aggregation_condition = self.aggregation_condition
+        cube.aggregations = list(self.aggregations)
+        cube.format = self.format
+        cube.cell_type = self.cell_type
+        cube.grid_shape = self.grid_shape
+        cube.encode_as = self.encode_as
+        cube.filter = self.filter
+        cube.filter_condition = self.filter_condition
+        cube.transformation = self.transformation
+        cube.switch_str = self.switch_str
+        return cube
     
     def get_all_var_names(self, string):
         """
@@ -64,8 +211,7 @@ class Datacube:
             >>> print(var_names)
             ['$a', '$b']
         """
-        pattern = r'\$[a-zA-Z_][a-zA-Z0-9_]*'  # Regular expression pattern to match variable names
-        var_names = re.findall(pattern, string)
+        var_names = VARIABLE_PATTERN.findall(string)
         
         if len(var_names) == 0:
             return None
@@ -98,21 +244,18 @@ class Datacube:
             ...
             ValueError: Variables in a string don't exist
         """
-        # Normalize the string by replacing multiple whitespace characters with a single space
-        string = re.sub(r'\s+', ' ', string)
-        
         var_names = self.get_all_var_names(string)
 
         if var_names:
-            var_names = set(var_names)
-            # Convert the list of variable names to a set for efficient comparison
-            if var_names.issubset(set(self.variable_names)):
+            # Only the names left after removing the known ones need a look
+            if not set(var_names).difference(self.variable_names):
                 return True
             else:
                 raise ValueError("Variables in a string don't exist")
         else:
             raise ValueError("Variables weren't specified")
 
+    @writes_state
     def coverage_instance(self, coverage_name, var_name):
         """
         Adds a coverage variable to the Datacube instance.
@@ -142,6 +285,7 @@ class Datacube:
         self.subsets.append(None)
         return self
         
+    @writes_state
     def subset(self, subset, var_name=None):
         """
         Adds a subset specification to the Datacube instance.
@@ -187,6 +331,7 @@ class Datacube:
         
         return self
     
+    @writes_state
     def where(self, filter_condition):
         """
         Sets a filter condition for the datacube query.
@@ -210,8 +355,10 @@ class Datacube:
         self.do_vars_exist(filter_condition)
 
         self.filter_condition = filter_condition
+        self.filter = filter_condition
         return self
     
+    @writes_state
     def switch(self, condition, cases, default_case):
         """
         Constructs a switch statement in a WCPS query with multiple cases.
@@ -233,6 +380,7 @@ class Datacube:
 
     # Aggregation methods
     # Each method sets an aggregation operation and an optional condition
+    @writes_state
     def min(self, condition=None):
         """
         Configures the datacube to compute the minimum value of the specified data subset when executed.
@@ -254,6 +402,7 @@ class Datacube:
         self.aggregation = 'MIN'
         return self
         
+    @writes_state
     def max(self, condition=None):
         """
         Configures the datacube to compute the maximum value of the specified data subset when executed.
@@ -275,6 +424,7 @@ class Datacube:
         self.aggregation = 'MAX'
         return self
     
+    @writes_state
     def avg(self, condition=None):
         """
         Configures the datacube to compute the average value of the specified data subset when executed.
@@ -296,6 +446,7 @@ class Datacube:
         self.aggregation = 'AVG'
         return self
     
+    @writes_state
     def sum(self, condition=None):
         """
         Configures the datacube to compute the sum of values across the specified data subset when executed.
@@ -317,6 +468,7 @@ class Datacube:
         self.aggregation = 'SUM'
         return self
         
+    @writes_state
     def count(self, condition=None):
         """
         Configures the datacube to count the number of data points that meet the specified condition when executed.
@@ -338,6 +490,84 @@ class Datacube:
         self.aggregation_condition = condition
         return self
     
+    @writes_state
+    def agg(self, aggregations):
+        """
+        Configures the datacube to compute several aggregations over the same for clause in one query.
+            The server returns them as one composite (struct) value, which execute() decodes into a dict,
+            so e.g. min, max, avg and count of a region cost one round trip instead of four.
+
+        Parameters:
+            aggregations (list or dict): Aggregation names ('min', 'max', 'avg', 'sum', 'count'), or
+                (name, condition) tuples to aggregate over a condition. In a list every name may appear once
+                and is used as the key of the result; a dict maps result keys to names or tuples instead.
+
+        Returns:
+            Datacube: Returns the instance itself for method chaining.
+
+        Raises:
+            TypeError: If aggregations is not a list or dict, or a condition is not a string.
+            ValueError: If an aggregation is not recognized, a key is repeated or not a valid name,
+                or a condition uses unknown variables.
+
+        Example:
+            >>> datacube.agg(['min', 'max', 'avg', ('count', '$c > 12')]).execute()
+            {'min': -12.3, 'max': 31.0, 'avg': 9.8, 'count': 1042.0}
+        """
+        if isinstance(aggregations, dict):
+            items = list(aggregations.items())
+        elif isinstance(aggregations, list):
+            items = [(item if isinstance(item, str) else item[0], item) for item in aggregations]
+        else:
+            raise TypeError("Aggregations must be given as a list or a dict.")
+        if not items:
+            raise ValueError("At least one aggregation is required.")
+        parsed = []
+        for key, item in items:
+            operation, condition = (item, None) if isinstance(item, str) else item
+            if not isinstance(key, str) or not re.fullmatch(r'[a-zA-Z_][a-zA-Z0-9_]*', key):
+                raise ValueError("Aggregation keys must be valid names.")
+            if not isinstance(operation, str) or operation.upper() not in ['MIN', 'MAX', 'AVG', 'SUM', 'COUNT']:
+                raise ValueError("Specified aggregation operation not recognized.")
+            if condition != None:
+                if not isinstance(condition, str):
+                    raise TypeError("Value entered must be a string.")
+                self.do_vars_exist(condition)
+            parsed.append((key, operation.upper(), condition))
+        if len({key for key, _, _ in parsed}) != len(parsed):
+            raise ValueError("Each aggregation key can only be used once.")
+        self.aggregations = parsed
+        return self
+
+    def set_aggregations(self):
+        """
+        Builds the struct expression computing all aggregations configured with agg().
+
+        Returns:
+            str: The struct expression, e.g. {min: min($c); max: max($c)}.
+        """
+        node = Struct(tuple((key, self.aggregation_node(operation, condition)) for key, operation, condition in self.aggregations))
+        return node.render(tuple(zip(self.variable_names, self.subsets)))
+
+    def decode_aggregations(self, content, keys):
+        """
+        Decodes the composite value returned for agg() into a dict.
+
+        Parameters:
+            content (bytes): The body of the server's response, e.g. b'{"1.5 30 12.2 1042"}'.
+            keys (list of str): The result keys, in the order of the struct fields.
+
+        Returns:
+            dict: The keys mapped to the aggregated values.
+
+        Raises:
+            ValueError: If the number of values doesn't match the number of aggregations.
+        """
+        values = byte_to_list(content.translate(CSV_STRUCTURE))
+        if len(values) != len(keys):
+            raise ValueError("Response doesn't match the requested aggregations.")
+        return dict(zip(keys, values))
+
     def replace_variables_with_subsets(self, str_to_transform=None):
         """
         Replaces variables in a given string with their corresponding subsets if defined.
@@ -357,25 +587,13 @@ class Datacube:
         """
         # This distinction is critical as it determines the course of action
         # code will either modify an existing string or create a new list of all variables and their subsets.
+        subsets = tuple(zip(self.variable_names, self.subsets))
         if str_to_transform != None:
-            expression = str_to_transform
-            # Iterate over tuples of variables and corresponding subsets
-            for var, subset in zip(self.variable_names, self.subsets):
-                if subset != None:
-                    # Replace the variable in the expression with its subset
-                    expression = expression.replace(var, f'{var}[{subset}]')
-            return expression
-        else:
-            expression = ''
-            for var, subset in zip(self.variable_names, self.subsets):
-                if subset != None:
-                    # If a subset exists, append the variable and its subset in bracketed form
-                    expression += f'''{var}[{subset}] '''
-                else:
-                    # If no subset exists, simply append the variable
-                    expression += f'''{var}'''
-            return expression
+            return substitute_variables(str_to_transform, subsets)
+        # Without a string, all variables are listed, those with a subset in bracketed form
+        return VariableList().render(subsets)
         
+    @writes_state
     def transform_data(self, operation):
         """
         Sets a transformation operation to be applied to the datacube when the query is executed.
@@ -408,41 +626,38 @@ class Datacube:
         Raises:
             ValueError: If the specified aggregation operation is not recognized.
         """
-        # Helper_query will be targeted specifically for performing aggregation functions later on
-        helper_query = self.replace_variables_with_subsets(self.aggregation_condition)
-        if self.aggregation == 'MIN':
-            query = f'''min({helper_query})'''
-        elif self.aggregation == 'AVG':
-            query = f'''avg({helper_query})'''
-        elif self.aggregation == 'MAX':
-            query = f'''max({helper_query})'''
-        elif self.aggregation == 'SUM':
-            query = f'''sum({helper_query})'''
-        elif self.aggregation == 'COUNT':
-            query = f'''count({helper_query})'''
-        else:
-            raise ValueError("Specified aggregation operation not recognized.")
-        return query
+        # The node raises a ValueError for unknown operations
+        node = self.aggregation_node(self.aggregation, self.aggregation_condition)
+        return node.render(tuple(zip(self.variable_names, self.subsets)))
         
-    def set_format(self, output_format):
+    @writes_state
+    def set_format(self, output_format, cell_type=None, shape=None):
         """
         Sets the output format for the datacube query.
 
         Parameters:
-            output_format (str): The desired output format.
+            output_format (str): The desired output format: 'CSV', 'PNG', 'JPEG', or one of the binary
+                formats 'BINARY' (raw cell values), 'GEOTIFF' and 'NETCDF'.
+            cell_type (str, optional): The NumPy dtype of the cells, e.g. '<f4'. Required for 'BINARY',
+                since raw values carry no description of their type.
+            shape (tuple of int, optional): The grid shape of a 'BINARY' result.
 
         Returns:
             Datacube: Returns the instance itself for method chaining.
 
         Raises:
             TypeError: If output_format is not a string.
-            ValueError: If the specified output format is not supported.
+            ValueError: If the specified output format is not supported, or 'BINARY' is given without a cell type.
         """
         if not isinstance(output_format, str):
             raise TypeError("Value entered must be a string.")
-        if not (output_format in ['PNG', 'CSV', 'JPEG']):
+        if not (output_format in ['PNG', 'CSV', 'JPEG', 'BINARY', 'GEOTIFF', 'NETCDF']):
             raise ValueError("Entered format doesn't exist")
+        if output_format == 'BINARY' and cell_type is None:
+            raise ValueError("Cell type must be given for raw binary output.")
         self.format = output_format
+        self.cell_type = cell_type
+        self.grid_shape = shape
         return self
     
     def return_format(self):
@@ -461,8 +676,15 @@ class Datacube:
             query = "image/png"
         elif self.format == 'JPEG': 
             query = "image/jpeg"
+        elif self.format == 'BINARY':
+            query = "application/octet-stream"
+        elif self.format == 'GEOTIFF':
+            query = "image/tiff"
+        elif self.format == 'NETCDF':
+            query = "application/netcdf"
         return query
     
+    @writes_state
     def encode(self, operation):
         """
         Specifies the encoding operation to be applied to the output of the query.
@@ -496,285 +718,1301 @@ class Datacube:
         self.encode_as = operation
         return self
     
+    def build_query(self):
+        """
+        Builds the immutable query tree of the configured settings, see query_ast_module. Equal settings
+            give equal (and equally hashed) trees, so the tree can be used as a cache key or varied with
+            Query.replace() and Query.with_subset() without touching this instance.
+
+        Returns:
+            Query: The query tree.
+        """
+        bindings = tuple(Binding(f'${var.variable_name}', var.coverage_names) if isinstance(var, Coverage)
+                         else Binding.from_text(var) for var in self.variables)
+        subsets = tuple(zip(self.variable_names, self.subsets))
+        # Check for the usage of 'where' predicate
+        where = self.filter
+
+        # Several aggregations are computed together as one struct value
+        if self.aggregations:
+            result = Struct(tuple((key, self.aggregation_node(operation, condition))
+                                  for key, operation, condition in self.aggregations))
+        # Check if any of the aggregation functions were used
+        elif self.aggregation != None:
+            result = self.aggregation_node(self.aggregation, self.aggregation_condition)
+        else:
+            # Encoding takes precedence over the transformation, which takes precedence over a switch
+            if self.encode_as != None:
+                result = Expression(self.encode_as)
+            elif self.transformation != None:
+                result = Expression(self.transformation)
+            elif self.switch_str != None:
+                result = RawExpression(self.switch_str)
+            else:
+                result = VariableList()
+            # If the format was specified, or the encoding or data transformation were used, include encode()
+            if self.format != None:
+                result = Encode(result, self.return_format())
+            elif self.encode_as != None or self.transformation != None:
+                result = Encode(result, "text/csv")
+        return Query(bindings, subsets, where, result)
+
+    def aggregation_node(self, operation, condition=None):
+        """
+        Builds the query tree node of an aggregation over a condition, or over the variables with their subsets.
+        """
+        return Aggregation(operation, Expression(condition) if condition is not None else VariableList())
+
+    def construct_for_clause(self):
+        """
+        Constructs the part of the WCPS query up to and including 'return'.
+
+        Returns:
+            str: The for clause, the optional where clause and the return keyword.
+        """
+        return self.build_query().render_for_clause()
+
     def construct_query(self):
         """
         Constructs a WCPS query based on the configured settings of the datacube.
+            The text is rendered from build_query(), and memoized for equal query trees. If the instance
+            was created with optimize=True, the optimized query is rendered and the report of the
+            optimizer is kept in optimization_report.
 
         Returns:
             str: The constructed WCPS query.
         """
-        query = '''for '''
+        if not self.optimize:
+            return self.build_query().render()
+        query, self.optimization_report = self.optimized_query()
+        return query.render()
+
+    def optimized_query(self):
+        """
+        Builds the query tree and runs the optimizer over it, see query_optimizer_module.optimize_query().
+            Constant arithmetic is folded, trims of cell by cell expressions are moved onto the coverage
+            variables, repeated subsets of a variable are merged, always true where conditions are dropped
+            and repeated operands are bound once with let.
+
+        Returns:
+            tuple: The optimized Query and the report of what was changed.
+
+        Example:
+            >>> query, report = datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(0:10)', '$c') \
+            ...     .count(Variable("c").greater_than(Scalar(10).add(5))).optimized_query()
+            >>> report['changes']
+            [('fold_constants', 'return', 'count($c[Lat(0:10)] > 15)')]
+        """
+        return optimize_query(self.build_query())
+        
+    def prepare(self):
+        """
+        Compiles the configured query once into a PreparedQuery with named parameter slots. Slots are
+            written as ${name} anywhere in the builder strings (subsets, conditions, encodings), and the
+            builder checks run once here instead of on every run. The instance itself is left unchanged.
+
+        Returns:
+            PreparedQuery: The compiled query, see PreparedQuery.bind() and PreparedQuery.execute_many().
+
+        Raises:
+            ValueError: If a '${' doesn't start a valid slot.
+
+        Example:
+            >>> prepared = datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(${low}:${high})', '$c').count('$c > ${threshold}').prepare()
+            >>> prepared.execute(low=30, high=60, threshold=12)
+            [1042.0]
+        """
+        return PreparedQuery(self.dbc, self.construct_query(), self.result_settings(), self.decode_response)
+
+    def compile(self):
+        """
+        Compiles the configured query into a CompiledQuery, which is rendered once and can be executed
+            repeatedly, also from several threads, without rebuilding it. Variants with another subset
+            are derived with CompiledQuery.with_subset(). The instance itself is left unchanged.
+
+        Returns:
+            CompiledQuery: The compiled query.
+
+        Example:
+            >>> poll = datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)', '$c').avg().compile()
+            >>> poll.execute(), poll.execute()
+            ([13.2], [13.2])
+        """
+        return CompiledQuery(self.dbc, self.build_query(), self.result_settings(), self.decode_response, self.optimize)
+
+    def fingerprint(self):
+        """
+        Computes the canonical fingerprint of the query this instance would send, see fingerprint_query().
+
+        Returns:
+            str: A hex digest that is equal for semantically identical queries.
+        """
+        return fingerprint_query(self.construct_query())
+
+    def bound_coverages(self):
+        """
+        Lists the coverages every variable of the for clause iterates over.
+
+        Returns:
+            list of tuple: Pairs of variable names and lists of coverage names, for the variables bound to coverages.
+        """
+        bound = []
         for var in self.variables:
             if isinstance(var, Coverage):
-                query += f'${var.var_name} in ({",".join(var.coverage_names)})\n'
-            else:
-                query += (var + '\n')
-        
-        # Check for the usage of 'where' predicate. If it's None, skip it and put return to our query
-        if self.filter != None:
-            query += f'''where {self.filter_condition}\n'''
-        query += f'''return \n'''
-        
-        # Check if any of the aggregation functions were used. If they were, add them to the query and return.
-        if self.aggregation != None:
-            query += self.aggregate_data()
-            return query
-        
-        # Check if the encoding conditions were specified. If they were, add them to 'return'
-        if self.encode_as != None:
-            helper_query = self.replace_variables_with_subsets(self.encode_as)
-        # Encoding condition wasn't specified, so check transformation operation
-        elif self.transformation != None:
-            helper_query = self.replace_variables_with_subsets(self.transformation)
-        # Transformation wasn't used as well, so just return a variable with the corresponding subset
-        elif self.switch_str != None:
-            helper_query = self.switch_str
-        else:
-            helper_query = self.replace_variables_with_subsets()
-        
-        # If the format was specified, write encode() to the query
-        if self.format != None: # Check whether the format was specified
-            query += f'''encode({helper_query}, "{self.return_format()}")'''
-        # If the encoding or data transformation were used, include encode()
-        elif self.encode_as != None or self.transformation != None:
-            query += f'''encode({helper_query}, "text/csv")'''
+                bound.append((f'${var.variable_name}', list(var.coverage_names)))
+                continue
+            match = BINDING_PATTERN.fullmatch(var)
+            if match is not None:
+                bound.append((match.group(1), [name.strip() for name in match.group(2).split(',')]))
+        return bound
+
+    def estimate(self, catalog=None):
+        """
+        Predicts the size of the current query before it is sent: the cells it returns, the bytes of the
+            response in every output format and the cells the server has to read. Axis extents come from
+            the subsets and the coverage metadata of the catalog, so no request is sent for coverages
+            whose metadata is cached. The figures are approximations for deciding whether to send,
+            tile or aggregate a query: CSV widths are typical values, and the where clause is ignored.
+
+        Parameters:
+            catalog (CoverageCatalog, optional): The metadata catalog. Defaults to the catalog of the dbc,
+                see DatabaseConnection.get_catalog().
+
+        Returns:
+            dict: 'cells' and 'shape' of the result (an aggregation returns one cell per value), 'scan_cells'
+                and 'scan_bytes' read by the server, 'bytes' mapping every output format to its estimated
+                response size, 'format' of the query and its 'response_bytes'.
+
+        Raises:
+            ValueError: If no variable is bound to a coverage, or a subset doesn't fit its coverage.
+
+        Example:
+            >>> estimate = datacube.subset('Lat(0:10), Long(0:20)', '$c').estimate()
+            >>> estimate['shape'], estimate['bytes']['CSV']
+            ((12, 100, 200), 2880000)
+            >>> if estimate['response_bytes'] > 100 * 2 ** 20:
+            ...     datacube.execute_tiled({'Lat': 5})
+        """
+        bound = self.bound_coverages()
+        if not bound:
+            raise ValueError("No variable is bound to a coverage.")
+        catalog = catalog if catalog is not None else self.dbc.get_catalog()
+        descriptions = catalog.prefetch(list(dict.fromkeys(name for _, names in bound for name in names)))
+        subsets = dict(zip(self.variable_names, self.subsets))
+
+        selections = []
+        scan_cells = scan_bytes = 0
+        combinations = 1
+        for var, names in bound:
+            # The query is evaluated once for every combination of the coverages of the variables
+            combinations *= len(names)
+            for name in names:
+                description = descriptions[name]
+                shape = description.subset_shape(subsets.get(var))
+                cells = math.prod(shape)
+                scan_cells += cells
+                scan_bytes += cells * (description.cell_bytes or 8)
+                selections.append((cells, shape, description))
+
+        if self.aggregations or self.aggregation is not None:
+            # Aggregations return one (double) value each
+            shape, cells = (), len(self.aggregations) or 1
+            cell_bytes, csv_bytes = 8, CSV_CELL_BYTES['float64']
         else:
-            query += f'''{helper_query}'''
-        return query
-        
-    def execute(self):
+            # Cell by cell expressions have the shape of their operands; the largest one bounds the result
+            cells, shape, description = max(selections, key=lambda selection: selection[0])
+            cell_bytes = description.cell_bytes or 8
+            csv_bytes = sum(CSV_CELL_BYTES.get(data_type, CSV_DEFAULT_CELL_BYTES) for _, data_type in description.bands)
+            if self.cell_type is not None and np is not None:
+                cell_bytes = np.dtype(self.cell_type).itemsize
+        cells *= combinations
+
+        sizes = {output_format: cells * (csv_bytes if output_format == 'CSV' else cell_bytes) + overhead
+                 for output_format, overhead in FORMAT_OVERHEAD_BYTES.items()}
+        output_format = self.format or 'CSV'
+        return {'cells': cells, 'shape': shape, 'scan_cells': scan_cells,
+                'scan_bytes': scan_bytes, 'bytes': sizes, 'format': output_format, 'response_bytes': sizes[output_format]}
+
+    def result_settings(self):
+        """
+        Collects the settings decode_response() needs, so they survive the reset() done by execute().
+
+        Returns:
+            dict: Keyword arguments for decode_response().
+        """
+        return {'output_format': self.format, 'cell_type': self.cell_type, 'shape': self.grid_shape,
+                'aggregation_keys': [key for key, _, _ in self.aggregations] or None}
+
+    def decode_response(self, content, output_format=None, return_type=None, cell_type=None, shape=None, aggregation_keys=None):
+        """
+        Processes the raw bytes returned by the server based on the given output format.
+            Shared by execute() and execute_async() so both give the same results.
+
+        Parameters:
+            content (bytes): The body of the server's response.
+            output_format (str, optional): The format the query was encoded with, as set by set_format().
+            return_type (str, optional): 'list' for a list of floats, 'array' for a contiguous
+                float64 array decoded by byte_to_array(), or 'grid' for an N-dimensional array in the
+                shape of the CSV result decoded by byte_to_grid(). If None, CSV results are returned
+                as a list and binary results as arrays.
+            cell_type (str, optional): The dtype of a 'BINARY' result.
+            shape (tuple of int, optional): The grid shape of a 'BINARY' result.
+            aggregation_keys (list of str, optional): The keys of an agg() query, whose result is a dict.
+
+        Returns:
+            bytes, list, array or dict: Raw bytes for image formats, a dict of arrays for 'NETCDF',
+                a dict of values for agg(), otherwise the decoded values.
+
+        Raises:
+            ValueError: If the return type is not supported.
+        """
+        if return_type not in [None, 'list', 'array', 'grid']:
+            raise ValueError("Specified return type not recognized.")
+        if aggregation_keys:
+            return self.decode_aggregations(content, aggregation_keys)
+        if output_format in ['PNG', 'JPEG']:
+            return content
+        # Binary formats are decoded without parsing text, as views on the response where possible
+        if output_format in ['BINARY', 'GEOTIFF']:
+            if output_format == 'BINARY':
+                data = decode_raw(content, cell_type, shape)
+            else:
+                data = decode_geotiff(content)
+            if return_type == 'list':
+                return data.ravel().tolist()
+            if return_type == 'array':
+                return data.ravel()
+            return data
+        if output_format == 'NETCDF':
+            return decode_netcdf(content)
+        if return_type == 'array':
+            return byte_to_array(content)
+        if return_type == 'grid':
+            return byte_to_grid(content)
+        return byte_to_list(content)
+
+    @writes_state
+    def execute(self, return_type=None):
         """
         Executes the constructed WCPS query and processes the response based on the specified format.
+            If the dbc has a coverage cache, grids of single coverages are stored in it along with the
+            axis metadata from the catalog of the dbc, and requests within a cached grid, including min(),
+            max(), avg(), sum() and count() over them, are answered locally without a query.
+
+        Parameters:
+            return_type (str, optional): How numeric results are returned, see decode_response().
 
         Returns:
-            str or list: Depending on the output format, returns either a string or a list of processed data.
+            str, list or dict: Depending on the output format, returns either a string or a list of processed data,
+                or a dict for agg() queries.
         """
         wcps_query = self.construct_query()
+        settings = self.result_settings()
+        local = self.local_request()
+        if local is not None:
+            grid = self.dbc.coverage_cache.lookup(local['coverage'], local['subset'])
+            # Aggregations over struct cells are left to the server
+            if grid is not None and (not local['operations'] or grid.ndim == local['dims']):
+                self.reset()
+                return self.compute_locally(grid, local['operations'], return_type)
         response = self.dbc.send_query(wcps_query)
-        if self.format == 'CSV':
-            data = byte_to_list(response.content) 
-            self.reset()
+        self.reset()
+        if local is not None and not local['operations']:
+            try:
+                grid = byte_to_grid(response.content)
+            except ValueError:
+                grid = None
+            description = self.coverage_description(local['coverage'])
+            if grid is not None and self.dbc.coverage_cache.store(local['coverage'], local['subset'], grid, description):
+                return self.compute_locally(grid, [], return_type)
+        return self.decode_response(response.content, return_type=return_type, **settings)
+
+    @writes_state
+    def execute_lazy(self):
+        """
+        Executes the constructed WCPS query and returns the response undecoded, as a QueryResult that
+            decodes on first access and keeps every decoded view. Pipelines that only forward the bytes
+            or need their size never parse them. The query is always sent (or answered by the query
+            cache of the dbc), the coverage cache is not consulted.
+
+        Returns:
+            QueryResult: The result, see query_result_module.
+
+        Example:
+            >>> result = datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)').execute_lazy()
+            >>> len(result), result.as_list()
+            (120, [25.5, 27.2, ...])
+        """
+        wcps_query = self.construct_query()
+        settings = self.result_settings()
+        response = self.dbc.send_query(wcps_query)
+        self.reset()
+        return QueryResult(response.content, settings, self.decode_response)
+
+    def local_request(self):
+        """
+        Checks whether the configured query could be answered from the coverage cache of the dbc: a single
+            coverage with a subset, returned as it is or with aggregations without conditions.
+
+        Returns:
+            dict or None: The 'coverage', the 'subset', the aggregation 'operations' as (key, operation) tuples
+                (key None for min(), max(), etc.) and the number of trimmed axes 'dims'; None if the query
+                has to be sent.
+        """
+        if self.dbc.coverage_cache is None or np is None:
+            return None
+        if len(self.variables) != 1 or len(self.variable_names) != 1 or len(self.subsets) != 1 or self.subsets[0] is None:
+            return None
+        match = re.fullmatch(r'\$[a-zA-Z_][a-zA-Z0-9_]* in \(([a-zA-Z_][a-zA-Z0-9_]*)\)', self.variables[0]) if isinstance(self.variables[0], str) else None
+        if match is None or self.filter is not None or self.format not in [None, 'CSV']:
+            return None
+        if self.encode_as is not None or self.transformation is not None or self.switch_str is not None:
+            return None
+        if self.aggregations:
+            if any(condition is not None for _, _, condition in self.aggregations):
+                return None
+            operations = [(key, operation) for key, operation, _ in self.aggregations]
+        elif self.aggregation is not None:
+            if self.aggregation_condition is not None:
+                return None
+            operations = [(None, self.aggregation)]
+        else:
+            operations = []
+        try:
+            dims = sum(1 for axis in parse_subset(self.subsets[0]) if not axis.is_slice)
+        except ValueError:
+            return None
+        return {'coverage': match.group(1), 'subset': self.subsets[0], 'operations': operations, 'dims': dims}
+
+    def coverage_description(self, coverage):
+        """
+        Looks up the metadata of a coverage in the catalog of the dbc, see DatabaseConnection.get_catalog().
+
+        Returns:
+            CoverageDescription or None: The description, or None if the server doesn't describe the coverage.
+        """
+        try:
+            return self.dbc.get_catalog().describe(coverage)
+        except (ValueError, OSError):
+            return None
+
+    def compute_locally(self, grid, operations, return_type=None):
+        """
+        Produces the result execute() would return from a grid of the coverage cache.
+
+        Parameters:
+            grid (numpy.ndarray): The requested cells.
+            operations (list of tuple): The aggregations to compute, see local_request().
+            return_type (str, optional): How the result is returned, see decode_response().
+
+        Returns:
+            list, array or dict: The cells, a one-element list or array for min(), max(), etc.,
+                or a dict for agg().
+        """
+        if not operations:
+            if return_type == 'grid':
+                return grid
+            if return_type == 'array':
+                return grid.ravel()
+            return grid.ravel().tolist()
+        values = {key: float(LOCAL_AGGREGATIONS[operation](grid)) for key, operation in operations}
+        if operations[0][0] is not None:
+            return values
+        if return_type in ['array', 'grid']:
+            return np.array([values[None]])
+        return [values[None]]
+
+    @writes_state
+    def execute_stream(self, chunk_size=65536):
+        """
+        Executes the constructed WCPS query and decodes the numeric response while it is downloaded,
+            so peak memory stays bounded by chunk_size no matter how large the result is.
+
+        Parameters:
+            chunk_size (int, optional): The number of bytes read from the connection at a time.
+
+        Returns:
+            generator of float: The values execute() would return, produced as they arrive.
+
+        Raises:
+            ValueError: If an image or binary format was set, since only text results are parsed as they arrive.
+
+        Example:
+            >>> for value in datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)').execute_stream():
+            ...     print(value)
+        """
+        if self.format not in [None, 'CSV']:
+            raise ValueError("Streaming decoding is only available for text formats.")
+        wcps_query = self.construct_query()
+        response = self.dbc.send_query(wcps_query, stream=True)
+        self.reset()
+        return self._stream_values(response, chunk_size)
+
+    def _stream_values(self, response, chunk_size):
+        # Kept apart from execute_stream() so the query is sent eagerly rather than on first iteration
+        try:
+            yield from iter_numbers(response.iter_content(chunk_size=chunk_size))
+        finally:
+            response.close()
+
+    @writes_state
+    def execute_into(self, buffer, chunk_size=65536):
+        """
+        Executes the constructed WCPS query and writes the decoded values into a preallocated buffer
+            while the response is downloaded.
+
+        Parameters:
+            buffer (mutable sequence): The destination, e.g. a list, an array.array('d') or a NumPy array.
+            chunk_size (int, optional): The number of bytes read from the connection at a time.
+
+        Returns:
+            int: The number of values written from the start of the buffer.
+
+        Raises:
+            ValueError: If an image or binary format was set, or the result does not fit into the buffer.
+        """
+        if self.format not in [None, 'CSV']:
+            raise ValueError("Streaming decoding is only available for text formats.")
+        wcps_query = self.construct_query()
+        response = self.dbc.send_query(wcps_query, stream=True)
+        self.reset()
+        try:
+            return fill_buffer(response.iter_content(chunk_size=chunk_size), buffer)
+        finally:
+            response.close()
+
+    @writes_state
+    def execute_to_stream(self, fileobj, chunk_size=1048576):
+        """
+        Executes the constructed WCPS query and writes the undecoded response to a file object while it
+            is downloaded, so a large result, e.g. a rendered map, never has to fit into memory.
+
+        Parameters:
+            fileobj (file object): The destination, opened for writing bytes.
+            chunk_size (int, optional): The number of bytes read from the connection and written at a time.
+
+        Returns:
+            dict: The 'bytes' written, the 'seconds' the transfer took and the 'bytes_per_second'.
+
+        Raises:
+            TypeError: If fileobj has no write() method or chunk_size is not an integer.
+            ValueError: If chunk_size is smaller than 1.
+
+        Example:
+            >>> with open('map.png', 'wb') as file:
+            ...     datacube.coverage_instance("AvgLandTemp", "c").subset('ansi("2014-07")', '$c').set_format('PNG').execute_to_stream(file)
+            {'bytes': 1048210, 'seconds': 0.84, 'bytes_per_second': 1247869.0}
+        """
+        if not callable(getattr(fileobj, 'write', None)):
+            raise TypeError("Destination must be a writable file object.")
+        if not isinstance(chunk_size, int) or isinstance(chunk_size, bool):
+            raise TypeError("Chunk size must be an integer.")
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1.")
+        wcps_query = self.construct_query()
+        start = time.perf_counter()
+        response = self.dbc.send_query(wcps_query, stream=True)
+        self.reset()
+        written = 0
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                fileobj.write(chunk)
+                written += len(chunk)
+        finally:
+            response.close()
+        seconds = time.perf_counter() - start
+        return {'bytes': written, 'seconds': seconds, 'bytes_per_second': written / seconds if seconds > 0 else float('inf')}
+
+    @writes_state
+    def execute_to_file(self, path, chunk_size=1048576):
+        """
+        Executes the constructed WCPS query and streams the undecoded response into a file, see
+            execute_to_stream(). The response is written to a temporary file next to the destination,
+            which is renamed once the download is complete, so the file at path is either the previous
+            one or the whole new result, never a partial one. The file keeps the permissions of the one it
+            replaces; a new file gets the usual ones under the umask.
+
+        Parameters:
+            path (str or os.PathLike): The destination file.
+            chunk_size (int, optional): The number of bytes read from the connection and written at a time.
+
+        Returns:
+            dict: The 'path' written, the 'bytes', the 'seconds' the transfer took and the 'bytes_per_second'.
+
+        Raises:
+            TypeError: If path is neither a string nor a path.
+
+        Example:
+            >>> datacube.coverage_instance("AvgLandTemp", "c").subset('ansi("2014-07")', '$c').set_format('PNG').execute_to_file('map.png')
+            {'bytes': 1048210, 'seconds': 0.84, 'bytes_per_second': 1247869.0, 'path': 'map.png'}
+        """
+        if not isinstance(path, (str, os.PathLike)):
+            raise TypeError("Path must be a string or a path.")
+        path = os.fspath(path)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                             prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                # mkstemp() creates the file readable by its owner only; give it the permissions of a regular file
+                os.chmod(temp_path, new_file_mode(path))
+                report = self.execute_to_stream(temp_file, chunk_size)
+                # The data is on disk before the rename makes it visible
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        report['path'] = path
+        return report
+
+    @writes_state
+    async def execute_async(self, return_type=None):
+        """
+        Awaitable counterpart of execute(). The query is constructed and the instance reset before
+            awaiting the server, so the same Datacube can be configured again meanwhile.
+
+        Parameters:
+            return_type (str, optional): How numeric results are returned, see decode_response().
+
+        Returns:
+            bytes or list: The same result execute() would return.
+
+        Example:
+            >>> data = await datacube.coverage_instance("AvgLandTemp", "c").avg().execute_async()
+        """
+        wcps_query = self.construct_query()
+        settings = self.result_settings()
+        self.reset()
+        response = await self.dbc.send_query_async(wcps_query)
+        return self.decode_response(response.content, return_type=return_type, **settings)
+
+    @staticmethod
+    async def execute_many(datacubes, max_concurrency=4):
+        """
+        Executes several configured Datacube instances concurrently, with at most max_concurrency
+            queries in flight at any time.
+
+        Parameters:
+            datacubes (iterable of Datacube): The configured instances to execute.
+            max_concurrency (int, optional): The maximum number of queries sent at the same time.
+
+        Returns:
+            list: The results, in the order of the given instances.
+
+        Raises:
+            TypeError: If an item is not a Datacube or max_concurrency is not an integer.
+            ValueError: If max_concurrency is smaller than 1.
+
+        Example:
+            >>> results = await Datacube.execute_many([cube_north, cube_south], max_concurrency=8)
+        """
+        datacubes = list(datacubes)
+        if not all(isinstance(cube, Datacube) for cube in datacubes):
+            raise TypeError("Only Datacube instances can be executed.")
+        if not isinstance(max_concurrency, int) or isinstance(max_concurrency, bool):
+            raise TypeError("Concurrency limit must be an integer.")
+        if max_concurrency < 1:
+            raise ValueError("Concurrency limit must be at least 1.")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(cube):
+            async with semaphore:
+                return await cube.execute_async()
+
+        return await asyncio.gather(*(run(cube) for cube in datacubes))
+
+    def subset_index(self, var_name=None):
+        """
+        Finds the position of the subset of a variable, or of the first variable with a subset.
+
+        Raises:
+            ValueError: If the variable doesn't exist or has no subset.
+        """
+        if var_name is not None:
+            if var_name not in self.variable_names:
+                raise ValueError("Variable name does not exist.")
+            idx = self.variable_names.index(var_name)
+            if idx >= len(self.subsets) or self.subsets[idx] is None:
+                raise ValueError("Variable has no subset.")
+            return idx
+        for idx, subset in enumerate(self.subsets):
+            if subset is not None:
+                return idx
+        raise ValueError("No subset was specified.")
+
+    @writes_state
+    def execute_tiled(self, tile_sizes, max_workers=4, var_name=None, axis_order=None, directions=None):
+        """
+        Executes the constructed WCPS query as a grid of smaller tile queries, which are sent in parallel
+            and stitched into one array. Large subsets are fetched without running into server timeouts or
+            response size limits, over several connections at once.
+
+            A few probe tiles (the first, second and last along every tiled axis) are fetched first to size
+            the output, which is then allocated once; every other tile is written into it by the worker
+            that fetched it, so peak memory is the output plus one tile per worker.
+            Neighbouring tiles share their bound, so tile sizes should be whole multiples of the axis
+            resolution and the subset should start at a cell edge; otherwise a cell on a tile border
+            would be fetched twice and the tiles don't line up.
+
+        Parameters:
+            tile_sizes (dict): Axis names mapped to the extent of one tile, in the units of the axis,
+                e.g. {'Lat': 30, 'Long': 60}. Every axis must be trimmed with numeric bounds in the subset.
+            max_workers (int, optional): The number of tiles fetched at the same time.
+            var_name (str, optional): The variable whose subset is split, e.g. '$c'. Defaults to the first
+                variable with a subset.
+            axis_order (list of str, optional): The trimmed axes in the order of the result's dimensions.
+                Defaults to the grid order of the coverage, see CoverageDescription.grid_order.
+            directions (dict, optional): The tiled axes mapped to the order their cells are stored in, 1 from
+                low to high coordinates and -1 from high to low (e.g. north-first latitudes), so tiles are
+                stitched in the order of the grid. Defaults to the directions in the coverage description.
+
+        Returns:
+            numpy.ndarray: The stitched result, as execute(return_type='grid') would return it.
+
+        Raises:
+            TypeError: If tile_sizes is not a dict or max_workers is not an integer.
+            ValueError: If the query can't be split (aggregations, image or NetCDF formats, axes that are
+                not numeric trims), the axis order or directions are neither given nor described by the
+                catalog of the dbc, or the tile results don't line up.
+            ImportError: If NumPy isn't installed.
+
+        Example:
+            >>> datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(-90:90), Long(-180:180), ansi("2014-07")')
+            >>> datacube.execute_tiled({'Lat': 45, 'Long': 90}, max_workers=8).shape
+            (180, 360)
+        """
+        if not isinstance(tile_sizes, dict):
+            raise TypeError("Tile sizes must be given as a dict.")
+        if not tile_sizes:
+            raise ValueError("At least one axis must be tiled.")
+        if not isinstance(max_workers, int) or isinstance(max_workers, bool):
+            raise TypeError("Number of workers must be an integer.")
+        if max_workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        if self.aggregation is not None or self.aggregations:
+            raise ValueError("Aggregations can't be split into tiles.")
+        if self.format not in [None, 'CSV', 'GEOTIFF']:
+            raise ValueError("Tiled execution is only available for CSV and GeoTIFF results.")
+        if np is None:
+            raise ImportError("NumPy is required for tiled execution.")
+
+        idx = self.subset_index(var_name)
+        axes = parse_subset(self.subsets[idx])
+        trimmed = [axis.axis for axis in axes if not axis.is_slice]
+        for name in tile_sizes:
+            if name not in trimmed:
+                raise ValueError(f"Axis {name} is not trimmed in the subset.")
+        # The grid's axis order and directions decide where every tile goes in the result
+        description = None
+        if axis_order is None or directions is None or not set(tile_sizes) <= set(directions):
+            coverages = dict(self.bound_coverages()).get(self.variable_names[idx], [])
+            description = self.coverage_description(coverages[0]) if len(coverages) == 1 else None
+        if axis_order is None:
+            if description is None:
+                raise ValueError("Axis order of the coverage is unknown, it must be given.")
+            axis_order = [name for name in description.grid_order if name in trimmed]
+        if sorted(axis_order) != sorted(trimmed):
+            raise ValueError("Axis order must list every trimmed axis once.")
+        # One entry per tiled axis: its position in the subset, its dimension in the result and its pieces
+        tiling = []
+        for name, size in tile_sizes.items():
+            position = [axis.axis for axis in axes].index(name)
+            direction = (directions or {}).get(name)
+            if direction is None and description is not None and name in description.axis_index:
+                direction = description.axis_index[name].direction
+            if direction not in [1, -1]:
+                raise ValueError(f"Direction of axis {name} is unknown, it must be given as 1 or -1.")
+            pieces = split_axis(axes[position], size)
+            # Cells stored from high to low coordinates start with the highest tile
+            tiling.append((position, axis_order.index(name), pieces if direction == 1 else pieces[::-1]))
+
+        # Tile queries are built up front, so the instance can be reset like execute() does
+        original = self.subsets[idx]
+        queries = {}
+        for tile in itertools.product(*(range(len(pieces)) for _, _, pieces in tiling)):
+            tile_axes = list(axes)
+            for (position, _, pieces), k in zip(tiling, tile):
+                tile_axes[position] = pieces[k]
+            self.subsets[idx] = format_subset(tile_axes)
+            queries[tile] = self.construct_query()
+        self.subsets[idx] = original
+        settings = self.result_settings()
+        self.reset()
+
+        def fetch(tile):
+            response = self.dbc.send_query(queries[tile])
+            data = np.asarray(self.decode_response(response.content, return_type='grid', **settings))
+            if data.ndim < len(axis_order):
+                raise ValueError("Tile result has fewer dimensions than trimmed axes.")
             return data
-        elif self.format == 'PNG':
-            self.reset()
-            return response.content
-        elif self.format == 'JPEG':
-            self.reset()
-            return response.content
+
+        origin = (0,) * len(tiling)
+        probes = [origin]
+        for axis, (_, _, pieces) in enumerate(tiling):
+            for k in sorted({1, len(pieces) - 1}):
+                probe = origin[:axis] + (k,) + origin[axis + 1:]
+                if 0 < k < len(pieces) and probe not in probes:
+                    probes.append(probe)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wcps-tile') as executor:
+            probed = dict(zip(probes, executor.map(fetch, probes)))
+
+            # Tiles between the second and the last one have the extent of the second
+            extents, offsets = [], []
+            shape = list(probed[origin].shape)
+            for axis, (_, dim, pieces) in enumerate(tiling):
+                def extent(k):
+                    return probed[origin[:axis] + (k,) + origin[axis + 1:]].shape[dim]
+                sizes = [extent(0)] + [extent(1)] * (len(pieces) - 2) + ([extent(len(pieces) - 1)] if len(pieces) > 1 else [])
+                extents.append(sizes)
+                offsets.append(list(itertools.accumulate([0] + sizes[:-1])))
+                shape[dim] = sum(sizes)
+            output = np.empty(shape, dtype=probed[origin].dtype)
+
+            def place(tile, data):
+                region = [slice(None)] * output.ndim
+                for axis, (_, dim, _) in enumerate(tiling):
+                    start = offsets[axis][tile[axis]]
+                    region[dim] = slice(start, start + extents[axis][tile[axis]])
+                target = output[tuple(region)]
+                if target.shape != data.shape:
+                    raise ValueError("Tile results don't line up, check that tile sizes are multiples of the resolution.")
+                target[...] = data
+
+            for tile, data in probed.items():
+                place(tile, data)
+            del probed
+            # Tiles cover disjoint regions of the output, so workers write into it directly
+            for _ in executor.map(lambda tile: place(tile, fetch(tile)), [tile for tile in queries if tile not in probes]):
+                pass
+        return output
+
+    @writes_state
+    def time_series(self, start, end, step='P1M', axis='ansi', var_name=None, max_workers=4, batch_size=1, return_type=None):
+        """
+        Executes the constructed WCPS query once per time step, slicing the time axis of a variable
+            at each step, and collects the results in time order. The per-step queries run concurrently
+            on at most max_workers threads.
+
+            Queries computing a single aggregation (min(), max(), avg(), sum() or count()) can be batched:
+            batch_size steps are then computed by one query returning a struct with one field per step.
+            If the server rejects a batched query, the batch is split in halves and retried, and later
+            batches use the smaller size, down to one step per query.
+
+        Parameters:
+            start (str): The first time step, e.g. "2014-01".
+            end (str): The last time step, included if it falls on a step.
+            step (str, optional): An ISO 8601 duration with one unit, see time_steps().
+            axis (str, optional): The name of the time axis.
+            var_name (str, optional): The variable whose time axis is sliced, e.g. '$c'. Defaults to the first
+                variable with a subset, or the first variable.
+            max_workers (int, optional): The number of queries sent at the same time.
+            batch_size (int, optional): The number of steps an aggregation query may compute at once.
+            return_type (str, optional): How each result is decoded, see decode_response(). With 'array'
+                or 'grid', the results are stacked into one array whose first axis is time.
+
+        Returns:
+            tuple: The list of time steps and the list of their results in the same order (or an array,
+                see return_type). Results of single aggregations are floats.
+
+        Raises:
+            TypeError: If max_workers or batch_size is not an integer.
+            ValueError: If the times or the step can't be parsed, or max_workers or batch_size is smaller than 1.
+
+        Example:
+            >>> datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)', '$c').avg()
+            >>> times, values = datacube.time_series("2014-01", "2014-12", "P1M", batch_size=12)
+        """
+        times = time_steps(start, end, step)
+        return times, self.stack_results(self.execute_time_steps(times, axis, var_name, max_workers, batch_size, return_type), return_type)
+
+    @writes_state
+    def refresh(self, store, start, end, step='P1M', axis='ansi', var_name=None, max_workers=4, batch_size=1,
+                return_type=None, refetch=0):
+        """
+        Incremental counterpart of time_series(). The results of earlier calls with the same query are
+            kept in a TimeSeriesStore, and only the time steps that aren't stored yet are fetched; they are
+            then added to the store. Monitoring jobs that run regularly thus only fetch the newest steps.
+
+        Parameters:
+            store (TimeSeriesStore): The store of fetched steps.
+            start, end, step, axis, var_name, max_workers, batch_size, return_type: See time_series().
+            refetch (int, optional): The number of latest stored steps in the range that are fetched again,
+                for servers that revise their most recent data.
+
+        Returns:
+            tuple: The list of time steps and their results, as time_series() would return them.
+
+        Raises:
+            TypeError: If store is not a TimeSeriesStore.
+            ValueError: If an image or NetCDF format was set, or refetch is negative.
+
+        Example:
+            >>> store = TimeSeriesStore('.wcps_series')
+            >>> datacube.coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)', '$c').avg()
+            >>> times, values = datacube.refresh(store, "2014-01", "2014-12")
+        """
+        if not isinstance(store, TimeSeriesStore):
+            raise TypeError("Store must be a TimeSeriesStore instance.")
+        if self.format in ['PNG', 'JPEG', 'NETCDF']:
+            raise ValueError("Only numeric results can be stored.")
+        if not isinstance(refetch, int) or refetch < 0:
+            raise ValueError("Number of steps to fetch again can't be negative.")
+        times = time_steps(start, end, step)
+        # The series is identified by its query with a placeholder instead of the time step
+        (template,), _ = self.time_step_queries(['*'], axis, var_name)
+        key = store.make_key(self.dbc.server_url, template, return_type)
+        stored = store.load(key)
+        known = [time for time in times if time in stored]
+        again = set(known[len(known) - refetch:]) if refetch else set()
+        missing = [time for time in times if time not in stored or time in again]
+        if missing:
+            results = self.execute_time_steps(missing, axis, var_name, max_workers, batch_size, return_type)
+            store.update(key, {time: result.tolist() if hasattr(result, 'tolist') else result
+                               for time, result in zip(missing, results)})
         else:
             self.reset()
-            data = byte_to_list(response.content) 
-            return data
+        return times, self.stack_results([stored[time] for time in times], return_type)
+
+    @writes_state
+    def time_step_queries(self, times, axis='ansi', var_name=None):
+        """
+        Builds the query of every time step, with the time axis of a variable sliced at that step.
+            The instance is left unchanged.
+
+        Parameters:
+            times (list of str): The time steps.
+            axis (str, optional): The name of the time axis.
+            var_name (str, optional): The variable whose time axis is sliced, see time_series().
+
+        Returns:
+            tuple: The list of queries and, for single aggregations, the list of aggregation expressions.
+
+        Raises:
+            ValueError: If no coverage was specified or the variable doesn't exist.
+        """
+        if not self.variable_names:
+            raise ValueError("No coverage was specified.")
+        if var_name is None and all(subset is None for subset in self.subsets):
+            idx = 0
+        elif var_name is None:
+            idx = self.subset_index()
+        else:
+            if var_name not in self.variable_names:
+                raise ValueError("Variable name does not exist.")
+            idx = self.variable_names.index(var_name)
+        original = self.subsets[idx]
+        axes = [item for item in parse_subset(original) if item.axis != axis] if original is not None else []
+        queries, expressions = [], []
+        try:
+            for time in times:
+                self.subsets[idx] = format_subset(axes + [AxisSubset(axis, time)])
+                queries.append(self.construct_query())
+                if self.aggregation is not None:
+                    expressions.append(self.set_aggregation(self.aggregation))
+        finally:
+            self.subsets[idx] = original
+        return queries, expressions
+
+    @writes_state
+    def execute_time_steps(self, times, axis='ansi', var_name=None, max_workers=4, batch_size=1, return_type=None):
+        """
+        Executes the constructed WCPS query for the given time steps, see time_series().
+
+        Returns:
+            list: The result of every time step, in the order of times.
+        """
+        for name, value in [('Number of workers', max_workers), ('Batch size', batch_size)]:
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TypeError(f"{name} must be an integer.")
+            if value < 1:
+                raise ValueError(f"{name} must be at least 1.")
+        # Per-step queries and aggregation expressions are built up front, so the instance can be reset
+        queries, expressions = self.time_step_queries(times, axis, var_name)
+        for_clause = self.construct_for_clause()
+        settings = self.result_settings()
+        single_aggregation = self.aggregation is not None and not self.aggregations
+        self.reset()
+
+        results = [None] * len(times)
+        limit = [batch_size if single_aggregation else 1]
+        limit_lock = threading.Lock()
+
+        def run(positions):
+            if len(positions) == 1:
+                content = self.dbc.send_query(queries[positions[0]]).content
+                result = self.decode_response(content, return_type=return_type, **settings)
+                results[positions[0]] = result[0] if single_aggregation else result
+                return
+            keys = [f't{position}' for position in positions]
+            fields = '; '.join(f'{key}: {expressions[position]}' for key, position in zip(keys, positions))
+            try:
+                content = self.dbc.send_query(for_clause + '{' + fields + '}').content
+                values = self.decode_aggregations(content, keys)
+            except Exception:
+                # The server can't compute this batch at once, so smaller batches are tried
+                with limit_lock:
+                    limit[0] = min(limit[0], len(positions) // 2)
+                run_batches(positions)
+                return
+            for key, position in zip(keys, positions):
+                results[position] = values[key]
+
+        def run_batches(positions):
+            # The limit is read again for every batch, it may have been lowered meanwhile
+            while positions:
+                size = limit[0]
+                run(positions[:size])
+                positions = positions[size:]
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wcps-time') as executor:
+            batches = [list(range(first, min(first + limit[0], len(times)))) for first in range(0, len(times), limit[0])]
+            for _ in executor.map(run_batches, batches):
+                pass
+
+        return results
+
+    def stack_results(self, results, return_type=None):
+        """
+        Stacks per-step results into one array whose first axis is time, if return_type is 'array' or 'grid'.
+            Other results are returned as they are.
+        """
+        if return_type in ['array', 'grid']:
+            if np is None:
+                raise ImportError("NumPy is required to stack time series results.")
+            return np.stack([np.asarray(result) for result in results]) if results else np.empty(0)
+        return results
+
+    @writes_state
+    def compute(self, operation):
+        """
+        Sets a coverage expression built with +, -, * and / as the result of the query, e.g.
+            (a - b) / (a + b). The whole expression is sent as one query, with every distinct coverage
+            bound once in the for clause, so it costs a single round trip however deeply it is nested.
+            The variables can be subset like the ones of coverage_instance().
+
+        Parameters:
+            operation (Coverage or BinaryOperation): The expression.
+
+        Returns:
+            Datacube: Returns the instance itself for method chaining.
+
+        Raises:
+            TypeError: If operation is neither a Coverage nor a BinaryOperation.
+            ValueError: If two different coverages use the same variable name.
+
+        Example:
+            >>> red, nir = Coverage(["S2_B04"], "red"), Coverage(["S2_B08"], "nir")
+            >>> datacube.compute((nir - red) / (nir + red)).subset('Lat(0:10)', '$nir').execute()
+        """
+        if isinstance(operation, Coverage):
+            coverages, expression = [operation], f'${operation.variable_name}'
+        elif isinstance(operation, BinaryOperation):
+            coverages, expression = operation.coverages(), operation.expression()
+        else:
+            raise TypeError("Operation must be a Coverage or a BinaryOperation.")
+        for coverage in coverages:
+            # Every distinct coverage is bound once, also over several calls
+            if f'${coverage.variable_name}' not in self.variable_names:
+                self.variables.append(coverage)
+                self.variable_names.append(f'${coverage.variable_name}')
+                self.subsets.append(None)
+        self.transformation = expression
+        return self
 
     def add_coverages(self, *coverages):
         """
-        Adds multiple coverages together and returns the result as a new coverage.
+        Adds multiple coverages together and returns the result as a new coverage, with the query computing it.
+            The coverages may themselves be BinaryOperation expressions; the query binds every
+            distinct coverage once, see BinaryOperation.to_query().
 
         Parameters:
-            *coverages (Coverage): Variable number of coverage objects to add.
+            *coverages (Coverage or BinaryOperation): Variable number of coverage objects to add.
 
         Returns:
-            Coverage: An expression representing the addition of the coverages.
+            tuple: A Coverage representing the result and the WCPS query computing it.
         """
         if len(coverages) < 2:
             raise ValueError("At least two coverages are required for addition.")
 
-        # Construct the query expression for the addition of coverages
-        query_parts = [f'${cov.variable_name} in ({cov.coverage_names[0]})' for cov in coverages]
-        query_vars = [f'${cov.variable_name}' for cov in coverages]
-        query_expr = ',\n'.join(query_parts)
-
-        # Construct the final query including the encoding part
-        final_query = f'For\n{query_expr}\nreturn\nencode({" + ".join(query_vars)}, "text/csv")'
+        # The operands are combined from the left, as written: a + b + c is (a + b) + c
+        operation = BinaryOperation(coverages[0], coverages[1], '+')
+        for coverage in coverages[2:]:
+            operation = BinaryOperation(operation, coverage, '+')
+        final_query = operation.to_query()
 
         # Create a new coverage representing the addition
-        result = Coverage([], f'c{len(self.variables) + 1}')  # Adjust this line according to your Coverage class
+        result = Coverage([], f'c{len(self.variables) + 1}')
 
         return result, final_query
 
     def subtract_coverages(self, *coverages):
         """
-        Subtracts multiple coverages and returns the result as a new coverage.
+        Subtracts multiple coverages and returns the result as a new coverage, with the query computing it.
+            The coverages may themselves be BinaryOperation expressions; the query binds every
+            distinct coverage once, see BinaryOperation.to_query().
 
         Parameters:
-            *coverages (Coverage): Variable number of coverage objects to subtract.
+            *coverages (Coverage or BinaryOperation): Variable number of coverage objects to subtract.
 
         Returns:
-            Coverage: An expression representing the subtraction of the coverages.
+            tuple: A Coverage representing the result and the WCPS query computing it.
         """
         if len(coverages) < 2:
             raise ValueError("At least two coverages are required for subtraction.")
 
-        # Construct the query expression for the subtraction of coverages
-        query_parts = [f'${cov.variable_name} in ({cov.coverage_names[0]})' for cov in coverages]
-        query_vars = [f'${cov.variable_name}' for cov in coverages]
-        query_expr = ',\n'.join(query_parts)
-
-        # Construct the final query including the encoding part
-        final_query = f'For\n{query_expr}\nreturn\nencode({" - ".join(query_vars)}, "text/csv")'
+        # The operands are combined from the left, as written: a - b - c is (a - b) - c
+        operation = BinaryOperation(coverages[0], coverages[1], '-')
+        for coverage in coverages[2:]:
+            operation = BinaryOperation(operation, coverage, '-')
+        final_query = operation.to_query()
 
         # Create a new coverage representing the subtraction
-        result = Coverage([], f'c{len(self.variables) + 1}')  # Adjust this line according to your Coverage class
+        result = Coverage([], f'c{len(self.variables) + 1}')
 
         return result, final_query
 
     def multiply_coverages(self, *coverages):
         """
-        Multiplies multiple coverages together and returns the result as a new coverage.
+        Multiplies multiple coverages together and returns the result as a new coverage, with the query computing it.
+            The coverages may themselves be BinaryOperation expressions; the query binds every
+            distinct coverage once, see BinaryOperation.to_query().
 
         Parameters:
-            *coverages (Coverage): Variable number of coverage objects to multiply.
+            *coverages (Coverage or BinaryOperation): Variable number of coverage objects to multiply.
 
         Returns:
-            Coverage: An expression representing the multiplication of the coverages.
+            tuple: A Coverage representing the result and the WCPS query computing it.
         """
         if len(coverages) < 2:
             raise ValueError("At least two coverages are required for multiplication.")
 
-        # Construct the query expression for the multiplication of coverages
-        query_parts = [f'${cov.variable_name} in ({cov.coverage_names[0]})' for cov in coverages]
-        query_vars = [f'${cov.variable_name}' for cov in coverages]
-        query_expr = ',\n'.join(query_parts)
-
-        # Construct the final query including the encoding part
-        final_query = f'For\n{query_expr}\nreturn\nencode({" * ".join(query_vars)}, "text/csv")'
+        # The operands are combined from the left, as written: a * b * c is (a * b) * c
+        operation = BinaryOperation(coverages[0], coverages[1], '*')
+        for coverage in coverages[2:]:
+            operation = BinaryOperation(operation, coverage, '*')
+        final_query = operation.to_query()
 
         # Create a new coverage representing the multiplication
-        result = Coverage([], f'c{len(self.variables) + 1}')  # Adjust this line according to your Coverage class
+        result = Coverage([], f'c{len(self.variables) + 1}')
 
         return result, final_query
 
     def divide_coverages(self, *coverages):
         """
-        Divides multiple coverages and returns the result as a new coverage.
+        Divides multiple coverages and returns the result as a new coverage, with the query computing it.
+            The coverages may themselves be BinaryOperation expressions; the query binds every
+            distinct coverage once, see BinaryOperation.to_query().
 
         Parameters:
-            *coverages (Coverage): Variable number of coverage objects to divide.
+            *coverages (Coverage or BinaryOperation): Variable number of coverage objects to divide.
 
         Returns:
-            Coverage: An expression representing the division of the coverages.
+            tuple: A Coverage representing the result and the WCPS query computing it.
         """
         if len(coverages) < 2:
             raise ValueError("At least two coverages are required for division.")
 
-        # Construct the query expression for the division of coverages
-        query_parts = [f'${cov.variable_name} in ({cov.coverage_names[0]})' for cov in coverages]
-        query_vars = [f'${cov.variable_name}' for cov in coverages]
-        query_expr = ',\n'.join(query_parts)
-
-        # Construct the final query including the encoding part
-        final_query = f'For\n{query_expr}\nreturn\nencode({" / ".join(query_vars)}, "text/csv")'
+        # The operands are combined from the left, as written: a / b / c is (a / b) / c
+        operation = BinaryOperation(coverages[0], coverages[1], '/')
+        for coverage in coverages[2:]:
+            operation = BinaryOperation(operation, coverage, '/')
+        final_query = operation.to_query()
 
         # Create a new coverage representing the division
-        result = Coverage([], f'c{len(self.variables) + 1}')  # Adjust this line according to your Coverage class
+        result = Coverage([], f'c{len(self.variables) + 1}')
 
         return result, final_query
     
-class Coverage:
-    def __init__(self, coverage_names, variable_name):
-        """
-        Creates a Coverage instance with the provided coverage names and variable name.
-
-        Parameters:
-            coverage_names (list): A list of coverage names.
-            variable_name (str): The name of the variable associated with the coverage.
-
-        Example:
-            >>> cov = Coverage(["temperature", "humidity"], "var1")
-        """
-        self.coverage_names = coverage_names
-        self.variable_name = variable_name
+class CoverageArithmetic:
+    # Arithmetic shared by coverages and the expressions built from them; numbers may be mixed in
+    def combine(self, other, operator, reflected=False):
+        if not isinstance(other, (Coverage, BinaryOperation, int, float)) or isinstance(other, bool):
+            raise TypeError("Unsupported operand type(s) for {}: '{}' and '{}'".format(
+                operator, type(self).__name__, type(other).__name__))
+        return BinaryOperation(other, self, operator) if reflected else BinaryOperation(self, other, operator)
 
     def __add__(self, other):
         """
         Defines addition operation between two Coverage instances.
 
         Parameters:
-            other (Coverage): Another Coverage instance to be added.
+            other (Coverage, BinaryOperation, int or float): The operand to be added.
 
         Returns:
-            BinaryOperation: Represents the addition operation between two Coverages.
+            BinaryOperation: Represents the addition operation.
 
         Raises:
-            TypeError: If the other operand is not a Coverage instance.
+            TypeError: If the other operand is not a Coverage, a BinaryOperation or a number.
         """
-        if isinstance(other, Coverage):
-            return BinaryOperation(self, other, '+')
-        else:
-            raise TypeError("Unsupported operand type(s) for +: '{}' and '{}'".format(
-                type(self).__name__, type(other).__name__))
+        return self.combine(other, '+')
 
     def __sub__(self, other):
         """
         Defines subtraction operation between two Coverage instances.
 
         Parameters:
-            other (Coverage): Another Coverage instance to be subtracted.
+            other (Coverage, BinaryOperation, int or float): The operand to be subtracted.
 
         Returns:
-            BinaryOperation: Represents the subtraction operation between two Coverages.
+            BinaryOperation: Represents the subtraction operation.
 
         Raises:
-            TypeError: If the other operand is not a Coverage instance.
+            TypeError: If the other operand is not a Coverage, a BinaryOperation or a number.
         """
-        if isinstance(other, Coverage):
-            return BinaryOperation(self, other, '-')
-        else:
-            raise TypeError("Unsupported operand type(s) for -: '{}' and '{}'".format(
-                type(self).__name__, type(other).__name__))
+        return self.combine(other, '-')
 
     def __mul__(self, other):
         """
         Defines multiplication operation between two Coverage instances.
 
         Parameters:
-            other (Coverage): Another Coverage instance to be multiplied.
+            other (Coverage, BinaryOperation, int or float): The operand to be multiplied.
 
         Returns:
-            BinaryOperation: Represents the multiplication operation between two Coverages.
+            BinaryOperation: Represents the multiplication operation.
 
         Raises:
-            TypeError: If the other operand is not a Coverage instance.
+            TypeError: If the other operand is not a Coverage, a BinaryOperation or a number.
         """
-        if isinstance(other, Coverage):
-            return BinaryOperation(self, other, '*')
-        else:
-            raise TypeError("Unsupported operand type(s) for *: '{}' and '{}'".format(
-                type(self).__name__, type(other).__name__))
+        return self.combine(other, '*')
 
     def __truediv__(self, other):
         """
         Defines division operation between two Coverage instances.
 
         Parameters:
-            other (Coverage): Another Coverage instance to be divided.
+            other (Coverage, BinaryOperation, int or float): The divisor.
 
         Returns:
-            BinaryOperation: Represents the division operation between two Coverages.
+            BinaryOperation: Represents the division operation.
 
         Raises:
-            TypeError: If the other operand is not a Coverage instance.
+            TypeError: If the other operand is not a Coverage, a BinaryOperation or a number.
         """
-        if isinstance(other, Coverage):
-            return BinaryOperation(self, other, '/')
-        else:
-            raise TypeError("Unsupported operand type(s) for /: '{}' and '{}'".format(
-                type(self).__name__, type(other).__name__))
+        return self.combine(other, '/')
+
+    # Numbers on the left, e.g. 2 * coverage
+    def __radd__(self, other):
+        return self.combine(other, '+', reflected=True)
+
+    def __rsub__(self, other):
+        return self.combine(other, '-', reflected=True)
+
+    def __rmul__(self, other):
+        return self.combine(other, '*', reflected=True)
+
+    def __rtruediv__(self, other):
+        return self.combine(other, '/', reflected=True)
+
+class Coverage(CoverageArithmetic):
+    def __init__(self, coverage_names, variable_name):
+        """
+        Creates a Coverage instance with the provided coverage names and variable name.
+            Coverages can be combined with +, -, * and / into BinaryOperation expressions.
+
+        Parameters:
+            coverage_names (list): A list of coverage names.
+            variable_name (str): The name of the variable associated with the coverage.
+
+        Example:
+            >>> cov = Coverage(["temperature", "humidity"], "var1")
+        """
+        self.coverage_names = coverage_names
+        self.variable_name = variable_name
 
+class BinaryOperation(CoverageArithmetic):
+    # Operators binding tighter have a higher number
+    PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2}
 
-class BinaryOperation:
     def __init__(self, lhs, rhs, operator):
         """
-        Initializes a BinaryOperation instance.
+        Initializes a BinaryOperation instance. Operations nest, so a whole band math expression such as
+            (a + b) * c / d is one tree that is compiled into a single query.
 
         Parameters:
-            lhs (Coverage): The left-hand side Coverage instance.
-            rhs (Coverage): The right-hand side Coverage instance.
+            lhs (Coverage, BinaryOperation, int or float): The left-hand side operand.
+            rhs (Coverage, BinaryOperation, int or float): The right-hand side operand.
             operator (str): The operator symbol representing the operation.
 
+        Raises:
+            TypeError: If an operand is not a Coverage, a BinaryOperation or a number.
+            ValueError: If the operator is not one of '+', '-', '*' and '/'.
+
         Example:
             >>> operation = BinaryOperation(Coverage(["temp1"], "var1"), Coverage(["temp2"], "var2"), '+')
         """
+        if operator not in self.PRECEDENCE:
+            raise ValueError("Operator must be one of '+', '-', '*' and '/'.")
+        for operand in (lhs, rhs):
+            if not isinstance(operand, (Coverage, BinaryOperation, int, float)) or isinstance(operand, bool):
+                raise TypeError("Operands must be coverages, operations or numbers.")
         self.lhs = lhs
         self.rhs = rhs
-        self.operator = operator
\ No newline at end of file
+        self.operator = operator
+
+    def coverages(self):
+        """
+        Collects the distinct coverages of the expression, in the order they first appear.
+
+        Returns:
+            list of Coverage: Every coverage once, also if it is used several times.
+
+        Raises:
+            ValueError: If two different coverages use the same variable name.
+        """
+        found = {}
+        pending = [self]
+        while pending:
+            operand = pending.pop()
+            if isinstance(operand, BinaryOperation):
+                # The right side is pushed first, so the left side is visited first
+                pending.extend([operand.rhs, operand.lhs])
+            elif isinstance(operand, Coverage):
+                known = found.setdefault(operand.variable_name, operand)
+                if known is not operand and list(known.coverage_names) != list(operand.coverage_names):
+                    raise ValueError(f"Variable name {operand.variable_name} is used by different coverages.")
+        return list(found.values())
+
+    def expression(self):
+        """
+        Writes the expression in WCPS syntax, with parentheses only where the grouping needs them.
+
+        Returns:
+            str: The expression, e.g. '($c1 + $c2) * $c3'.
+        """
+        return self.operand_text(self.lhs, False) + f' {self.operator} ' + self.operand_text(self.rhs, True)
+
+    def operand_text(self, operand, right):
+        if isinstance(operand, Coverage):
+            return f'${operand.variable_name}'
+        if not isinstance(operand, BinaryOperation):
+            text = str(operand) if isinstance(operand, int) else repr(operand)
+            return f'({text})' if operand < 0 else text
+        text = operand.expression()
+        precedence, own = self.PRECEDENCE[operand.operator], self.PRECEDENCE[self.operator]
+        # a - (b - c) and a / (b * c) need their parentheses, (a - b) - c doesn't
+        if precedence < own or (right and precedence == own):
+            return f'({text})'
+        return text
+
+    def to_query(self, mime_type="text/csv"):
+        """
+        Compiles the expression into one WCPS query that binds every distinct coverage once.
+
+        Parameters:
+            mime_type (str, optional): The format the result is encoded in.
+
+        Returns:
+            str: The WCPS query.
+
+        Example:
+            >>> a, b, c = Coverage(["A"], "a"), Coverage(["B"], "b"), Coverage(["C"], "c")
+            >>> ((a + b) * c / a).to_query()
+            'For\n$a in (A),\n$b in (B),\n$c in (C)\nreturn\nencode(($a + $b) * $c / $a, "text/csv")'
+        """
+        bindings = ',\n'.join(f'${coverage.variable_name} in ({",".join(coverage.coverage_names)})'
+                              for coverage in self.coverages())
+        return f'For\n{bindings}\nreturn\nencode({self.expression()}, "{mime_type}")'
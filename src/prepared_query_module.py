@@ -0,0 +1,136 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Parameter slots are written ${name}; WCPS variables ($c) never have a brace after the '$'
+PLACEHOLDER_PATTERN = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+# String values are limited to what names, dates and CRS URLs need, so a value can't close its slot's
+# quotes or brackets, or add a clause, e.g. '2014-07") return 1'
+SAFE_STRING_PATTERN = re.compile(r'[A-Za-z0-9_.:/+\-]*')
+
+def format_parameter(value):
+    """
+    Writes a parameter value into query text: strings as they are, numbers in their shortest exact form.
+
+    Raises:
+        TypeError: If the value is neither a string nor a number.
+        ValueError: If a string holds other characters than letters, digits and '_.:/+-', such as
+            quotes, brackets or whitespace, which could change the query around the slot.
+    """
+    if isinstance(value, str):
+        if not SAFE_STRING_PATTERN.fullmatch(value):
+            raise ValueError("String parameters may only hold letters, digits and '_.:/+-'.")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError("Parameter values must be strings or numbers.")
+    return str(value) if isinstance(value, int) else repr(value)
+
+class PreparedQuery:
+    def __init__(self, dbc, template, settings, decoder):
+        """
+        A query compiled once into literal text and named parameter slots, created by Datacube.prepare().
+            Binding parameters only joins the slots' values with the literal parts, without the builder
+            calls, the variable checks or the query construction.
+
+        Parameters:
+            dbc (DatabaseConnection): The connection results are fetched over.
+            template (str): The query text with ${name} slots.
+            settings (dict): The decoding settings, see Datacube.result_settings().
+            decoder (callable): Decodes a response body, see Datacube.decode_response().
+
+        Raises:
+            ValueError: If the template has a '${' that doesn't start a valid slot.
+        """
+        # Odd positions of the split hold the parameter names, even positions the literal text between them
+        self.parts = PLACEHOLDER_PATTERN.split(template)
+        if any('${' in literal for literal in self.parts[::2]):
+            raise ValueError("Parameter slots must be written as ${name}.")
+        self.template = template
+        self.parameters = tuple(dict.fromkeys(self.parts[1::2]))
+        self.settings = settings
+        self.decoder = decoder
+        self.dbc = dbc
+
+    def bind(self, **params):
+        """
+        Renders the query with values for all of its parameters.
+
+        Parameters:
+            **params: A value for every parameter slot, e.g. low=30, high=60.
+
+        Returns:
+            str: The WCPS query.
+
+        Raises:
+            ValueError: If a parameter is missing or unknown, or a string value holds unsafe characters.
+            TypeError: If a value is neither a string nor a number.
+
+        Example:
+            >>> prepared = datacube.subset('Lat(${low}:${high})', '$c').avg().prepare()
+            >>> prepared.bind(low=30, high=60)
+            'for $c in (AvgLandTemp)\\nreturn \\navg($c[Lat(30:60)] )'
+        """
+        if len(params) != len(self.parameters) or not all(name in params for name in self.parameters):
+            missing = [name for name in self.parameters if name not in params]
+            raise ValueError(f"Parameters don't match the query: missing {missing}, unknown {sorted(set(params) - set(self.parameters))}.")
+        values = {name: format_parameter(value) for name, value in params.items()}
+        parts = self.parts[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = values[parts[index]]
+        return ''.join(parts)
+
+    def bind_many(self, param_sets):
+        """
+        Renders the query once per parameter set.
+
+        Parameters:
+            param_sets (iterable of dict): The parameter sets.
+
+        Returns:
+            list of str: The WCPS queries, in the order of the parameter sets.
+        """
+        return [self.bind(**params) for params in param_sets]
+
+    def execute(self, return_type=None, **params):
+        """
+        Binds the parameters, sends the query and decodes the result like Datacube.execute().
+
+        Returns:
+            The decoded result, see Datacube.decode_response().
+        """
+        response = self.dbc.send_query(self.bind(**params))
+        return self.decoder(response.content, return_type=return_type, **self.settings)
+
+    def execute_many(self, param_sets, max_workers=4, return_type=None):
+        """
+        Executes the query for many parameter sets, with at most max_workers queries in flight.
+            All queries are rendered before the first one is sent, so a bad parameter set fails early.
+
+        Parameters:
+            param_sets (iterable of dict): The parameter sets.
+            max_workers (int, optional): The number of queries sent at the same time.
+            return_type (str, optional): How numeric results are returned, see Datacube.decode_response().
+
+        Returns:
+            list: The results, in the order of the parameter sets.
+
+        Raises:
+            TypeError: If max_workers is not an integer.
+            ValueError: If max_workers is smaller than 1 or a parameter set doesn't match the query.
+
+        Example:
+            >>> prepared.execute_many([{'low': 0, 'high': 30}, {'low': 30, 'high': 60}], max_workers=8)
+            [[12.1], [4.3]]
+        """
+        if not isinstance(max_workers, int) or isinstance(max_workers, bool):
+            raise TypeError("Number of workers must be an integer.")
+        if max_workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        queries = self.bind_many(param_sets)
+
+        def run(wcps_query):
+            response = self.dbc.send_query(wcps_query)
+            return self.decoder(response.content, return_type=return_type, **self.settings)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wcps-prepared') as executor:
+            return list(executor.map(run, queries))
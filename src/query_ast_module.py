@@ -0,0 +1,285 @@
+import functools
+import re
+from query_fingerprint_module import fingerprint_query
+
+# String literals are matched as a whole so that '$' inside them is never taken for a variable
+VARIABLE_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|\$[A-Za-z_][A-Za-z0-9_]*')
+
+@functools.lru_cache(maxsize=1024)
+def variable_index(subsets):
+    """
+    Maps every variable with a subset to its subsetted form, e.g. '$c' to '$c[Lat(0:10)]'.
+        The first subset of a variable wins.
+    """
+    index = {}
+    for var, subset in subsets:
+        if subset is not None:
+            index.setdefault(var, f'{var}[{subset}]')
+    return index
+
+def substitute_variables(expression, subsets):
+    """
+    Replaces the variables of an expression with their subsets, e.g. '$c' with '$c[Lat(0:10)]', in one
+        pass over the expression. Only whole variable names are replaced, so '$c' doesn't match in '$c1',
+        and string literals are left alone.
+
+    Parameters:
+        expression (str): The expression.
+        subsets (tuple): Pairs of variable names and subsets (None for variables without a subset).
+
+    Returns:
+        str: The expression with the variables replaced.
+
+    Example:
+        >>> substitute_variables('$c + $c1', (('$c', 'Lat(1)'), ('$c1', 'Lat(2)')))
+        '$c[Lat(1)] + $c1[Lat(2)]'
+    """
+    index = variable_index(tuple(subsets))
+    if not index:
+        return expression
+    return VARIABLE_TOKEN_PATTERN.sub(lambda match: index.get(match.group(), match.group()), expression)
+
+class Node:
+    __slots__ = ('_hash',)
+    # The names of the attributes that make up a node, in the order of the constructor arguments
+    fields = ()
+
+    def __init__(self, *values):
+        """
+        Base of the immutable query tree nodes. Nodes compare and hash by their fields, so equal
+            trees share cache entries, and can't be changed after they are built; use replace()
+            to derive a variant.
+        """
+        for name, value in zip(self.fields, values):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_hash', hash((type(self),) + self.values()))
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable.")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._hash == other._hash and self.values() == other.values()
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(repr(value) for value in self.values())})"
+
+    def replace(self, **changes):
+        """
+        Builds a copy of the node with some fields changed; the unchanged fields are shared.
+
+        Raises:
+            TypeError: If a field doesn't exist.
+
+        Example:
+            >>> query.replace(where='$c > 0')
+        """
+        unknown = set(changes) - set(self.fields)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} has no field {sorted(unknown)[0]}.")
+        return type(self)(*(changes.get(name, getattr(self, name)) for name in self.fields))
+
+    def render(self, subsets):
+        """
+        Writes the node as WCPS text, with variables replaced by the subsets of the query.
+        """
+        raise NotImplementedError
+
+class Binding(Node):
+    __slots__ = ('variable', 'coverages')
+    fields = ('variable', 'coverages')
+
+    def __init__(self, variable, coverages=None):
+        """
+        A variable of the for clause iterating over coverages, e.g. $c in (AvgLandTemp).
+
+        Parameters:
+            variable (str): The variable with its '$', or the whole binding text if coverages is None.
+            coverages (tuple of str, optional): The coverage names.
+        """
+        super().__init__(variable, tuple(coverages) if coverages is not None else None)
+
+    @classmethod
+    def from_text(cls, text):
+        """
+        Parses a binding written as '$var in (Coverage)'. Other text is kept as it is.
+        """
+        match = re.fullmatch(r'(\$[a-zA-Z_][a-zA-Z0-9_]*) in \((.*)\)', text, re.DOTALL)
+        if match is None:
+            return cls(text)
+        return cls(match.group(1), (match.group(2),))
+
+    def render(self, subsets=()):
+        if self.coverages is None:
+            return self.variable
+        return f'{self.variable} in ({",".join(self.coverages)})'
+
+class VariableList(Node):
+    __slots__ = ()
+
+    def __init__(self):
+        """
+        Every variable of the query with its subset, what a query without an expression returns.
+        """
+        super().__init__()
+
+    def render(self, subsets):
+        return ''.join(f'{var}[{subset}] ' if subset is not None else var for var, subset in subsets)
+
+class Expression(Node):
+    __slots__ = ('text',)
+    fields = ('text',)
+
+    def __init__(self, text):
+        """
+        An expression written by the user, e.g. 'abs($c - 200)'. Its variables are replaced by their subsets.
+        """
+        super().__init__(text)
+
+    def render(self, subsets):
+        return substitute_variables(self.text, subsets)
+
+class RawExpression(Node):
+    __slots__ = ('text',)
+    fields = ('text',)
+
+    def __init__(self, text):
+        """
+        An expression that is written as it is, without replacing variables, e.g. a switch statement.
+        """
+        super().__init__(text)
+
+    def render(self, subsets):
+        return self.text
+
+class Aggregation(Node):
+    __slots__ = ('operation', 'operand')
+    fields = ('operation', 'operand')
+
+    # The aggregations WCPS offers, in the spelling Datacube uses
+    OPERATIONS = ('MIN', 'MAX', 'AVG', 'SUM', 'COUNT')
+
+    def __init__(self, operation, operand):
+        """
+        An aggregation such as avg($c[Lat(0:10)]).
+
+        Parameters:
+            operation (str): One of 'MIN', 'MAX', 'AVG', 'SUM' and 'COUNT'.
+            operand (Node): The aggregated expression.
+
+        Raises:
+            ValueError: If the operation is not recognized.
+        """
+        if operation not in self.OPERATIONS:
+            raise ValueError("Specified aggregation operation not recognized.")
+        super().__init__(operation, operand)
+
+    def render(self, subsets):
+        return f'{self.operation.lower()}({self.operand.render(subsets)})'
+
+class Struct(Node):
+    __slots__ = ('items',)
+    fields = ('items',)
+
+    def __init__(self, items):
+        """
+        A composite value with named fields, e.g. {min: min($c); max: max($c)}.
+
+        Parameters:
+            items (tuple): Pairs of field names and nodes.
+        """
+        super().__init__(tuple((key, node) for key, node in items))
+
+    def render(self, subsets):
+        return '{' + '; '.join(f'{key}: {node.render(subsets)}' for key, node in self.items) + '}'
+
+class Encode(Node):
+    __slots__ = ('operand', 'mime_type')
+    fields = ('operand', 'mime_type')
+
+    def __init__(self, operand, mime_type):
+        """
+        The encoding of a result into a format, e.g. encode($c, "text/csv").
+        """
+        super().__init__(operand, mime_type)
+
+    def render(self, subsets):
+        return f'encode({self.operand.render(subsets)}, "{self.mime_type}")'
+
+class Query(Node):
+    __slots__ = ('bindings', 'subsets', 'where', 'result', 'lets')
+    fields = ('bindings', 'subsets', 'where', 'result', 'lets')
+
+    def __init__(self, bindings, subsets, where, result, lets=()):
+        """
+        A whole WCPS query: for bindings, optional let bindings, an optional where condition and the returned expression.
+
+        Parameters:
+            bindings (tuple of Binding): The variables of the for clause.
+            subsets (tuple): Pairs of variable names and their subsets (None without a subset).
+            where (str or None): The where condition.
+            result (Node): The returned expression.
+            lets (tuple, optional): Pairs of variable names and the expressions bound to them with let.
+
+        Example:
+            >>> query = Query((Binding('$c', ('AvgLandTemp',)),), (('$c', 'Lat(0:10)'),), None, Aggregation('AVG', VariableList()))
+            >>> query.render()
+            'for $c in (AvgLandTemp)\\nreturn \\navg($c[Lat(0:10)] )'
+        """
+        super().__init__(tuple(bindings), tuple((var, subset) for var, subset in subsets), where, result,
+                         tuple((var, expression) for var, expression in lets))
+
+    def with_subset(self, var, subset):
+        """
+        Builds a variant of the query with the subset of one variable replaced.
+
+        Raises:
+            ValueError: If the variable is not part of the query.
+        """
+        names = [name for name, _ in self.subsets]
+        if var not in names:
+            raise ValueError("Variable name does not exist.")
+        index = names.index(var)
+        return self.replace(subsets=self.subsets[:index] + ((var, subset),) + self.subsets[index + 1:])
+
+    def render_for_clause(self):
+        """
+        Writes the part of the query up to and including 'return'.
+        """
+        # Bindings of several variables are separated by commas
+        text = 'for ' + ',\n'.join(binding.render() for binding in self.bindings) + '\n'
+        if self.lets:
+            text += 'let ' + ',\n'.join(f'{var} := {expression}' for var, expression in self.lets) + '\n'
+        if self.where is not None:
+            text += f'where {self.where}\n'
+        return text + 'return \n'
+
+    def render(self, subsets=None):
+        """
+        Writes the query as WCPS text. The text is memoized, so rendering an equal query again is a lookup.
+        """
+        return render_query(self)
+
+    def fingerprint(self):
+        """
+        Computes the canonical fingerprint of the query, see fingerprint_query().
+        """
+        return fingerprint_query(render_query(self))
+
+@functools.lru_cache(maxsize=4096)
+def render_query(query):
+    """
+    Writes a Query as WCPS text, memoized on the (hashable) query tree.
+
+    Returns:
+        str: The WCPS query.
+    """
+    return query.render_for_clause() + query.result.render(query.subsets)
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from query_fingerprint_module import fingerprint_query
+
+class CachedResponse:
+    def __init__(self, content):
+        """
+        Stands in for a requests Response when a query is answered from the cache, so callers
+            read the same bytes through the same decode path.
+
+        Parameters:
+            content (bytes): The cached body of the server's response.
+        """
+        self.content = content
+        self.status_code = 200
+        self.from_cache = True
+
+    def iter_content(self, chunk_size=1):
+        """
+        Yields the cached body in chunks, like Response.iter_content().
+        """
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+class QueryCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, default_ttl=None, coverage_ttls=None, clock=time.time,
+                 max_disk_bytes=1024 * 1024 * 1024):
+        """
+        Initializes a cache of raw query results, keyed on the endpoint and the canonical fingerprint
+            of the query text, so that equivalent spellings of a query share one entry.
+            The in-memory tier evicts least recently used entries once max_bytes is exceeded; the optional
+            on-disk tier keeps entries across restarts until they expire or max_disk_bytes is exceeded,
+            when the least recently used ones are deleted. Files are read and written outside of the
+            cache lock, so a slow disk doesn't hold up lookups in memory.
+
+        Parameters:
+            max_bytes (int, optional): The maximum total size of the responses kept in memory.
+            directory (str, optional): A directory for the on-disk tier. If None, only memory is used.
+            default_ttl (float, optional): Seconds an entry stays valid. If None, entries don't expire.
+            coverage_ttls (dict, optional): Coverage names mapped to their own TTLs in seconds. A query over
+                several coverages uses the shortest of their TTLs.
+            clock (callable, optional): Returns the current time in seconds; wall-clock time by default,
+                so that on-disk expiry times stay meaningful after a restart.
+            max_disk_bytes (int, optional): The maximum total size of the responses kept on disk, 1 GiB by
+                default. If None, the disk tier is only bounded by expiry.
+
+        Raises:
+            TypeError: If max_bytes or max_disk_bytes is not an integer or coverage_ttls is not a dict.
+            ValueError: If max_bytes or max_disk_bytes is negative.
+
+        Example:
+            >>> cache = QueryCache(max_bytes=16 * 1024 * 1024, directory='.wcps_cache', coverage_ttls={'AvgLandTemp': 3600})
+            >>> dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows", cache=cache)
+        """
+        if not isinstance(max_bytes, int) or isinstance(max_bytes, bool):
+            raise TypeError("Cache size must be an integer.")
+        if max_bytes < 0:
+            raise ValueError("Cache size can't be negative.")
+        if max_disk_bytes is not None:
+            if not isinstance(max_disk_bytes, int) or isinstance(max_disk_bytes, bool):
+                raise TypeError("Disk cache size must be an integer.")
+            if max_disk_bytes < 0:
+                raise ValueError("Disk cache size can't be negative.")
+        if coverage_ttls is not None and not isinstance(coverage_ttls, dict):
+            raise TypeError("Coverage TTLs must be a dict.")
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.default_ttl = default_ttl
+        self.coverage_ttls = dict(coverage_ttls or {})
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (content, expires_at), least recently used first
+        self.current_bytes = 0
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_entries = OrderedDict()  # key -> size of the stored response, least recently used first
+        self.disk_bytes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0, 'expirations': 0}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._index_disk()
+
+    def make_key(self, endpoint, wcps_query, fingerprint=None):
+        """
+        Builds the cache key of a query sent to an endpoint from its fingerprint_query() digest.
+
+        Parameters:
+            endpoint (str): The URL the query is sent to.
+            wcps_query (str): The query text.
+            fingerprint (str, optional): The fingerprint of the query, if the caller already computed it.
+
+        Returns:
+            str: A hex digest that is also safe to use as a file name.
+        """
+        if fingerprint is None:
+            fingerprint = fingerprint_query(wcps_query)
+        return hashlib.sha256(f'{endpoint}\0{fingerprint}'.encode('utf-8')).hexdigest()
+
+    def ttl_for(self, wcps_query):
+        """
+        Determines how long the result of a query stays valid, from the coverages it reads.
+
+        Returns:
+            float or None: The TTL in seconds, or None if the result doesn't expire.
+        """
+        coverages = re.findall(r'\$[a-zA-Z_][a-zA-Z0-9_]*\s+in\s*\(([^)]*)\)', wcps_query)
+        names = {name.strip() for group in coverages for name in group.split(',')}
+        ttls = [self.coverage_ttls[name] for name in names if name in self.coverage_ttls]
+        if ttls:
+            return min(ttls)
+        return self.default_ttl
+
+    def get(self, endpoint, wcps_query, fingerprint=None):
+        """
+        Looks a query up, first in memory and then on disk. Entries found on disk are moved into memory.
+            The fingerprint of the query can be given to save computing it again, see make_key().
+
+        Returns:
+            bytes or None: The cached response body, or None on a miss.
+        """
+        key = self.make_key(endpoint, wcps_query, fingerprint)
+        now = self.clock()
+        with self._lock:
+            if key in self.entries:
+                content, expires_at = self.entries[key]
+                if expires_at is None or expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return content
+                self._remove(key)
+                self.stats['expirations'] += 1
+        # The files are read without holding the lock
+        entry = self._read_disk(key, now) if self.directory is not None else None
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            # Entries written by another process sharing the directory are taken into the budget
+            if key not in self.disk_entries:
+                self.disk_entries[key] = len(entry[0])
+                self.disk_bytes += len(entry[0])
+            self.disk_entries.move_to_end(key)
+            self._store(key, *entry)
+            return entry[0]
+
+    def put(self, endpoint, wcps_query, content, fingerprint=None):
+        """
+        Stores the response body of a query in memory and, if configured, on disk. The fingerprint of the
+            query can be given to save computing it again, see make_key().
+        """
+        key = self.make_key(endpoint, wcps_query, fingerprint)
+        ttl = self.ttl_for(wcps_query)
+        expires_at = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            self._store(key, content, expires_at)
+        if self.directory is None or (self.max_disk_bytes is not None and len(content) > self.max_disk_bytes):
+            return
+        self._write_disk(key, content, expires_at)
+        with self._lock:
+            self._forget_disk(key)
+            self.disk_entries[key] = len(content)
+            self.disk_bytes += len(content)
+            evicted = []
+            while self.max_disk_bytes is not None and self.disk_bytes > self.max_disk_bytes:
+                evicted_key = next(iter(self.disk_entries))
+                self._forget_disk(evicted_key)
+                evicted.append(evicted_key)
+                self.stats['disk_evictions'] += 1
+        for evicted_key in evicted:
+            self._delete_files(evicted_key)
+
+    def clear(self):
+        """
+        Removes every entry from memory and disk. The counters are kept.
+        """
+        with self._lock:
+            self.entries.clear()
+            self.current_bytes = 0
+            self.disk_entries.clear()
+            self.disk_bytes = 0
+        if self.directory is not None:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(('.bin', '.json')):
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except FileNotFoundError:
+                        pass
+
+    def _store(self, key, content, expires_at):
+        if key in self.entries:
+            self._remove(key)
+        # A response larger than the whole memory tier would only evict everything else
+        if len(content) > self.max_bytes:
+            return
+        self.entries[key] = (content, expires_at)
+        self.current_bytes += len(content)
+        while self.current_bytes > self.max_bytes:
+            evicted_key, _ = next(iter(self.entries.items()))
+            self._remove(evicted_key)
+            self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        content, _ = self.entries.pop(key)
+        self.current_bytes -= len(content)
+
+    def _forget_disk(self, key):
+        size = self.disk_entries.pop(key, None)
+        if size is not None:
+            self.disk_bytes -= size
+
+    def _index_disk(self):
+        # Entries of earlier runs, least recently used (by modification time) first
+        found = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.bin'):
+                try:
+                    info = os.stat(os.path.join(self.directory, file_name))
+                except OSError:
+                    continue
+                found.append((info.st_mtime, file_name[:-len('.bin')], info.st_size))
+        for _, key, size in sorted(found):
+            self.disk_entries[key] = size
+            self.disk_bytes += size
+
+    def _delete_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _paths(self, key):
+        return os.path.join(self.directory, key + '.bin'), os.path.join(self.directory, key + '.json')
+
+    def _read_disk(self, key, now):
+        # Called without the lock; the index is only changed under it
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as meta_file:
+                expires_at = json.load(meta_file)['expires_at']
+            if expires_at is not None and expires_at <= now:
+                with self._lock:
+                    self._forget_disk(key)
+                    self.stats['expirations'] += 1
+                self._delete_files(key)
+                return None
+            with open(data_path, 'rb') as data_file:
+                content = data_file.read()
+            # Marks the entry as recently used for the eviction order after a restart
+            os.utime(data_path)
+            return content, expires_at
+        except (OSError, ValueError, KeyError):
+            # Missing or half-written entries count as misses
+            with self._lock:
+                self._forget_disk(key)
+            return None
+
+    def _write_disk(self, key, content, expires_at):
+        # Called without the lock; concurrent writers of the same entry each rename complete files
+        data_path, meta_path = self._paths(key)
+        # Written to temporary files and renamed, so readers never see a partial entry
+        for path, payload in [(data_path, content), (meta_path, json.dumps({'expires_at': expires_at}).encode('utf-8'))]:
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(payload)
+            os.replace(temp_path, path)
@@ -0,0 +1,195 @@
+import hashlib
+import re
+
+# One alternative per token kind; string literals are kept verbatim, whitespace is dropped
+TOKEN_PATTERN = re.compile(r'''
+    (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<variable>\$[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<space>\s+)
+  | (?P<operator>[<>!=]=|.)
+''', re.VERBOSE | re.DOTALL)
+
+# WCPS keywords are case-insensitive, coverage and axis names are not
+KEYWORDS = {'for', 'in', 'where', 'return', 'encode', 'and', 'or', 'xor', 'not', 'switch', 'case', 'default',
+            'end', 'let', 'coverage', 'over', 'values', 'condense', 'using', 'min', 'max', 'avg', 'sum', 'count',
+            'some', 'all', 'abs', 'sqrt', 'exp', 'log', 'ln', 'pow', 'clip', 'crsTransform', 'imageCrsDomain',
+            'domain', 'extend', 'scale'}
+LOWER_KEYWORDS = {keyword.lower() for keyword in KEYWORDS}
+
+def tokenize_query(wcps_query):
+    """
+    Splits a WCPS query into tokens, dropping whitespace, lower-casing keywords and writing
+        numeric literals in one canonical form. Names in the positions of coverage, axis and field
+        names keep their case even if they are spelled like a keyword, since a coverage named Count
+        is not the coverage count: the coverages of a for binding, the axis labels of a subset, the
+        name after 'coverage', the axes of an 'over' clause and names followed by ':'.
+
+    Parameters:
+        wcps_query (str): The WCPS query.
+
+    Returns:
+        list of str: The tokens.
+
+    Example:
+        >>> tokenize_query('FOR $c in (AvgLandTemp) return avg($c[Lat(53.080)])')
+        ['for', '$c', 'in', '(', 'AvgLandTemp', ')', 'return', 'avg', '(', '$c', '[', 'Lat', '(', '53.08', ')', ']', ')']
+    """
+    matches = [(match.lastgroup, match.group()) for match in TOKEN_PATTERN.finditer(wcps_query) if match.lastgroup != 'space']
+    tokens = []
+    # Open brackets, with True for the parentheses of a for binding, whose names are all coverage names
+    brackets = []
+    for index, (kind, text) in enumerate(matches):
+        previous = tokens[-1] if tokens else None
+        if kind == 'name' and text.lower() in LOWER_KEYWORDS:
+            following = matches[index + 1][1] if index + 1 < len(matches) else None
+            is_name = (True in brackets or following == ':' or previous == 'coverage'
+                       or (previous is not None and previous.startswith('$') and following == '(' and text.lower() != 'in')
+                       or (bool(brackets) and brackets[-1] == '[' and previous in ('[', ',')))
+            if not is_name:
+                text = text.lower()
+        elif kind == 'number':
+            # Integers and decimals are kept apart, since WCPS types them differently
+            if re.fullmatch(r'\d+', text):
+                text = str(int(text))
+            else:
+                text = repr(float(text))
+        if text in ('(', '[', '{'):
+            brackets.append(True if text == '(' and previous == 'in' else text)
+        elif text in (')', ']', '}') and brackets:
+            brackets.pop()
+        tokens.append(text)
+    return tokens
+
+def find_closing(tokens, start, opening, closing):
+    """
+    Returns the index of the token closing the bracket opened at start, or None if it is never closed.
+    """
+    depth = 0
+    for index in range(start, len(tokens)):
+        if tokens[index] == opening:
+            depth += 1
+        elif tokens[index] == closing:
+            depth -= 1
+            if depth == 0:
+                return index
+    return None
+
+def split_top_level(tokens):
+    """
+    Splits tokens at the commas that aren't nested in any bracket.
+    """
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token in '([{':
+            depth += 1
+        elif token in ')]}':
+            depth -= 1
+        if token == ',' and depth == 0:
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+def sort_subsets(tokens):
+    """
+    Orders the axis subsets inside every pair of square brackets by axis name, since
+        $c[Lat(0:10), Long(5)] and $c[Long(5), Lat(0:10)] select the same cells.
+    """
+    result = []
+    index = 0
+    while index < len(tokens):
+        end = find_closing(tokens, index, '[', ']') if tokens[index] == '[' else None
+        if end is None:
+            result.append(tokens[index])
+            index += 1
+            continue
+        items = split_top_level(sort_subsets(tokens[index + 1:end]))
+        # Only lists made entirely of Axis(...) items are reordered
+        if all(len(item) > 2 and re.fullmatch(r'[A-Za-z_]\w*', item[0]) and item[1] == '(' and item[-1] == ')'
+               for item in items):
+            items = sorted(items, key=lambda item: item[0])
+        result.append('[')
+        for position, item in enumerate(items):
+            if position:
+                result.append(',')
+            result.extend(item)
+        result.append(']')
+        index = end + 1
+    return result
+
+def sort_bindings(tokens):
+    """
+    Orders the bindings of the leading for clause by the coverages they iterate over. Bindings are
+        independent of each other, so their order doesn't change the result.
+    """
+    if not tokens or tokens[0] != 'for':
+        return tokens
+    depth = 0
+    for end in range(1, len(tokens)):
+        if tokens[end] in '([{':
+            depth += 1
+        elif tokens[end] in ')]}':
+            depth -= 1
+        elif depth == 0 and tokens[end] in ('where', 'return'):
+            break
+    else:
+        return tokens
+    bindings = split_top_level(tokens[1:end])
+    # The variable name is left out of the sort key, it is renamed afterwards anyway
+    bindings = sorted(bindings, key=lambda binding: binding[1:])
+    result = ['for']
+    for position, binding in enumerate(bindings):
+        if position:
+            result.append(',')
+        result.extend(binding)
+    return result + tokens[end:]
+
+def canonicalize_query(wcps_query):
+    """
+    Rewrites a WCPS query into a canonical form, so that queries which only differ in whitespace,
+        keyword case, variable names, the order of for bindings or axis subsets, or the spelling of
+        numeric literals become the same string. Only rewrites that can't change the result are applied;
+        operands of arithmetic are not reordered, as that could change floating point rounding.
+
+    Parameters:
+        wcps_query (str): The WCPS query.
+
+    Returns:
+        str: The canonical query text, tokens separated by single spaces.
+
+    Raises:
+        TypeError: If wcps_query is not a string.
+
+    Example:
+        >>> canonicalize_query('for $c1 in (AvgLandTemp) return $c1[Long(8.80), Lat(53.08)]')
+        'for $v0 in ( AvgLandTemp ) return $v0 [ Lat ( 53.08 ) , Long ( 8.8 ) ]'
+    """
+    if not isinstance(wcps_query, str):
+        raise TypeError("Value entered must be a string.")
+    tokens = sort_bindings(sort_subsets(tokenize_query(wcps_query)))
+    # Alpha-renaming: variables are numbered in order of first appearance
+    names = {}
+    for index, token in enumerate(tokens):
+        if token.startswith('$'):
+            tokens[index] = names.setdefault(token, f'$v{len(names)}')
+    return ' '.join(tokens)
+
+def fingerprint_query(wcps_query):
+    """
+    Computes a fingerprint of a WCPS query that is equal for all queries with the same canonical form.
+
+    Parameters:
+        wcps_query (str): The WCPS query.
+
+    Returns:
+        str: The SHA-256 hex digest of canonicalize_query(wcps_query).
+
+    Example:
+        >>> fingerprint_query('for $c in (AvgLandTemp) return 1') == fingerprint_query('FOR  $x IN (AvgLandTemp)\nreturn 1')
+        True
+    """
+    return hashlib.sha256(canonicalize_query(wcps_query).encode('utf-8')).hexdigest()
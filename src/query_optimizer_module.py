@@ -0,0 +1,458 @@
+import functools
+import itertools
+import math
+import re
+from query_ast_module import Query, RawExpression
+from subset_module import AxisSubset, parse_subset, format_subset
+
+# Tokens of an expression; spaces are dropped but every token keeps its position in the text
+TOKEN_PATTERN = re.compile(r'''
+    (?P<string>"(?:[^"\\]|\\.)*")
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    |(?P<name>\$?[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<op>[-+*/])
+    |(?P<comparison><=|>=|!=|<|>|=)
+    |(?P<space>\s+)
+    |(?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+# Variable names, including the ones bound with let
+VARIABLE_NAMES = re.compile(r'\$[A-Za-z_][A-Za-z0-9_]*')
+
+# Functions that work cell by cell, so trimming their result is the same as trimming their arguments
+CELLWISE_FUNCTIONS = {'abs', 'sqrt', 'exp', 'log', 'ln', 'pow', 'sin', 'cos', 'tan', 'sinh', 'cosh', 'tanh',
+                      'arcsin', 'arccos', 'arctan', 'round', 'floor', 'ceil', 'not', 'and', 'or', 'xor', 'bit'}
+
+# Names given to common subexpressions bound with let
+LET_PREFIX = '$e'
+
+def tokenize(text):
+    """
+    Splits an expression into (kind, text, start, end) tokens, leaving out spaces.
+    """
+    return [(match.lastgroup, match.group(), match.start(), match.end())
+            for match in TOKEN_PATTERN.finditer(text) if match.lastgroup != 'space']
+
+def evaluate(numbers, operators):
+    """
+    Computes a run of numbers joined by + - * /, with * and / binding tighter.
+
+    Returns:
+        str or None: The value as text, or None if it can't be computed or written as a WCPS number
+            (division by zero, infinite or NaN operands and results).
+    """
+    values = [float(number) if any(c in number for c in '.eE') else int(number) for number in numbers]
+    if any(isinstance(value, float) and not math.isfinite(value) for value in values):
+        return None
+    terms, signs = [values[0]], []
+    for operator, value in zip(operators, values[1:]):
+        if operator in '+-':
+            signs.append(operator)
+            terms.append(value)
+        elif operator == '*':
+            terms[-1] = terms[-1] * value
+        elif value == 0:
+            return None
+        else:
+            terms[-1] = terms[-1] / value
+    result = terms[0]
+    for sign, term in zip(signs, terms[1:]):
+        result = result + term if sign == '+' else result - term
+    if isinstance(result, float) and not math.isfinite(result):
+        return None
+    return str(result) if isinstance(result, int) else repr(result)
+
+def foldable_span(tokens):
+    """
+    Finds the first part of an expression that only combines number literals and can be replaced by
+        its value without changing how the rest of the expression groups.
+
+    Returns:
+        tuple or None: The start and end position in the text and the value, or None.
+    """
+    for i, (kind, text, start, end) in enumerate(tokens):
+        previous = tokens[i - 1] if i > 0 else None
+        # A parenthesized number that isn't a function argument, e.g. (7) * 2
+        if (text == '(' and i + 2 < len(tokens) and tokens[i + 1][0] == 'number' and tokens[i + 2][1] == ')'
+                and (previous is None or previous[0] != 'name')):
+            return start, tokens[i + 2][3], tokens[i + 1][1]
+        if kind != 'number':
+            continue
+        last = i
+        while last + 2 < len(tokens) and tokens[last + 1][0] == 'op' and tokens[last + 2][0] == 'number':
+            last += 2
+        # Besides the whole run, its leading products alone, e.g. 4 * 5 in $c - 4 * 5 + 1
+        ends = [last]
+        product_end = i
+        while product_end + 2 <= last and tokens[product_end + 1][1] in '*/':
+            product_end += 2
+        if product_end not in (i, last):
+            ends.append(product_end)
+        for end_index in ends:
+            if end_index == i:
+                continue
+            operators = [tokens[k][1] for k in range(i + 1, end_index, 2)]
+            products_only = all(operator in '*/' for operator in operators)
+            following = tokens[end_index + 1] if end_index + 1 < len(tokens) else None
+            # A neighbouring operator must not bind one of the numbers tighter than the run itself does
+            if previous is not None and previous[0] == 'op' and not (previous[1] in '+-' and products_only):
+                continue
+            if following is not None and following[0] == 'op' and not (following[1] in '+-' or products_only):
+                continue
+            value = evaluate([tokens[k][1] for k in range(i, end_index + 1, 2)], operators)
+            if value is not None:
+                return start, tokens[end_index][3], value
+    return None
+
+def fold_constants(text):
+    """
+    Replaces arithmetic on number literals, as written by expression_builder.Scalar, with its value,
+        e.g. '$c > 10 + 5 * 2' with '$c > 20'.
+    """
+    while True:
+        span = foldable_span(tokenize(text))
+        if span is None:
+            return text
+        start, end, value = span
+        text = text[:start] + value + text[end:]
+
+def closing(text, position):
+    """
+    Returns the position after the bracket or parenthesis that closes the one at position, skipping
+        string literals, or None if it isn't closed.
+    """
+    pairs = {'(': ')', '[': ']', '{': '}'}
+    stack = []
+    index = position
+    while index < len(text):
+        char = text[index]
+        if char == '"':
+            match = TOKEN_PATTERN.match(text, index)
+            index = match.end() if match.lastgroup == 'string' else len(text)
+            continue
+        if char in pairs:
+            stack.append(pairs[char])
+        elif stack and char == stack[-1]:
+            stack.pop()
+            if not stack:
+                return index + 1
+        elif char in ')]}':
+            return None
+        index += 1
+    return None
+
+def bracket_groups(text, position):
+    """
+    Returns the end of the [...] groups that directly follow position, and their contents.
+    """
+    groups = []
+    while position < len(text) and text[position] == '[':
+        end = closing(text, position)
+        if end is None:
+            break
+        groups.append(text[position + 1:end - 1])
+        position = end
+    return position, groups
+
+def merge_subsets(first, second):
+    """
+    Combines two subsets applied one after the other, e.g. $c[Lat(0:10)][Lat(2:5)], into one.
+
+    Returns:
+        str or None: The combined subset, or None if the second subset isn't within the first.
+    """
+    if first == second:
+        return first
+    try:
+        outer, inner = parse_subset(first), parse_subset(second)
+    except ValueError:
+        return None
+    merged = {axis.axis: axis for axis in outer}
+    if len(merged) != len(outer):
+        return None
+    for axis in inner:
+        current = merged.get(axis.axis)
+        if current is None:
+            merged[axis.axis] = axis
+            continue
+        if current.is_slice or current.crs != axis.crs:
+            return None
+        bounds = [axis.low] if axis.is_slice else [axis.low, axis.high]
+        for bound in bounds:
+            if bound is None:
+                continue
+            if isinstance(bound, float) and isinstance(current.low, (float, type(None))) \
+                    and isinstance(current.high, (float, type(None))):
+                if (current.low is not None and bound < current.low) or (current.high is not None and bound > current.high):
+                    return None
+            elif bound not in (current.low, current.high):
+                return None
+        if axis.is_slice:
+            merged[axis.axis] = axis
+        else:
+            low = axis.low if axis.low is not None else current.low
+            high = axis.high if axis.high is not None else current.high
+            merged[axis.axis] = AxisSubset(axis.axis, low, high, axis.crs, trim=True)
+    return format_subset(list(merged.values()))
+
+def merge_subset_chains(text):
+    """
+    Replaces variables subsetted several times in a row with a single subset, e.g. the
+        $c[Lat(0:10)][Lat(0:10)] written when a subsetted variable is subsetted again in an expression.
+    """
+    result = []
+    position = 0
+    for kind, name, start, end in tokenize(text):
+        if kind != 'name' or not name.startswith('$') or start < position:
+            continue
+        group_end, groups = bracket_groups(text, end)
+        if len(groups) < 2:
+            continue
+        merged = groups[0]
+        for group in groups[1:]:
+            merged = merge_subsets(merged, group) if merged is not None else None
+        if merged is None:
+            continue
+        result.append(text[position:end] + f'[{merged}]')
+        position = group_end
+    return ''.join(result) + text[position:]
+
+def push_trims(text):
+    """
+    Moves trims of parenthesized cell by cell expressions onto the variables inside them, e.g.
+        ($c - $d)[Lat(0:10)] becomes ($c[Lat(0:10)] - $d[Lat(0:10)]), so the server only reads the trimmed
+        cells of each coverage instead of computing over whole coverages first.
+    """
+    while True:
+        pushed = push_trim(text)
+        if pushed == text:
+            return text
+        text = pushed
+
+def push_trim(text):
+    """
+    Moves the first trim push_trims() can move, see there.
+    """
+    tokens = tokenize(text)
+    for i, (kind, token, start, end) in enumerate(tokens):
+        if token != '(' or (i > 0 and tokens[i - 1][0] == 'name'):
+            continue
+        paren_end = closing(text, start)
+        if paren_end is None:
+            continue
+        group_end, groups = bracket_groups(text, paren_end)
+        if not groups:
+            continue
+        inner = text[start + 1:paren_end - 1]
+        inner_tokens = tokenize(inner)
+        # The subsets of the variables inside are left out of the checks
+        outside, position = [], 0
+        for inner_kind, name, var_start, var_end in inner_tokens:
+            if var_start < position:
+                continue
+            outside.append((inner_kind, name))
+            if inner_kind == 'name' and name.startswith('$'):
+                position, _ = bracket_groups(inner, var_end)
+        # Aggregations, encodings and the like change the shape, so only cell by cell expressions are moved
+        if not any(inner_kind == 'name' and name.startswith('$') for inner_kind, name in outside) \
+                or any(inner_kind == 'name' and not name.startswith('$') and name not in CELLWISE_FUNCTIONS
+                       or inner_kind in ('string', 'other') and name not in '(),' for inner_kind, name in outside):
+            continue
+        trim = ''.join(f'[{group}]' for group in groups)
+        pushed = []
+        position = 0
+        for kind, name, var_start, var_end in inner_tokens:
+            if kind == 'name' and name.startswith('$') and var_start >= position:
+                var_groups_end, _ = bracket_groups(inner, var_end)
+                pushed.append(inner[position:var_groups_end] + trim)
+                position = var_groups_end
+        pushed.append(inner[position:])
+        return text[:start] + '(' + ''.join(pushed) + ')' + text[group_end:]
+    return text
+
+def iterator_scopes(text, tokens):
+    """
+    Finds the parts of an expression in which condense and coverage constructors bind their own iterator
+        variables: from 'over' to the end of the enclosing parentheses, or of the expression.
+
+    Returns:
+        list of tuple: The start and end position of every scope.
+    """
+    scopes = []
+    for i, (kind, token, start, _) in enumerate(tokens):
+        if kind != 'name' or token.lower() != 'over':
+            continue
+        depth, scope_end = 0, len(text)
+        for _, other, other_start, _ in tokens[i + 1:]:
+            if other in '([{':
+                depth += 1
+            elif other in ')]}':
+                if depth == 0:
+                    scope_end = other_start
+                    break
+                depth -= 1
+        scopes.append((start, scope_end))
+    return scopes
+
+def operands(text):
+    """
+    Finds the self-contained operands of an expression that use a variable: subsetted variables, function
+        calls and parenthesized expressions, with the [...] groups that follow them. Operands within the
+        over, values or using part of condense and coverage constructors are left out, since they may use
+        iterator variables that are only bound there.
+
+    Returns:
+        dict: The text of every operand mapped to the positions it starts at.
+    """
+    found = {}
+    tokens = tokenize(text)
+    scopes = iterator_scopes(text, tokens)
+    for i, (kind, token, start, end) in enumerate(tokens):
+        if any(scope_start <= start < scope_end for scope_start, scope_end in scopes):
+            continue
+        if kind == 'name' and token.startswith('$'):
+            operand_end = end
+        elif kind == 'name' and end < len(text) and text[end] == '(':
+            operand_end = closing(text, end)
+        elif token == '(':
+            operand_end = closing(text, start)
+        else:
+            continue
+        if operand_end is None:
+            continue
+        operand_end, groups = bracket_groups(text, operand_end)
+        operand = text[start:operand_end]
+        if operand_end == end or '$' not in operand.replace('${', ''):
+            continue
+        if start > 0 and (text[start - 1].isalnum() or text[start - 1] in '_$'):
+            continue
+        found.setdefault(operand, []).append(start)
+    return found
+
+def eliminate_common_subexpressions(texts, taken, bound):
+    """
+    Binds operands that occur several times with let, so they are written and computed once. Only operands
+        whose variables are all bound before the let, by the for clause or other lets, are bound.
+
+    Parameters:
+        texts (list of str): The expressions of the query.
+        taken (set of str): Variable names already used by the query.
+        bound (set of str): Variable names bound by the for clause and the lets of the query.
+
+    Returns:
+        tuple: The rewritten expressions and the (variable, expression) pairs to bind, in dependency order.
+    """
+    lets = []
+    counter = itertools.count()
+    while True:
+        counts = {}
+        for text in texts + [expression for _, expression in lets]:
+            for operand, starts in operands(text).items():
+                counts[operand] = counts.get(operand, 0) + len(starts)
+        name = next(f'{LET_PREFIX}{index}' for index in counter if f'{LET_PREFIX}{index}' not in taken)
+        best, saving = None, 0
+        for operand, count in counts.items():
+            # Worth it when the text saved is more than the let costs: 'name := operand, '
+            gain = (count - 1) * len(operand) - count * len(name) - len(name) - 6
+            if count > 1 and gain > saving and set(VARIABLE_NAMES.findall(operand)) <= bound:
+                best, saving = operand, gain
+        if best is None:
+            return texts, order_lets(lets)
+        taken.add(name)
+        bound.add(name)
+        texts = [replace_operand(text, best, name) for text in texts]
+        lets = [(var, replace_operand(expression, best, name)) for var, expression in lets]
+        lets.append((name, best))
+
+def replace_operand(text, operand, name):
+    """
+    Replaces every occurrence of an operand found by operands() with a variable.
+    """
+    starts = operands(text).get(operand, [])
+    for start in reversed(starts):
+        text = text[:start] + name + text[start + len(operand):]
+    return text
+
+def order_lets(lets):
+    """
+    Sorts let bindings so every binding comes after the ones its expression uses.
+    """
+    ordered, placed = [], set()
+    pending = list(lets)
+    while pending:
+        for entry in pending:
+            used = set(VARIABLE_NAMES.findall(entry[1]))
+            if all(var in placed or var not in dict(lets) for var in used):
+                ordered.append(entry)
+                placed.add(entry[0])
+                pending.remove(entry)
+                break
+    return ordered
+
+def optimize_text(text, changes, label):
+    """
+    Runs the passes that rewrite a single expression, recording the ones that changed it.
+    """
+    for name, rewrite in (('fold_constants', fold_constants), ('push_trims', push_trims),
+                          ('merge_subsets', merge_subset_chains)):
+        rewritten = rewrite(text)
+        if rewritten != text:
+            changes.append((name, label, rewritten))
+            text = rewritten
+    return text
+
+@functools.lru_cache(maxsize=1024)
+def _optimize(query):
+    changes = []
+    result = optimize_text(query.result.render(query.subsets), changes, 'return')
+    where = optimize_text(query.where, changes, 'where') if query.where is not None else None
+    # A where condition that compares two numbers is either always true and dropped, or kept as it is
+    if where is not None:
+        tokens = tokenize(where)
+        if len(tokens) == 3 and tokens[0][0] == tokens[2][0] == 'number' and tokens[1][0] == 'comparison':
+            low, high = float(tokens[0][1]), float(tokens[2][1])
+            if {'<': low < high, '>': low > high, '<=': low <= high, '>=': low >= high, '=': low == high,
+                    '!=': low != high}[tokens[1][1]]:
+                changes.append(('drop_where', 'where', None))
+                where = None
+    texts = [result] + ([where] if where is not None else [])
+    taken = set(VARIABLE_NAMES.findall(query.render())) | {var for var, _ in query.lets}
+    bound = {var for binding in query.bindings for var in VARIABLE_NAMES.findall(binding.variable)[:1]}
+    texts, lets = eliminate_common_subexpressions(texts, taken, bound | {var for var, _ in query.lets})
+    for var, expression in lets:
+        changes.append(('let', var, expression))
+    optimized = Query(query.bindings, query.subsets, texts[1] if where is not None else None,
+                      RawExpression(texts[0]), query.lets + tuple(lets))
+    return optimized, tuple(changes)
+
+def optimize_query(query):
+    """
+    Rewrites a query tree into an equivalent one that is shorter and lets the server read less:
+
+        - fold_constants: arithmetic on number literals is replaced by its value, e.g. 10 + 5 * 2 by 20.
+        - push_trims: a trim of a parenthesized cell by cell expression is moved onto its variables.
+        - merge_subsets: a variable subsetted several times in a row gets a single subset.
+        - drop_where: a where condition comparing two numbers that is always true is removed.
+        - let: operands used several times are bound once with let, when that shortens the query.
+
+    The result expression of the optimized tree is the rendered text (a RawExpression), so it should be
+        varied (e.g. with Query.with_subset()) before it is optimized. Optimizing is memoized per tree.
+
+    Parameters:
+        query (Query): The query tree, see Datacube.build_query().
+
+    Returns:
+        tuple: The optimized Query and a report dict with the applied 'changes', as (pass, part, text)
+            tuples, where part is 'return', 'where' or a let variable and text is the rewritten part,
+            and the query lengths 'length_before' and 'length_after'.
+
+    Example:
+        >>> optimized, report = optimize_query(datacube.build_query())
+        >>> report['changes']
+        [('fold_constants', 'return', 'count($c[Lat(0:10)] > 20)')]
+    """
+    if not isinstance(query, Query):
+        raise TypeError("Only query trees can be optimized.")
+    optimized, changes = _optimize(query)
+    return optimized, {'changes': list(changes), 'length_before': len(query.render()),
+                       'length_after': len(optimized.render())}
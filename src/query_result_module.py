@@ -0,0 +1,124 @@
+import io
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, only as_image() needs it
+    Image = None
+
+class QueryResult:
+    def __init__(self, content, settings, decoder):
+        """
+        The raw response of a query, decoded on first access, created by Datacube.execute_lazy().
+            Every decoded view is kept, so asking for it again is a lookup, and code that only forwards
+            the bytes or needs their size never parses them.
+
+        Parameters:
+            content (bytes): The body of the server's response.
+            settings (dict): The decoding settings, see Datacube.result_settings().
+            decoder (callable): Decodes a response body, see Datacube.decode_response().
+        """
+        self.content = content
+        self.settings = settings
+        self.decoder = decoder
+        self.views = {}
+        self._lock = threading.Lock()
+
+    @property
+    def raw(self):
+        """
+        The response body as it was received.
+        """
+        return self.content
+
+    @property
+    def format(self):
+        """
+        The output format the query was encoded with, None for the default CSV.
+        """
+        return self.settings.get('output_format')
+
+    def __len__(self):
+        return len(self.content)
+
+    def view(self, return_type):
+        """
+        Decodes the response like Datacube.execute() with a return type, once.
+
+        Parameters:
+            return_type (str or None): The return type, see Datacube.decode_response().
+
+        Returns:
+            The decoded result.
+        """
+        # Decoding happens outside of the lock; a concurrent first access decodes twice and keeps one result
+        if return_type not in self.views:
+            value = self.decoder(self.content, return_type=return_type, **self.settings)
+            with self._lock:
+                self.views.setdefault(return_type, value)
+        return self.views[return_type]
+
+    def value(self):
+        """
+        Returns what Datacube.execute() would have returned for the query.
+        """
+        return self.view(None)
+
+    def as_list(self):
+        """
+        Returns the values as a list of floats, or a dict for agg() queries.
+
+        Raises:
+            ValueError: If the result is an image.
+        """
+        self.require_numbers()
+        return self.view('list')
+
+    def as_array(self):
+        """
+        Returns the values as a one-dimensional NumPy array, or a dict for agg() queries.
+
+        Raises:
+            ValueError: If the result is an image.
+        """
+        self.require_numbers()
+        return self.view('array')
+
+    def as_grid(self):
+        """
+        Returns the values as an N-dimensional NumPy array in the shape of the result.
+
+        Raises:
+            ValueError: If the result is an image.
+        """
+        self.require_numbers()
+        return self.view('grid')
+
+    def as_image(self):
+        """
+        Opens a PNG or JPEG result as an image.
+
+        Returns:
+            PIL.Image.Image: The image.
+
+        Raises:
+            ValueError: If the result is not a PNG or JPEG image.
+            ImportError: If Pillow isn't installed.
+        """
+        if self.format not in ['PNG', 'JPEG']:
+            raise ValueError("Only PNG and JPEG results are images.")
+        if Image is None:
+            raise ImportError("Pillow is required to open image results.")
+        if 'image' not in self.views:
+            image = Image.open(io.BytesIO(self.content))
+            image.load()
+            with self._lock:
+                self.views.setdefault('image', image)
+        return self.views['image']
+
+    def require_numbers(self):
+        """
+        Raises a ValueError if the result is an image, whose bytes aren't numbers.
+        """
+        if self.format in ['PNG', 'JPEG']:
+            raise ValueError("Image results can't be decoded as numbers.")
@@ -0,0 +1,248 @@
+import calendar
+import re
+from datetime import datetime, timedelta
+
+# One axis subset: Axis(low:high) or Axis(point), optionally with a CRS as in Lat:"EPSG:4326"(0:10)
+AXIS_SUBSET_PATTERN = re.compile(r'''
+    \s*(?P<axis>[A-Za-z_][A-Za-z0-9_]*)
+    (?::"(?P<crs>[^"]*)")?
+    \s*\(\s*(?P<low>"[^"]*"|[^():"]+?|\*)\s*
+    (?::\s*(?P<high>"[^"]*"|[^():"]+?|\*)\s*)?\)\s*$
+''', re.VERBOSE)
+
+# Time steps as ISO 8601 durations with a single unit, e.g. P1M or P10D
+DURATION_PATTERN = re.compile(r'P(\d+)([YMWD])$')
+# Accepted spellings of time coordinates; generated steps keep the spelling of the start
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%Y-%m', '%Y']
+
+class AxisSubset:
+    __slots__ = ('axis', 'low', 'high', 'crs', 'trim')
+
+    def __init__(self, axis, low, high=None, crs=None, trim=None):
+        """
+        Represents the subset of one axis: a trim from low to high, or a slice at low.
+            Bounds are floats for numeric coordinates, strings for quoted ones (e.g. dates), or None for '*'.
+
+        Parameters:
+            axis (str): The axis name, e.g. 'Lat'.
+            low (float, str or None): The lower bound, or the slicing point.
+            high (float, str or None, optional): The upper bound of a trim.
+            crs (str, optional): The CRS the bounds are given in.
+            trim (bool, optional): Whether the subset is a trim. Defaults to True when high is given;
+                pass True explicitly for a trim whose upper bound is '*'.
+
+        Example:
+            >>> AxisSubset('Lat', 30.0, 60.0)
+            AxisSubset('Lat', 30.0, 60.0)
+        """
+        self.axis = axis
+        self.low = low
+        self.high = high
+        self.crs = crs
+        self.trim = high is not None if trim is None else trim
+
+    @property
+    def is_slice(self):
+        return not self.trim
+
+    def is_numeric(self):
+        """
+        Checks whether both bounds of the subset are numbers.
+        """
+        return isinstance(self.low, float) and (self.is_slice or isinstance(self.high, float))
+
+    def __eq__(self, other):
+        return isinstance(other, AxisSubset) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return (self.axis, self.low, self.high, self.crs, self.trim)
+
+    def __repr__(self):
+        return f'AxisSubset({self.axis!r}, {self.low!r}, {self.high!r})'
+
+    def __str__(self):
+        crs = f':"{self.crs}"' if self.crs is not None else ''
+        if self.is_slice:
+            return f'{self.axis}{crs}({format_bound(self.low)})'
+        return f'{self.axis}{crs}({format_bound(self.low)}:{format_bound(self.high)})'
+
+def parse_bound(text):
+    """
+    Converts the text of a subset bound into a float, a string (quotes removed) or None for '*'.
+
+    Raises:
+        ValueError: If the bound is neither quoted, '*' nor a number.
+    """
+    text = text.strip()
+    if text == '*':
+        return None
+    if text.startswith('"'):
+        return text[1:-1]
+    return float(text)
+
+def format_bound(value):
+    """
+    Writes a subset bound the way WCPS expects it: quoted strings, '*' for None, and numbers without
+        a trailing '.0' when they are whole.
+    """
+    if value is None:
+        return '*'
+    if isinstance(value, str):
+        return f'"{value}"'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def parse_subset(subset):
+    """
+    Parses a subset string as passed to Datacube.subset() into its axis subsets.
+
+    Parameters:
+        subset (str): The subset specification, e.g. 'Lat(30:60), Long(8.80), ansi("2014-01":"2014-12")'.
+
+    Returns:
+        list of AxisSubset: The subsets in the order they were given.
+
+    Raises:
+        TypeError: If subset is not a string.
+        ValueError: If the string is not a comma-separated list of axis subsets.
+
+    Example:
+        >>> parse_subset('Lat(30:60), ansi("2014-07")')
+        [AxisSubset('Lat', 30.0, 60.0), AxisSubset('ansi', '2014-07', None)]
+    """
+    if not isinstance(subset, str):
+        raise TypeError("Subset must be a string.")
+    # Commas inside quotes or parentheses don't separate axes
+    items = re.findall(r'(?:[^,("]|"[^"]*"|\([^)]*\))+', subset)
+    axes = []
+    for item in items:
+        match = AXIS_SUBSET_PATTERN.match(item)
+        if match is None:
+            raise ValueError(f"Subset can't be parsed: {item.strip()}")
+        try:
+            low = parse_bound(match.group('low'))
+            high = parse_bound(match.group('high')) if match.group('high') is not None else None
+        except ValueError:
+            raise ValueError(f"Subset can't be parsed: {item.strip()}")
+        axes.append(AxisSubset(match.group('axis'), low, high, match.group('crs'), match.group('high') is not None))
+    if not axes:
+        raise ValueError("Subset can't be parsed: no axes given")
+    return axes
+
+def split_axis(axis_subset, size):
+    """
+    Splits the trim of a numeric axis into consecutive pieces of a given extent. Neighbouring
+        pieces share their bound, the last piece ends at the upper bound of the trim.
+
+    Parameters:
+        axis_subset (AxisSubset): A numeric trim, e.g. Lat(-90:90).
+        size (float): The extent of every piece, in the units of the axis.
+
+    Returns:
+        list of AxisSubset: The pieces, from the lower to the upper bound.
+
+    Raises:
+        TypeError: If size is not a number.
+        ValueError: If the subset is not a numeric trim, its bounds are reversed, or size is not positive.
+
+    Example:
+        >>> split_axis(AxisSubset('Lat', 0.0, 50.0), 20)
+        [AxisSubset('Lat', 0.0, 20.0), AxisSubset('Lat', 20.0, 40.0), AxisSubset('Lat', 40.0, 50.0)]
+    """
+    if not isinstance(size, (int, float)) or isinstance(size, bool):
+        raise TypeError("Tile size must be a number.")
+    if size <= 0:
+        raise ValueError("Tile size must be positive.")
+    if axis_subset.is_slice or not axis_subset.is_numeric():
+        raise ValueError(f"Axis {axis_subset.axis} must be trimmed with numeric bounds to be split.")
+    low, high = axis_subset.low, axis_subset.high
+    if high < low:
+        raise ValueError(f"Bounds of axis {axis_subset.axis} are reversed.")
+    pieces = []
+    index = 0
+    while True:
+        # Bounds are computed from the index rather than summed up, so rounding errors don't accumulate
+        start, end = low + index * size, low + (index + 1) * size
+        if end >= high - 1e-9 * size:
+            pieces.append(AxisSubset(axis_subset.axis, start, high, axis_subset.crs))
+            return pieces
+        pieces.append(AxisSubset(axis_subset.axis, start, end, axis_subset.crs))
+        index += 1
+
+def format_subset(axes):
+    """
+    Writes axis subsets back into a subset string, the inverse of parse_subset().
+
+    Parameters:
+        axes (list of AxisSubset): The axis subsets.
+
+    Returns:
+        str: The subset specification, e.g. 'Lat(30:60), Long(8.8)'.
+    """
+    return ', '.join(str(axis) for axis in axes)
+
+def parse_time(text):
+    """
+    Parses a time coordinate such as "2014-07" or "2014-07-01T00:00:00Z".
+
+    Returns:
+        tuple: The datetime and the format it was written in.
+
+    Raises:
+        ValueError: If the text is not in one of TIME_FORMATS.
+    """
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, time_format), time_format
+        except (TypeError, ValueError):
+            continue
+    raise ValueError(f"Time can't be parsed: {text}")
+
+def time_steps(start, end, step='P1M'):
+    """
+    Lists the time coordinates from start to end, both included, at a fixed step.
+
+    Parameters:
+        start (str): The first time coordinate, e.g. "2014-01".
+        end (str): The last time coordinate. It is only included if it falls on a step.
+        step (str, optional): An ISO 8601 duration with one unit: years (P1Y), months (P1M), weeks (P2W) or days (P10D).
+
+    Returns:
+        list of str: The time coordinates, written like start.
+
+    Raises:
+        ValueError: If a time or the step can't be parsed, or the step is zero or finer than the start
+            is written, e.g. days on "2014-01" or months on "2014".
+
+    Example:
+        >>> time_steps("2014-01", "2014-07", "P3M")
+        ['2014-01', '2014-04', '2014-07']
+    """
+    begin, time_format = parse_time(start)
+    stop, _ = parse_time(end)
+    match = DURATION_PATTERN.match(step) if isinstance(step, str) else None
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Time step can't be used: {step}")
+    amount, unit = int(match.group(1)), match.group(2)
+    # Steps are written like the start, so a finer step would write the same coordinate several times
+    if time_format == '%Y' and not (unit == 'Y' or unit == 'M' and amount % 12 == 0) \
+            or time_format == '%Y-%m' and unit in 'WD':
+        raise ValueError(f"Time step {step} is finer than the start {start}.")
+    steps = []
+    index = 0
+    while True:
+        # Each step is counted from the start, so month ends aren't lost after a short month
+        if unit in 'YM':
+            months = begin.month - 1 + index * amount * (12 if unit == 'Y' else 1)
+            year, month = begin.year + months // 12, months % 12 + 1
+            current = begin.replace(year=year, month=month, day=min(begin.day, calendar.monthrange(year, month)[1]))
+        else:
+            current = begin + timedelta(days=index * amount * (7 if unit == 'W' else 1))
+        if current > stop:
+            return steps
+        steps.append(current.strftime(time_format))
+        index += 1
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from query_fingerprint_module import fingerprint_query
+
+class TimeSeriesStore:
+    def __init__(self, directory):
+        """
+        Initializes a persisted store of time series results, so a refresh only fetches time steps
+            that weren't fetched before. Every series is an append-only file with one JSON line per
+            fetched step; later lines for the same step replace earlier ones.
+
+        Parameters:
+            directory (str): The directory the series are kept in. It is created if missing.
+
+        Raises:
+            TypeError: If directory is not a string.
+
+        Example:
+            >>> store = TimeSeriesStore('.wcps_series')
+            >>> times, values = datacube.refresh(store, "2014-01", "2014-12")
+        """
+        if not isinstance(directory, str):
+            raise TypeError("Directory must be a string.")
+        self.directory = directory
+        self.series = {}  # key -> dict of time step -> result, loaded on first use
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def make_key(self, endpoint, template_query, return_type=None):
+        """
+        Builds the key of a series from the endpoint, the query of a placeholder time step and the
+            return type the steps were decoded with.
+
+        Returns:
+            str: A hex digest that is also safe to use as a file name.
+        """
+        text = f'{endpoint}\0{fingerprint_query(template_query)}\0{return_type}'
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.jsonl')
+
+    def load(self, key):
+        """
+        Returns the stored steps of a series. The dict is kept and updated in place by update().
+
+        Returns:
+            dict: Time steps mapped to their results, empty for an unknown series.
+        """
+        with self._lock:
+            return self._load(key)
+
+    def _load(self, key):
+        if key in self.series:
+            return self.series[key]
+        steps = {}
+        try:
+            with open(self._path(key), encoding='utf-8') as series_file:
+                for line in series_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut off by a crash is ignored
+                    steps[entry['time']] = entry['value']
+        except OSError:
+            pass
+        self.series[key] = steps
+        return steps
+
+    def update(self, key, steps):
+        """
+        Adds fetched steps to a series, in memory and by appending them to its file.
+
+        Parameters:
+            key (str): The key of the series.
+            steps (dict): Time steps mapped to JSON serializable results.
+        """
+        with self._lock:
+            stored = self._load(key)
+            lines = ''.join(json.dumps({'time': time, 'value': value}) + '\n' for time, value in steps.items())
+            with open(self._path(key), 'a', encoding='utf-8') as series_file:
+                series_file.write(lines)
+            stored.update(steps)
+
+    def compact(self, key):
+        """
+        Rewrites the file of a series with one line per step, dropping lines replaced by later ones.
+        """
+        with self._lock:
+            stored = self._load(key)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'w', encoding='utf-8') as temp_file:
+                for time in sorted(stored):
+                    temp_file.write(json.dumps({'time': time, 'value': stored[time]}) + '\n')
+            os.replace(temp_path, self._path(key))
+
+    def clear(self, key=None):
+        """
+        Removes one series, or every series if key is None.
+        """
+        with self._lock:
+            if key is None:
+                self.series.clear()
+            keys = [key] if key is not None else [name[:-len('.jsonl')] for name in os.listdir(self.directory)
+                                                  if name.endswith('.jsonl')]
+            for series_key in keys:
+                self.series.pop(series_key, None)
+                if os.path.exists(self._path(series_key)):
+                    os.remove(self._path(series_key))
@@ -1,3 +1,9 @@
+import http.server
+import os
+import re
+import struct
+import threading
+import urllib.parse
 from datacube_basic_module import Datacube
 from database_connection_object_module import DatabaseConnection
 
@@ -17,4 +23,189 @@ def create_good_dco_binary():
     my_dco = Datacube(my_dbc)
     my_dco.coverage_instance("AvgLandTemp", "c1")
     my_dco.coverage_instance("AvgLandTemp", "c2")
-    return my_dco
\ No newline at end of file
+    return my_dco
+
+# Local stand-in for a WCPS endpoint, so the network code can be tested without reaching rasdaman.
+# The responder gets the posted query and returns the body bytes (or a (status, body) tuple).
+class StubServer:
+    def __init__(self, responder=None, get_responder=None):
+        self.responder = responder if responder is not None else (lambda query: b'1')
+        # GET requests (WCS requests such as DescribeCoverage) get the parsed parameters
+        self.get_responder = get_responder if get_responder is not None else (lambda params: (404, b''))
+        self.queries = []
+        self.get_requests = []
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # HTTP/1.1 so that clients can keep connections alive
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out in separate writes, don't let Nagle stall kept-alive sockets
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections_opened += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                query = form.get('query', [''])[0]
+                with stub._lock:
+                    stub.queries.append(query)
+                result = stub.responder(query)
+                status, body = result if isinstance(result, tuple) else (200, result)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                with stub._lock:
+                    stub.get_requests.append(params)
+                result = stub.get_responder(params)
+                status, body = result if isinstance(result, tuple) else (200, result)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/rasdaman/ows'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+# Writes a minimal uncompressed little-endian TIFF of a 2-d or 3-d (rows, columns, bands) array,
+# split into strips of rows_per_strip rows. With gap=True unused bytes are put between the strips.
+def make_geotiff(raster, rows_per_strip=None, gap=False):
+    raster = raster if raster.ndim == 3 else raster[:, :, None]
+    height, width, bands = raster.shape
+    rows_per_strip = rows_per_strip or height
+    sample_format = {'u': 1, 'i': 2, 'f': 3}[raster.dtype.kind]
+    strips = [raster[top:top + rows_per_strip].astype(raster.dtype.newbyteorder('<')).tobytes()
+              for top in range(0, height, rows_per_strip)]
+    data = b''
+    offsets = []
+    for strip in strips:
+        offsets.append(8 + len(data))
+        data += strip + (b'\0' * 4 if gap else b'')
+    arrays_offset = 8 + len(data)
+    extra = struct.pack(f'<{len(strips)}I', *offsets) + struct.pack(f'<{len(strips)}I', *(len(strip) for strip in strips))
+    entries = [(256, 4, 1, width), (257, 4, 1, height), (258, 3, 1, raster.dtype.itemsize * 8),
+               (259, 3, 1, 1), (273, 4, len(strips), offsets[0] if len(strips) == 1 else arrays_offset),
+               (277, 3, 1, bands), (278, 4, 1, rows_per_strip),
+               (279, 4, len(strips), len(strips[0]) if len(strips) == 1 else arrays_offset + 4 * len(strips)),
+               (339, 3, 1, sample_format)]
+    ifd_offset = arrays_offset + len(extra)
+    ifd = struct.pack('<H', len(entries))
+    for tag, field_type, count, value in entries:
+        value_bytes = struct.pack('<H', value) + b'\0\0' if field_type == 3 else struct.pack('<I', value)
+        ifd += struct.pack('<HHI', tag, field_type, count) + value_bytes
+    ifd += struct.pack('<I', 0)
+    return b'II*\x00' + struct.pack('<I', ifd_offset) + data + extra + ifd
+
+# Writes a minimal netCDF classic (CDF-1) file. Variables are given as {name: (dimension names, array)},
+# a dimension named in record_dimension is written as the unlimited dimension.
+def make_netcdf(dimensions, variables, record_dimension=None):
+    nc_types = {'>i2': 3, '>i4': 4, '>f4': 5, '>f8': 6}
+
+    def name(text):
+        encoded = text.encode('utf-8')
+        return struct.pack('>I', len(encoded)) + encoded + b'\0' * (-len(encoded) % 4)
+
+    dim_names = list(dimensions)
+    header = b'CDF\x01' + struct.pack('>I', dimensions.get(record_dimension, 0))
+    header += struct.pack('>II', 10, len(dim_names))
+    for dim in dim_names:
+        header += name(dim) + struct.pack('>I', 0 if dim == record_dimension else dimensions[dim])
+    header += struct.pack('>II', 0, 0)
+    encoded = {var: array.astype(array.dtype.newbyteorder('>')) for var, (dims, array) in variables.items()}
+    record_vars = [var for var, (dims, array) in variables.items() if dims and dims[0] == record_dimension]
+    single_record = len(record_vars) == 1
+
+    def var_size(var):
+        array = encoded[var]
+        size = array[0].nbytes if var in record_vars else array.nbytes
+        return size if single_record and var in record_vars else size + (-size % 4)
+
+    var_headers_size = 8 + sum(len(name(var)) + 4 + 4 * len(dims) + 8 + 12 for var, (dims, array) in variables.items())
+    begin = len(header) + var_headers_size
+    fixed = [var for var in variables if var not in record_vars]
+    begins = {}
+    for var in fixed:
+        begins[var] = begin
+        begin += var_size(var)
+    for var in record_vars:
+        begins[var] = begin
+        begin += var_size(var)
+    header += struct.pack('>II', 11, len(variables))
+    for var, (dims, array) in variables.items():
+        header += name(var) + struct.pack('>I', len(dims)) + b''.join(struct.pack('>I', dim_names.index(d)) for d in dims)
+        header += struct.pack('>II', 0, 0) + struct.pack('>III', nc_types[encoded[var].dtype.str], var_size(var), begins[var])
+    body = b''
+    for var in fixed:
+        body += encoded[var].tobytes() + b'\0' * (var_size(var) - encoded[var].nbytes)
+    for record in range(dimensions.get(record_dimension, 0)):
+        for var in record_vars:
+            data = encoded[var][record].tobytes()
+            body += data + b'\0' * (var_size(var) - len(data))
+    return header + body
+
+# The value of a month is its number, e.g. 3.0 for "2014-03"
+def month_value(text):
+    return str(float(text[5:7]))
+
+# Answers per-month queries, and struct queries with at most max_fields fields
+def time_responder(max_fields=100):
+    def responder(query):
+        months = re.findall(r'ansi\("([^"]+)"\)', query)
+        if query.count(': avg(') > max_fields:
+            return 400, b'query too large'
+        if ': avg(' in query:
+            return ('{"' + ' '.join(month_value(month) for month in months) + '"}').encode('utf-8')
+        if 'encode(' in query:
+            return ('{' + month_value(months[0]) + ',' + month_value(months[0]) + '}').encode('utf-8')
+        return month_value(months[0]).encode('utf-8')
+    return responder
+
+# Recorded WCS responses, see tests/fixtures
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+# Answers DescribeCoverage and GetCapabilities requests from the fixtures, like rasdaman does
+def wcs_responder(params):
+    if params.get('request') == 'GetCapabilities':
+        return read_fixture('get_capabilities.xml')
+    if params.get('request') == 'DescribeCoverage':
+        documents = []
+        for coverage_id in params.get('coverageId', '').split(','):
+            if not os.path.exists(os.path.join(FIXTURES_DIR, f'describe_coverage_{coverage_id}.xml')):
+                return 404, read_fixture('exception_report.xml')
+            documents.append(read_fixture(f'describe_coverage_{coverage_id}.xml'))
+        if len(documents) == 1:
+            return documents[0]
+        # Several coverages are described in one document
+        bodies = [re.search(rb'<wcs:CoverageDescription .*</wcs:CoverageDescription>', document, re.DOTALL).group()
+                  for document in documents]
+        head = documents[0].split(b'<wcs:CoverageDescription ')[0]
+        return head + b'\n'.join(bodies) + b'\n</wcs:CoverageDescriptions>\n'
+    return 400, read_fixture('exception_report.xml')
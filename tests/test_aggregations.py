@@ -10,7 +10,7 @@ sys.path.insert(0, src_dir)
 import pytest
 from datacube_basic_module import Datacube
 from database_connection_object_module import DatabaseConnection
-from helper_methods import create_good_dco
+from helper_methods import create_good_dco, StubServer
 
 class Test_aggregation_functions():
     # this tests correct usage of min() -- condition is passed
@@ -137,4 +137,38 @@ class Test_aggregation_functions():
         my_dco = create_good_dco()
         my_dco.avg('$c > 12')
         my_dco.sum()
-        assert (my_dco.aggregation == 'SUM') and (my_dco.aggregation_condition == None)
\ No newline at end of file
+        assert (my_dco.aggregation == 'SUM') and (my_dco.aggregation_condition == None)
+
+# this tests agg(), several aggregations in one query
+class Test_batched_aggregations():
+    # all aggregations are compiled into one struct over the same for clause
+    def test_query(self):
+        my_dco = create_good_dco().subset(var_name='$c', subset='ansi("2014-07")')
+        my_dco.agg(['min', 'max', ('count', '$c > 12')])
+        assert my_dco.construct_query() == ('for $c in (AvgLandTemp)\nreturn \n'
+            '{min: min($c[ansi("2014-07")] ); max: max($c[ansi("2014-07")] ); count: count($c[ansi("2014-07")] > 12)}')
+
+    # a dict gives the result keys, so an operation can be used twice
+    def test_dict_keys(self):
+        my_dco = create_good_dco().agg({'warm': ('count', '$c > 20'), 'cold': ('count', '$c < 0')})
+        assert [key for key, _, _ in my_dco.aggregations] == ['warm', 'cold']
+
+    # invalid requests are rejected
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            create_good_dco().agg(['min', 'median'])
+        with pytest.raises(ValueError):
+            create_good_dco().agg(['min', 'min'])
+        with pytest.raises(ValueError):
+            create_good_dco().agg([('count', '$t > 12')])
+        with pytest.raises(ValueError):
+            create_good_dco().agg([])
+        with pytest.raises(TypeError):
+            create_good_dco().agg('min')
+
+    # the struct result is decoded into a dict in one round trip
+    def test_execute(self):
+        with StubServer(lambda query: b'{"-12.5 31 9.75 1042"}') as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").agg(['min', 'max', 'avg', 'count']).execute()
+            assert result == {'min': -12.5, 'max': 31.0, 'avg': 9.75, 'count': 1042.0}
+            assert len(stub.queries) == 1
@@ -0,0 +1,67 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+# this tests send_query_async()
+class Test_send_query_async():
+    # the async call returns the same response as the blocking one
+    def test_same_response(self):
+        with StubServer(lambda query: b'12.5 13.5') as stub, DatabaseConnection(stub.url) as my_dbc:
+            response = asyncio.run(my_dbc.send_query_async('for $c in (AvgLandTemp) return 1'))
+            assert response.content == my_dbc.send_query('for $c in (AvgLandTemp) return 1').content
+
+    # pass to the method a variable, which is not a string
+    def test_send_not_str(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(TypeError):
+            asyncio.run(my_dbc.send_query_async(1))
+
+# this tests execute_async() and execute_many()
+class Test_execute_async():
+    # execute_async() sends the same query and decodes it the same way as execute()
+    def test_same_result_as_execute(self):
+        with StubServer(lambda query: b'12.5 13.5') as stub, DatabaseConnection(stub.url) as my_dbc:
+            sync_result = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").avg().execute()
+            async_result = asyncio.run(Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").avg().execute_async())
+            assert sync_result == async_result == [12.5, 13.5]
+            assert stub.queries[0] == stub.queries[1]
+
+    # the results come back in order, and no more than max_concurrency queries are in flight
+    def test_execute_many_bounded(self):
+        in_flight = [0, 0]
+        lock = threading.Lock()
+
+        def responder(query):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return query.split('encode(')[1].split(',')[0].encode('utf-8')
+
+        with StubServer(responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            cubes = [Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").encode(str(i)) for i in range(8)]
+            results = asyncio.run(Datacube.execute_many(cubes, max_concurrency=3))
+        assert in_flight[1] <= 3
+        assert results == [[float(i)] for i in range(8)]
+
+    # the concurrency limit must be a positive integer
+    def test_execute_many_bad_limit(self):
+        with pytest.raises(ValueError):
+            asyncio.run(Datacube.execute_many([], max_concurrency=0))
+        with pytest.raises(TypeError):
+            asyncio.run(Datacube.execute_many(['for $c in (AvgLandTemp) return 1']))
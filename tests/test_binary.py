@@ -8,10 +8,10 @@ src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 sys.path.insert(0, src_dir)
 
 import pytest
-from datacube_basic_module import Datacube, Coverage
+from datacube_basic_module import Datacube, Coverage, BinaryOperation
 from database_connection_object_module import DatabaseConnection
 from expression_builder import Variable, Scalar
-from helper_methods import create_good_dco, create_dco
+from helper_methods import create_good_dco, create_dco, StubServer
 
 class TestBinaryOperations():
     def test_addition(self):
@@ -124,3 +124,46 @@ class TestBinaryOperationsCoverages():
 
         # Assert that the final query matches the expected format
         assert final_query == expected_query
+
+# this tests nested coverage expressions
+class TestNestedOperations():
+    # nested operations are written with the parentheses their grouping needs
+    def test_expression(self):
+        a, b, c, d = Coverage(["A"], "a"), Coverage(["B"], "b"), Coverage(["C"], "c"), Coverage(["D"], "d")
+        assert ((a + b) * c / d).expression() == '($a + $b) * $c / $d'
+        assert (a - (b - c)).expression() == '$a - ($b - $c)'
+        assert (a / (b * c)).expression() == '$a / ($b * $c)'
+        assert (a - b - c).expression() == '$a - $b - $c'
+        assert (2 * a - 0.5).expression() == '2 * $a - 0.5'
+
+    # every distinct coverage is bound once, in the order it first appears
+    def test_to_query(self):
+        red, nir = Coverage(["S2_B04"], "red"), Coverage(["S2_B08"], "nir")
+        final_query = ((nir - red) / (nir + red)).to_query()
+        assert final_query == 'For\n$nir in (S2_B08),\n$red in (S2_B04)\nreturn\nencode(($nir - $red) / ($nir + $red), "text/csv")'
+
+    # add_coverages() and its siblings accept nested operations
+    def test_coverages_with_operation(self):
+        a, b, c = Coverage(["A"], "a"), Coverage(["B"], "b"), Coverage(["C"], "c")
+        result, final_query = create_dco().multiply_coverages(a + b, c, a)
+        assert final_query == 'For\n$a in (A),\n$b in (B),\n$c in (C)\nreturn\nencode(($a + $b) * $c * $a, "text/csv")'
+
+    # operands must be coverages, operations or numbers, and a variable name belongs to one coverage
+    def test_invalid(self):
+        a = Coverage(["A"], "a")
+        with pytest.raises(TypeError):
+            a + "B"
+        with pytest.raises(ValueError):
+            BinaryOperation(a, a, '%')
+        with pytest.raises(ValueError):
+            (a + Coverage(["B"], "a")).coverages()
+
+    # compute() sends the whole expression as one query whose variables can be subset
+    def test_compute(self):
+        red, nir = Coverage(["S2_B04"], "red"), Coverage(["S2_B08"], "nir")
+        with StubServer(lambda query: b'0.5 0.25') as stub:
+            my_dco = Datacube(DatabaseConnection(stub.url))
+            result = my_dco.compute((nir - red) / (nir + red) * 2 / nir).subset('Lat(0:10)', '$red').execute()
+        assert result == [0.5, 0.25]
+        assert stub.queries == ['for $nir in (S2_B08),\n$red in (S2_B04)\nreturn \n'
+                                'encode(($nir - $red[Lat(0:10)]) / ($nir + $red[Lat(0:10)]) * 2 / $nir, "text/csv")']
@@ -0,0 +1,108 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+import numpy as np
+from binary_format_module import decode_raw, decode_geotiff, decode_netcdf
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer, create_good_dco, make_geotiff, make_netcdf
+
+GRID = np.arange(24, dtype=np.float32).reshape(4, 6) / 4
+
+# this tests decode_raw()
+class Test_decode_raw():
+    # the array is a view on the response bytes
+    def test_zero_copy(self):
+        content = GRID.astype('<f4').tobytes()
+        result = decode_raw(content, '<f4', (4, 6))
+        assert np.array_equal(result, GRID)
+        assert not result.flags['OWNDATA']
+
+    # a size that doesn't match the cell type is reported
+    def test_wrong_size(self):
+        with pytest.raises(ValueError):
+            decode_raw(b'\0' * 7, '<f4')
+
+# this tests decode_geotiff()
+class Test_decode_geotiff():
+    # a single strip is read without copying
+    def test_single_strip(self):
+        result = decode_geotiff(make_geotiff(GRID))
+        assert np.array_equal(result, GRID)
+        assert not result.flags['OWNDATA']
+
+    # strips that aren't back to back are gathered
+    def test_strips_with_gaps(self):
+        assert np.array_equal(decode_geotiff(make_geotiff(GRID, rows_per_strip=3, gap=True)), GRID)
+
+    # several samples per pixel become a band axis
+    def test_bands(self):
+        raster = np.arange(4 * 6 * 3, dtype=np.int16).reshape(4, 6, 3)
+        assert np.array_equal(decode_geotiff(make_geotiff(raster, rows_per_strip=2)), raster)
+
+    # anything that isn't a TIFF file is rejected
+    def test_not_tiff(self):
+        with pytest.raises(ValueError):
+            decode_geotiff(b'{1,2,3}')
+
+# this tests decode_netcdf()
+class Test_decode_netcdf():
+    # fixed-size variables are decoded in the shape of their dimensions
+    def test_fixed_variables(self):
+        lat = np.linspace(-45, 45, 4)
+        content = make_netcdf({'lat': 4, 'lon': 6}, {'lat': (['lat'], lat), 'AvgLandTemp': (['lat', 'lon'], GRID)})
+        result = decode_netcdf(content)
+        assert np.array_equal(result['lat'], lat)
+        assert np.array_equal(result['AvgLandTemp'], GRID)
+        assert not result['AvgLandTemp'].flags['OWNDATA']
+
+    # interleaved record variables are read as strided views
+    def test_record_variables(self):
+        temperature = np.arange(3 * 4, dtype=np.float32).reshape(3, 4)
+        counts = np.arange(3 * 4, dtype=np.int16).reshape(3, 4)
+        content = make_netcdf({'ansi': 3, 'lat': 4}, {'t': (['ansi', 'lat'], temperature), 'n': (['ansi', 'lat'], counts)},
+                              record_dimension='ansi')
+        result = decode_netcdf(content)
+        assert np.array_equal(result['t'], temperature)
+        assert np.array_equal(result['n'], counts)
+
+    # netCDF-4 (HDF5) files are rejected
+    def test_not_classic(self):
+        with pytest.raises(ValueError):
+            decode_netcdf(b'\x89HDF\r\n\x1a\n')
+
+# this tests the binary formats of Datacube
+class Test_binary_formats():
+    # raw binary output needs a cell type
+    def test_binary_needs_cell_type(self):
+        my_dco = create_good_dco()
+        with pytest.raises(ValueError):
+            my_dco.set_format('BINARY')
+
+    # the formats are encoded with their mime types
+    def test_mime_types(self):
+        for output_format, mime_type in [('BINARY', 'application/octet-stream'), ('GEOTIFF', 'image/tiff'),
+                                         ('NETCDF', 'application/netcdf')]:
+            my_dco = create_good_dco().set_format(output_format, cell_type='<f4')
+            assert my_dco.construct_query().endswith(f'"{mime_type}")')
+
+    # execute() decodes each binary format
+    def test_execute(self):
+        responses = {'octet-stream': GRID.astype('<f4').tobytes(), 'tiff': make_geotiff(GRID),
+                     'netcdf': make_netcdf({'lat': 4, 'lon': 6}, {'AvgLandTemp': (['lat', 'lon'], GRID)})}
+        responder = lambda query: next(body for key, body in responses.items() if key in query)
+        with StubServer(responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            raw = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('BINARY', '<f4', (4, 6)).execute()
+            tiff = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('GEOTIFF').execute()
+            netcdf = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('NETCDF').execute()
+            as_list = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('GEOTIFF').execute(return_type='list')
+        assert np.array_equal(raw, GRID) and np.array_equal(tiff, GRID)
+        assert np.array_equal(netcdf['AvgLandTemp'], GRID)
+        assert as_list == GRID.ravel().tolist()
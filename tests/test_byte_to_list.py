@@ -0,0 +1,168 @@
+import sys
+import os
+import array
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+import numpy as np
+import byte_to_list_module
+from byte_to_list_module import byte_to_list, byte_to_array, byte_to_grid, iter_numbers, fill_buffer
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+PAYLOAD = b'12.5 -3 abc 1e3\n4.25\t\t7 nan_value 0.001 '
+
+def split_every(payload, size):
+    return [payload[i:i + size] for i in range(0, len(payload), size)]
+
+# this tests byte_to_list()
+class Test_byte_to_list():
+    # numeric tokens are converted, everything else is skipped
+    def test_skips_non_numeric(self):
+        assert byte_to_list(PAYLOAD) == [12.5, -3.0, 1000.0, 4.25, 7.0, 0.001]
+
+# this tests the streaming decoder
+class Test_iter_numbers():
+    # every possible chunking gives the same values as byte_to_list
+    def test_same_as_byte_to_list(self):
+        for size in range(1, len(PAYLOAD) + 1):
+            assert list(iter_numbers(split_every(PAYLOAD, size))) == byte_to_list(PAYLOAD)
+
+    # a multi-byte character split across chunks doesn't break decoding
+    def test_split_multibyte_character(self):
+        payload = '1 °2 3'.encode('utf-8')
+        assert list(iter_numbers(split_every(payload, 3))) == byte_to_list(payload)
+
+    # an empty stream gives no values
+    def test_empty(self):
+        assert list(iter_numbers([])) == []
+
+    # CSV structure separates numbers, so comma separated results are decoded like byte_to_list
+    def test_csv_without_whitespace(self):
+        payload = b'{{1.5,2,-3},{4e1,"5 6",7}}'
+        assert byte_to_list(payload) == [1.5, 2.0, -3.0, 40.0, 5.0, 6.0, 7.0]
+        for size in range(1, len(payload) + 1):
+            assert list(iter_numbers(split_every(payload, size))) == byte_to_list(payload)
+        assert byte_to_array(payload).tolist() == byte_to_list(payload)
+
+    # a long result without whitespace is decoded in linear time, only one number is held back
+    def test_long_csv(self):
+        payload = b'{' + b','.join(b'%d.25' % i for i in range(200000)) + b'}'
+        values = list(iter_numbers(split_every(payload, 64)))
+        assert len(values) == 200000 and values[-1] == 199999.25
+
+# this tests fill_buffer()
+class Test_fill_buffer():
+    # the values are written into the start of the buffer
+    def test_fill(self):
+        buffer = array.array('d', bytes(8 * 10))
+        assert fill_buffer(split_every(PAYLOAD, 4), buffer) == 6
+        assert list(buffer[:6]) == byte_to_list(PAYLOAD)
+
+    # a buffer that is too small is reported
+    def test_too_small(self):
+        with pytest.raises(ValueError):
+            fill_buffer([PAYLOAD], [0.0] * 3)
+
+# this tests the vectorized decoder
+class Test_byte_to_array():
+    # all-numeric payloads take the vectorized path
+    def test_numeric_payload(self):
+        payload = b'1.5 -2 3e2\n4 inf'
+        result = byte_to_array(payload)
+        assert result.dtype == np.float64 and result.flags['C_CONTIGUOUS']
+        assert result.tolist() == byte_to_list(payload)
+
+    # non-numeric tokens are skipped as in byte_to_list
+    def test_skips_non_numeric(self):
+        assert byte_to_array(PAYLOAD).tolist() == byte_to_list(PAYLOAD)
+        assert byte_to_array('1 °2 3'.encode('utf-8')).tolist() == [1.0, 3.0]
+
+    # the caller can choose the dtype
+    def test_dtype(self):
+        assert byte_to_array(b'1 2 3', dtype='float32').dtype == np.float32
+
+    # without NumPy an array.array is returned
+    def test_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(byte_to_list_module, 'np', None)
+        result = byte_to_array(PAYLOAD)
+        assert isinstance(result, array.array) and result.typecode == 'd'
+        assert result.tolist() == byte_to_list(PAYLOAD)
+        with pytest.raises(ValueError):
+            byte_to_array(PAYLOAD, dtype='int32')
+
+# this tests the shape-aware decoder
+class Test_byte_to_grid():
+    # the brace nesting gives the shape, with or without a wrapping brace pair
+    def test_shapes(self):
+        assert byte_to_grid(b'{1,2,3}').shape == (3,)
+        assert byte_to_grid(b'{{1,2,3},{4,5,6}}').tolist() == [[1, 2, 3], [4, 5, 6]]
+        assert byte_to_grid(b'{1,2,3},{4,5,6}').tolist() == [[1, 2, 3], [4, 5, 6]]
+        assert byte_to_grid(b'{{{1,2},{3,4}},{{5,6},{7,8}}}').shape == (2, 2, 2)
+
+    # struct cells become a trailing band axis
+    def test_struct_cells(self):
+        grid = byte_to_grid(b'{"1 2 3","4 5 6"},{"7 8 9","10 11 12"}')
+        assert grid.shape == (2, 2, 3)
+        assert grid[1, 0].tolist() == [7, 8, 9]
+
+    # ragged or unbalanced results are rejected
+    def test_irregular(self):
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{{1,2},{3}}')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{1,2},{3,4,5}')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{{1,2}')
+
+    # groups are compared at every depth, and struct cells by their number of bands
+    def test_irregular_at_any_depth(self):
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{{1},{2},{3}},{{4}}')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'"1 2","3","4 5 6"')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{"1 2 3","4"}')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{1,{2,3}},{{4,5},{6,7}}')
+        with pytest.raises(ValueError):
+            byte_to_grid(b'{1,x,3}')
+        assert byte_to_grid(b'"1 2","3 4","5 6"').shape == (3, 2)
+        assert byte_to_grid(b'{{1},{2},{3}},{{4},{5},{6}}').shape == (2, 3, 1)
+
+# this tests execute_stream() and execute_into()
+class Test_execute_stream():
+    # streaming gives the same values as execute() and returns the connection to the pool
+    def test_same_as_execute(self):
+        payload = b' '.join(str(i / 4).encode('utf-8') for i in range(20000))
+        with StubServer(lambda query: payload) as stub, DatabaseConnection(stub.url) as my_dbc:
+            expected = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute()
+            streamed = list(Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute_stream(chunk_size=1000))
+            buffer = [0.0] * 20000
+            assert Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute_into(buffer, chunk_size=777) == 20000
+            assert streamed == buffer == expected
+            assert stub.connections_opened == 1
+
+    # images can't be streamed as numbers
+    def test_image_format(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(ValueError):
+            Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('PNG').execute_stream()
+
+    # execute() can return an array instead of a list
+    def test_execute_array(self):
+        with StubServer(lambda query: PAYLOAD) as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute(return_type='array')
+            assert result.tolist() == byte_to_list(PAYLOAD)
+
+    # execute() can return the result in its grid shape
+    def test_execute_grid(self):
+        with StubServer(lambda query: b'{{1,2,3},{4,5,6}}') as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").set_format('CSV').execute(return_type='grid')
+            assert result.shape == (2, 3)
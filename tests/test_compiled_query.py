@@ -0,0 +1,82 @@
+import sys
+import os
+import re
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from compiled_query_module import CompiledQuery
+from helper_methods import StubServer
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(10:20)', '$c').avg()
+
+# Answers a query with the sum of its latitude bounds
+def bounds_responder(query):
+    low, high = re.search(r'Lat\(([-\d.]+):([-\d.]+)\)', query).groups()
+    return str(float(low) + float(high)).encode('utf-8')
+
+# this tests compile() and the reuse of compiled queries
+class Test_compiled_query():
+    # the compiled text equals the builder's, and the instance keeps its settings
+    def test_same_as_builder(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            datacube = make_datacube(my_dbc)
+            compiled = datacube.compile()
+            assert isinstance(compiled, CompiledQuery)
+            assert compiled.text == datacube.construct_query()
+            assert datacube.variable_names == ['$c'] and datacube.aggregation == 'AVG'
+
+    # executing repeatedly sends the same text and doesn't reset anything
+    def test_repeated(self):
+        with StubServer(bounds_responder) as stub, DatabaseConnection(stub.url, coalesce=False) as my_dbc:
+            compiled = make_datacube(my_dbc).compile()
+            assert [compiled.execute() for _ in range(3)] == [[30.0]] * 3
+            assert len(stub.queries) == 3 and len(set(stub.queries)) == 1
+            assert compiled.execute_lazy().as_list() == [30.0]
+
+    # variants with another subset leave the original unchanged
+    def test_with_subset(self):
+        with StubServer(bounds_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            compiled = make_datacube(my_dbc).compile()
+            variant = compiled.with_subset('Lat(30:40)')
+            assert variant.execute() == [70.0] and compiled.execute() == [30.0]
+            assert variant.text == make_datacube(my_dbc).subset('Lat(30:40)', '$c').construct_query()
+            assert variant.with_subset('Lat(10:20)', '$c').fingerprint() == compiled.fingerprint()
+
+    # invalid variants and changes to the compiled query are rejected
+    def test_invalid(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            compiled = make_datacube(my_dbc).compile()
+            with pytest.raises(TypeError):
+                compiled.with_subset(10)
+            with pytest.raises(ValueError):
+                compiled.with_subset('Lat(0:1)', '$d')
+            with pytest.raises(AttributeError):
+                compiled.text = 'for $c in (X) return 1'
+            two = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").coverage_instance("AvgLandTemp", "d").compile()
+            with pytest.raises(ValueError):
+                two.with_subset('Lat(0:1)')
+
+    # optimized cubes compile optimized text, also for their variants
+    def test_optimized(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            datacube = Datacube(my_dbc, optimize=True).coverage_instance("AvgLandTemp", "c").subset('Lat(10:20)', '$c').count('$c > 10 + 5')
+            compiled = datacube.compile()
+            assert '> 15' in compiled.text
+            assert '> 15' in compiled.with_subset('Lat(0:5)').text and 'Lat(0:5)' in compiled.with_subset('Lat(0:5)').text
+
+    # one compiled query and its variants can be executed from many threads
+    def test_threads(self):
+        with StubServer(bounds_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            compiled = make_datacube(my_dbc).compile()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda low: compiled.with_subset(f'Lat({low}:{low + 1})').execute(), range(40)))
+            assert results == [[2.0 * low + 1] for low in range(40)]
@@ -0,0 +1,103 @@
+import sys
+import os
+import re
+import time
+import asyncio
+import inspect
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+# Echoes the latitude, the longitude and the threshold of a query, so every result identifies its query
+def echo_responder(query):
+    lat, long = re.search(r'Lat\((\d+)\), Long\((\d+)\)', query).groups()
+    threshold = re.search(r'> (\d+)', query)
+    return f'{lat} {long} {threshold.group(1) if threshold else -1}'.encode('utf-8')
+
+def slow_responder(query):
+    time.sleep(0.02)
+    return echo_responder(query)
+
+def request(shared, i):
+    cube = shared.subset(f'Lat({i}), Long({i * 7 % 360})', '$c')
+    cube = cube.count(f'$c > {i % 50}') if i % 2 else cube.avg()
+    return cube.execute()
+
+def expected(i):
+    return [float(i), float(i * 7 % 360), float(i % 50) if i % 2 else -1.0]
+
+# this tests sharing one copy-on-write Datacube and one dbc between threads
+class Test_copy_on_write():
+    # builders return changed copies and executing leaves the shared instance unchanged
+    def test_shared_unchanged(self):
+        with StubServer(echo_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            shared = Datacube(my_dbc, copy_on_write=True).coverage_instance("AvgLandTemp", "c")
+            query = shared.construct_query()
+            derived = shared.subset('Lat(1), Long(2)', '$c').avg()
+            assert derived is not shared and derived.copy_on_write
+            assert derived.execute() == [1.0, 2.0, -1.0] and derived.aggregation == 'AVG'
+            assert shared.construct_query() == query and shared.subsets == [None]
+            assert shared.reset() is not shared and shared.variable_names == ['$c']
+
+    # copies are independent of the instance they were made from
+    def test_copy(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            datacube = Datacube(my_dbc, optimize=True).coverage_instance("AvgLandTemp", "c").subset('Lat(0:10)', '$c').set_format('CSV')
+            copy = datacube.copy()
+            assert copy.construct_query() == datacube.construct_query() and copy.optimize
+            copy.subset('Lat(20:30)', '$c').max()
+            assert datacube.subsets == ['Lat(0:10)'] and datacube.aggregation is None
+            assert not copy.copy_on_write and datacube.copy(copy_on_write=True).copy_on_write
+            with pytest.raises(TypeError):
+                Datacube(my_dbc, copy_on_write='yes')
+
+    # coroutine methods stay coroutine functions and work on their private copy until they are done
+    def test_async(self, monkeypatch):
+        resets = []
+        reset = Datacube.reset
+        def recording_reset(self):
+            resets.append(self.copy_on_write)
+            return reset(self)
+        monkeypatch.setattr(Datacube, 'reset', recording_reset)
+        with StubServer(echo_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            assert inspect.iscoroutinefunction(Datacube.execute_async)
+            shared = Datacube(my_dbc, copy_on_write=True).coverage_instance("AvgLandTemp", "c")
+            cubes = [shared.subset(f'Lat({i}), Long({i * 7 % 360})', '$c').avg() for i in range(20)]
+
+            async def run():
+                return await asyncio.gather(*(cube.execute_async() for cube in cubes))
+            assert asyncio.run(run()) == [[float(i), float(i * 7 % 360), -1.0] for i in range(20)]
+            # the reset inside every coroutine changed its copy in place, not yet another copy
+            assert resets == [False] * 20
+            assert shared.subsets == [None] and all(cube.aggregation == 'AVG' for cube in cubes)
+
+    # many threads deriving queries from one shared instance never mix them up
+    def test_stress(self):
+        with StubServer(echo_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            shared = Datacube(my_dbc, copy_on_write=True).coverage_instance("AvgLandTemp", "c")
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                results = list(executor.map(lambda i: request(shared, i), range(400)))
+            assert results == [expected(i) for i in range(400)]
+            assert len(stub.queries) == 400 and shared.subsets == [None] and shared.aggregation is None
+
+    # throughput grows with the number of threads sharing the instance and the connection pool
+    def test_throughput_scales(self):
+        with StubServer(slow_responder) as stub, DatabaseConnection(stub.url, pool_size=8) as my_dbc:
+            shared = Datacube(my_dbc, copy_on_write=True).coverage_instance("AvgLandTemp", "c")
+            timings = {}
+            for workers in [1, 8]:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(lambda i: request(shared, i), range(48)))
+                timings[workers] = time.perf_counter() - start
+                assert results == [expected(i) for i in range(48)]
+            assert timings[1] / timings[8] > 3
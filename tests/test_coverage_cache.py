@@ -0,0 +1,159 @@
+import sys
+import os
+import re
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+import numpy as np
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from coverage_cache_module import CoverageCache
+from coverage_catalog_module import parse_coverage_descriptions
+from helper_methods import StubServer, read_fixture, wcs_responder
+
+# The grid metadata of the one degree grid below, given to the cache instead of a coverage description
+ONE_DEGREE = {'resolutions': {'AvgLandTemp': {'Lat': 1.0, 'Long': 1.0}}, 'axis_orders': {'AvgLandTemp': ['Lat', 'Long']},
+              'directions': {'AvgLandTemp': {'Lat': 1, 'Long': 1}}}
+
+# A one degree grid with cell edges on whole degrees, cell values lat * 1000 + long
+def cells(lat_low, lat_high, long_low, long_high):
+    return np.arange(lat_low, lat_high)[:, None] * 1000.0 + np.arange(long_low, long_high)[None, :]
+
+def grid_responder(query):
+    if re.search(r'\b(min|max|avg|sum|count)\(', query):
+        return b'-1'
+    lat, long = re.findall(r'\(([-\d.]+):([-\d.]+)\)', query)[:2]
+    grid = cells(*(int(float(bound)) for bound in lat + long))
+    return ','.join('{' + ','.join(str(value) for value in row) + '}' for row in grid).encode('utf-8')
+
+# The 0.1 degree grid of the AvgLandTemp fixture, which stores latitudes north first, cell values in tenths of a degree
+def fine_cells(lat_low, lat_high, long_low, long_high):
+    lats = np.arange(round(lat_high * 10) - 1, round(lat_low * 10) - 1, -1)
+    longs = np.arange(round(long_low * 10), round(long_high * 10))
+    return lats[:, None] * 10000.0 + longs[None, :]
+
+def fine_responder(query):
+    lat, long = re.findall(r'\(([-\d.]+):([-\d.]+)\)', query)[:2]
+    grid = fine_cells(*(float(bound) for bound in lat + long))
+    return ','.join('{' + ','.join(str(value) for value in row) + '}' for row in grid).encode('utf-8')
+
+def make_datacube(my_dbc, subset):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset(subset, '$c')
+
+# this tests the CoverageCache on its own
+class Test_CoverageCache():
+    # a contained request is answered by a slice, other requests miss
+    def test_lookup(self):
+        cache = CoverageCache(**ONE_DEGREE)
+        assert cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40), ansi("2014-07")', cells(30, 60, 0, 40))
+        grid = cache.lookup('AvgLandTemp', 'Long(10:20), Lat(40:50), ansi("2014-07")')
+        assert np.array_equal(grid, cells(40, 50, 10, 20))
+        assert cache.lookup('AvgLandTemp', 'Lat(40:50), Long(10:20), ansi("2014-08")') is None
+        assert cache.lookup('AvgLandTemp', 'Lat(40:70), Long(10:20), ansi("2014-07")') is None
+        assert cache.lookup('AvgLandTemp', 'Lat(40.5:50), Long(10:20), ansi("2014-07")') is None
+        assert cache.lookup('OtherCoverage', 'Lat(40:50), Long(10:20), ansi("2014-07")') is None
+        assert cache.stats == {'hits': 1, 'misses': 4, 'evictions': 0}
+
+    # slicing a cached axis removes its dimension, points on cell edges are left to the server
+    def test_slice(self):
+        cache = CoverageCache(**ONE_DEGREE)
+        cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40)', cells(30, 60, 0, 40))
+        assert np.array_equal(cache.lookup('AvgLandTemp', 'Lat(45.5), Long(0:40)'), cells(45, 46, 0, 40)[0])
+        assert cache.lookup('AvgLandTemp', 'Lat(45), Long(0:40)') is None
+
+    # cached grids can't be changed through results
+    def test_read_only(self):
+        cache = CoverageCache(**ONE_DEGREE)
+        source = cells(30, 60, 0, 40)
+        cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40)', source)
+        source[:] = 0
+        grid = cache.lookup('AvgLandTemp', 'Lat(30:60), Long(0:40)')
+        assert grid[0, 0] == 30000
+        with pytest.raises(ValueError):
+            grid[0, 0] = 1
+
+    # grids that don't match a known resolution, have open bounds or unknown metadata aren't cached
+    def test_not_cached(self):
+        cache = CoverageCache(resolutions={'AvgLandTemp': {'Lat': 0.5, 'Long': 1.0}}, directions={'AvgLandTemp': {'Lat': 1, 'Long': 1}})
+        assert not cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40)', cells(30, 60, 0, 40))
+        cache = CoverageCache(**ONE_DEGREE)
+        assert not cache.store('AvgLandTemp', 'Lat(30:*), Long(0:40)', cells(30, 60, 0, 40))
+        assert not cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40)', cells(30, 60, 0, 40)[0])
+        assert not cache.store('Other', 'Lat(30:60), Long(0:40)', cells(30, 60, 0, 40))
+        assert not cache.store('Other', 'Lat(30:60), Long(0)', cells(30, 60, 0, 1)[:, 0])
+        assert cache.entries == {}
+
+    # the least recently used grids are evicted first
+    def test_eviction(self):
+        grid = cells(0, 10, 0, 10)
+        cache = CoverageCache(max_bytes=2 * grid.nbytes, **ONE_DEGREE)
+        for lat in [0, 10, 20]:
+            cache.store('AvgLandTemp', f'Lat({lat}:{lat + 10}), Long(0:10)', grid)
+        assert cache.stats['evictions'] == 1
+        assert cache.lookup('AvgLandTemp', 'Lat(0:10), Long(0:10)') is None
+        assert cache.current_bytes == 2 * grid.nbytes
+
+    # the given axis order is used instead of the order in the subset
+    def test_axis_order(self):
+        cache = CoverageCache(**ONE_DEGREE)
+        cache.store('AvgLandTemp', 'Long(0:40), Lat(30:60)', cells(30, 60, 0, 40))
+        assert np.array_equal(cache.lookup('AvgLandTemp', 'Long(10:20), Lat(40:50)'), cells(40, 50, 10, 20))
+
+    # the axis order, cell size and north-first latitudes are taken from the coverage description
+    def test_descending_axis(self):
+        description = parse_coverage_descriptions(read_fixture('describe_coverage_AvgLandTemp.xml'))['AvgLandTemp']
+        cache = CoverageCache()
+        assert cache.store('AvgLandTemp', 'Long(0:40), Lat(30:60), ansi("2014-07")', fine_cells(30, 60, 0, 40), description)
+        grid = cache.lookup('AvgLandTemp', 'Lat(55:60), Long(0:2), ansi("2014-07")')
+        assert np.array_equal(grid, fine_cells(55, 60, 0, 2))
+        assert np.array_equal(cache.lookup('AvgLandTemp', 'Lat(30:30.5), Long(39:40), ansi("2014-07")'), fine_cells(30, 30.5, 39, 40))
+        assert np.array_equal(cache.lookup('AvgLandTemp', 'Lat(59.95), Long(0:40), ansi("2014-07")'), fine_cells(59.9, 60, 0, 40)[0])
+        # a grid in the wrong order or of another resolution doesn't match the description
+        assert not cache.store('AvgLandTemp', 'Lat(30:60), Long(0:20), ansi("2014-07")', fine_cells(30, 60, 0, 20).T, description)
+        assert not cache.store('AvgLandTemp', 'Lat(30:60), Long(0:40), ansi("2014-07")', cells(30, 60, 0, 40), description)
+
+# this tests answering Datacube queries from the coverage cache
+class Test_local_answers():
+    # sub-requests and simple aggregations don't reach the server
+    def test_sub_requests(self):
+        with StubServer(grid_responder) as stub, DatabaseConnection(stub.url, coverage_cache=CoverageCache(**ONE_DEGREE)) as my_dbc:
+            full = make_datacube(my_dbc, 'Lat(30:60), Long(0:40)').execute()
+            assert full == cells(30, 60, 0, 40).ravel().tolist()
+            part = cells(40, 50, 10, 20)
+            assert make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').execute() == part.ravel().tolist()
+            assert np.array_equal(make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').execute(return_type='grid'), part)
+            assert make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').avg().execute() == [part.mean()]
+            assert make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').agg(['min', 'max', 'sum', 'count']).execute() == \
+                {'min': part.min(), 'max': part.max(), 'sum': part.sum(), 'count': float(part.size)}
+            assert len(stub.queries) == 1
+
+    # requests outside the cached grid, with conditions or other formats are sent
+    def test_sent(self):
+        with StubServer(grid_responder) as stub, DatabaseConnection(stub.url, coverage_cache=CoverageCache(**ONE_DEGREE)) as my_dbc:
+            make_datacube(my_dbc, 'Lat(30:60), Long(0:40)').execute()
+            make_datacube(my_dbc, 'Lat(20:50), Long(10:20)').execute()
+            assert make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').avg('$c > 40000').execute() == [-1.0]
+            make_datacube(my_dbc, 'Lat(40:50), Long(10:20)').set_format('PNG').execute()
+            assert len(stub.queries) == 4
+
+    # aggregations over regions that aren't cached are sent and don't fill the cache
+    def test_aggregation_not_cached(self):
+        cache = CoverageCache(**ONE_DEGREE)
+        with StubServer(grid_responder) as stub, DatabaseConnection(stub.url, coverage_cache=cache) as my_dbc:
+            assert make_datacube(my_dbc, 'Lat(30:60), Long(0:40)').max().execute() == [-1.0]
+            assert cache.entries == {}
+
+    # the coverage description is fetched from the catalog of the dbc, north-first grids are sliced correctly
+    def test_descending_axis(self):
+        with StubServer(fine_responder, wcs_responder) as stub, DatabaseConnection(stub.url, coverage_cache=CoverageCache()) as my_dbc:
+            full = make_datacube(my_dbc, 'Lat(30:60), Long(0:40), ansi("2014-07")').execute()
+            assert full == fine_cells(30, 60, 0, 40).ravel().tolist()
+            part = make_datacube(my_dbc, 'Lat(55:60), Long(0:2), ansi("2014-07")').execute()
+            assert part == fine_cells(55, 60, 0, 2).ravel().tolist()
+            assert len(stub.queries) == 1
+            assert len(stub.get_requests) == 1
@@ -0,0 +1,161 @@
+import sys
+import os
+import threading
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from coverage_catalog_module import CoverageCatalog, CoverageDescription, parse_coverage_descriptions, parse_capabilities
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer, read_fixture, wcs_responder
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+# this tests parsing the recorded DescribeCoverage and GetCapabilities responses
+class Test_parse():
+    # axes, extents, grid sizes and bands of a referenceable grid with an irregular time axis
+    def test_referenceable_grid(self):
+        description = parse_coverage_descriptions(read_fixture('describe_coverage_AvgLandTemp.xml'))['AvgLandTemp']
+        assert [axis.name for axis in description.axes] == ['ansi', 'Lat', 'Long']
+        assert description.grid_shape == (12, 1800, 3600)
+        assert description.bounds('Lat') == (-90.0, 90.0)
+        assert description.bounds('ansi') == ('2014-01-01T00:00:00.000Z', '2014-12-01T00:00:00.000Z')
+        assert description.axis('Long').resolution == pytest.approx(0.1)
+        assert len(description.axis('ansi').coefficients) == 12 and description.axis('ansi').resolution is None
+        assert description.bands == (('Gray', 'float32'),) and description.cell_bytes == 4
+        assert description.subtype == 'ReferenceableGridCoverage'
+
+    # a rectified grid with its CRS
+    def test_rectified_grid(self):
+        description = parse_coverage_descriptions(read_fixture('describe_coverage_mean_summer_airtemp.xml'))['mean_summer_airtemp']
+        assert description.grid_shape == (711, 886)
+        assert description.crs == 'http://ows.rasdaman.org/def/crs/EPSG/0/4326'
+        assert description.cell_bytes == 1
+
+    # the storage direction and order of the axes come from the offset vectors
+    def test_directions(self):
+        description = parse_coverage_descriptions(read_fixture('describe_coverage_AvgLandTemp.xml'))['AvgLandTemp']
+        assert [axis.direction for axis in description.axes] == [1, -1, 1]
+        assert description.grid_order == ('ansi', 'Lat', 'Long')
+        restored = CoverageDescription.from_dict(description.to_dict())
+        assert restored.axis('Lat').direction == -1 and restored.grid_order == description.grid_order
+        description = parse_coverage_descriptions(read_fixture('describe_coverage_mean_summer_airtemp.xml'))['mean_summer_airtemp']
+        assert description.axis('Lat').direction == -1 and description.axis('Long').direction == 1
+
+    # the coverage names of the capabilities, and exception reports
+    def test_capabilities_and_errors(self):
+        assert parse_capabilities(read_fixture('get_capabilities.xml')) == ['AvgLandTemp', 'mean_summer_airtemp']
+        with pytest.raises(ValueError, match='does not exist'):
+            parse_coverage_descriptions(read_fixture('exception_report.xml'))
+        with pytest.raises(ValueError):
+            parse_capabilities(b'<html>')
+
+# this tests the shapes of subsets computed from a description
+class Test_subset_shape():
+    description = parse_coverage_descriptions(read_fixture('describe_coverage_AvgLandTemp.xml'))['AvgLandTemp']
+
+    # trims count the cells they overlap, slices drop their axis, unnamed axes keep their size
+    def test_shapes(self):
+        assert self.description.subset_shape('Lat(0:10), Long(0:20), ansi("2014-01")') == (100, 200)
+        assert self.description.subset_shape('ansi("2014-03":"2014-06")') == (4, 1800, 3600)
+        assert self.description.subset_shape('Lat(0.05:0.15), Long(*:-170)') == (12, 2, 100)
+        assert self.description.subset_shape() == (12, 1800, 3600)
+
+    # subsets outside of the extent or of unknown axes are rejected
+    def test_invalid(self):
+        for subset in ['Lat(80:100)', 'Height(0:10)', 'ansi("2016-01")', 'Lat("2014-01")', 'Lat(0:1), Lat(0:1)', 'Lat(10:0)']:
+            with pytest.raises(ValueError):
+                self.description.validate_subset(subset)
+
+# this tests fetching and caching descriptions
+class Test_catalog():
+    # a description is fetched once, later lookups are answered from memory
+    def test_memory(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            catalog = CoverageCatalog(my_dbc)
+            assert catalog.grid_shape('AvgLandTemp') == (12, 1800, 3600)
+            assert catalog.axis_bounds('AvgLandTemp', 'Long') == (-180.0, 180.0)
+            assert catalog.grid_shape('AvgLandTemp', 'Lat(0:10)') == (12, 100, 3600)
+            assert len(stub.get_requests) == 1
+            assert stub.get_requests[0] == {'service': 'WCS', 'version': '2.0.1', 'request': 'DescribeCoverage',
+                                            'coverageId': 'AvgLandTemp'}
+            assert catalog.coverage_ids() == ['AvgLandTemp', 'mean_summer_airtemp']
+            assert catalog.coverage_ids() == ['AvgLandTemp', 'mean_summer_airtemp']
+            assert len(stub.get_requests) == 2
+
+    # entries expire after their TTL
+    def test_ttl(self):
+        clock = FakeClock()
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            catalog = CoverageCatalog(my_dbc, ttl=60, clock=clock)
+            catalog.describe('AvgLandTemp')
+            clock.now += 59
+            catalog.describe('AvgLandTemp')
+            assert len(stub.get_requests) == 1
+            clock.now += 2
+            catalog.describe('AvgLandTemp')
+            assert len(stub.get_requests) == 2 and catalog.stats['expirations'] == 1
+
+    # a new catalog on the same directory reads the descriptions from disk
+    def test_disk(self, tmp_path):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            CoverageCatalog(my_dbc, directory=str(tmp_path)).describe('mean_summer_airtemp')
+            catalog = CoverageCatalog(my_dbc, directory=str(tmp_path))
+            assert catalog.grid_shape('mean_summer_airtemp') == (711, 886)
+            assert len(stub.get_requests) == 1 and catalog.stats['disk_hits'] == 1
+
+    # lookups in memory don't wait for a slow disk write
+    def test_write_outside_lock(self, tmp_path):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            catalog = CoverageCatalog(my_dbc, directory=str(tmp_path))
+            catalog.describe('AvgLandTemp')
+            writing, release = threading.Event(), threading.Event()
+            write_disk = catalog._write_disk
+
+            def slow_write(*args):
+                writing.set()
+                release.wait(5)
+                write_disk(*args)
+
+            catalog._write_disk = slow_write
+            writer = threading.Thread(target=catalog.describe, args=('mean_summer_airtemp',))
+            writer.start()
+            assert writing.wait(5)
+            assert catalog.grid_shape('AvgLandTemp') == (12, 1800, 3600)
+            release.set()
+            writer.join()
+            assert CoverageCatalog(my_dbc, directory=str(tmp_path)).grid_shape('mean_summer_airtemp') == (711, 886)
+            assert len(stub.get_requests) == 2
+
+    # missing descriptions of several coverages are fetched in one request
+    def test_prefetch(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            catalog = CoverageCatalog(my_dbc)
+            catalog.describe('AvgLandTemp')
+            descriptions = catalog.prefetch(['AvgLandTemp', 'mean_summer_airtemp'])
+            assert set(descriptions) == {'AvgLandTemp', 'mean_summer_airtemp'}
+            assert [request['coverageId'] for request in stub.get_requests] == ['AvgLandTemp', 'mean_summer_airtemp']
+
+    # failed requests report their status, or the message of an exception report
+    def test_failed_requests(self):
+        with StubServer(get_responder=lambda params: (500, b'<html><body>Internal Server Error</body></html>')) as stub, \
+                DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(ValueError, match='status 500'):
+                CoverageCatalog(my_dbc).coverage_ids()
+            with pytest.raises(ValueError, match='status 500'):
+                CoverageCatalog(my_dbc).describe('AvgLandTemp')
+
+    # unknown coverages raise the server's message
+    def test_unknown(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(ValueError, match='does not exist'):
+                CoverageCatalog(my_dbc).describe('NoSuchThing')
@@ -7,8 +7,15 @@ src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 # Add the src directory to the Python path
 sys.path.insert(0, src_dir)
 
+import threading
+import time
 import pytest
+import database_connection_object_module
+import query_cache_module
 from database_connection_object_module import DatabaseConnection
+from query_cache_module import QueryCache
+from datacube_basic_module import Datacube
+from helper_methods import StubServer
 
 class Test_init_dbc():
     # initialize dbc() instance correctly by passing a string
@@ -21,6 +28,13 @@ class Test_init_dbc():
         with pytest.raises(TypeError):
             my_dbc = DatabaseConnection(2)
 
+    # initialize dbc() instance with a pool size that is not a positive integer
+    def test_init_bad_pool_size(self):
+        with pytest.raises(TypeError):
+            DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows", pool_size="4")
+        with pytest.raises(ValueError):
+            DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows", pool_size=0)
+
 # this tests send_query()
 class Test_send_query():
     # send incorrect query
@@ -40,3 +54,109 @@ class Test_send_query():
         my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
         with pytest.raises(TypeError):
             my_dbc.send_query(1)
+
+# this tests the pooled keep-alive session
+class Test_connection_pool():
+    # consecutive queries go over one kept-alive connection
+    def test_connection_reused(self):
+        with StubServer() as stub, DatabaseConnection(stub.url) as my_dbc:
+            for _ in range(5):
+                assert my_dbc.send_query('for $c in (AvgLandTemp) return 1').content == b'1'
+            assert stub.connections_opened == 1
+
+    # datacubes sharing a dbc share its pool
+    def test_pool_shared_between_datacubes(self):
+        with StubServer() as stub, DatabaseConnection(stub.url) as my_dbc:
+            first = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c")
+            second = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c")
+            first.execute()
+            second.execute()
+            assert stub.connections_opened == 1
+
+    # close() drops the pool, the next query opens a new one
+    def test_close_and_reopen(self):
+        with StubServer() as stub:
+            my_dbc = DatabaseConnection(stub.url)
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            my_dbc.close()
+            assert my_dbc.session is None
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            my_dbc.close()
+            assert stub.connections_opened == 2
+
+    # a non-200 answer is still reported as an error
+    def test_server_error(self):
+        with StubServer(lambda query: (400, b'bad query')) as stub, DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(Exception):
+                my_dbc.send_query('for $c in')
+
+# Sends the same query from several threads at once and collects what each of them got
+def send_concurrently(my_dbc, query, threads=8):
+    outcomes = [None] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            outcomes[i] = my_dbc.send_query(query)
+        except Exception as error:
+            outcomes[i] = error
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return outcomes
+
+def slow_responder(body, status=200):
+    def responder(query):
+        time.sleep(0.3)
+        return status, body
+    return responder
+
+# this tests coalescing of identical in-flight queries
+class Test_coalescing():
+    # concurrent identical queries share one request and one response
+    def test_identical_queries_share_request(self):
+        with StubServer(slow_responder(b'12.5')) as stub, DatabaseConnection(stub.url) as my_dbc:
+            outcomes = send_concurrently(my_dbc, 'for $c in (AvgLandTemp) return avg($c)')
+            assert len(stub.queries) == 1
+            assert all(outcome.content == b'12.5' for outcome in outcomes)
+            assert my_dbc.stats == {'requests_sent': 1, 'coalesced': 7}
+
+    # every waiter gets the same exception
+    def test_shared_error(self):
+        with StubServer(slow_responder(b'bad query', 400)) as stub, DatabaseConnection(stub.url) as my_dbc:
+            outcomes = send_concurrently(my_dbc, 'for $c in')
+            assert len(stub.queries) == 1
+            assert all(outcome is outcomes[0] for outcome in outcomes)
+            assert isinstance(outcomes[0], Exception)
+
+    # a query is fingerprinted at most once per send, and only when a cache needs it
+    def test_fingerprint_once(self, monkeypatch):
+        calls = []
+        def counting_fingerprint(wcps_query):
+            calls.append(wcps_query)
+            return fingerprint(wcps_query)
+        fingerprint = database_connection_object_module.fingerprint_query
+        monkeypatch.setattr(database_connection_object_module, 'fingerprint_query', counting_fingerprint)
+        monkeypatch.setattr(query_cache_module, 'fingerprint_query', counting_fingerprint)
+        with StubServer() as stub, DatabaseConnection(stub.url) as my_dbc:
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            assert calls == []
+        with StubServer() as stub, DatabaseConnection(stub.url, cache=QueryCache()) as my_dbc:
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            assert len(calls) == 1
+            assert my_dbc.send_query('for $c in (AvgLandTemp) return 1').content == b'1' and len(calls) == 2
+            assert len(stub.queries) == 1
+
+    # coalescing can be switched off, and queries sent one after another aren't coalesced
+    def test_no_coalescing(self):
+        with StubServer(slow_responder(b'12.5')) as stub, DatabaseConnection(stub.url, coalesce=False) as my_dbc:
+            send_concurrently(my_dbc, 'for $c in (AvgLandTemp) return avg($c)', threads=4)
+            assert len(stub.queries) == 4
+        with StubServer() as stub, DatabaseConnection(stub.url) as my_dbc:
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            my_dbc.send_query('for $c in (AvgLandTemp) return 1')
+            assert my_dbc.stats == {'requests_sent': 2, 'coalesced': 0}
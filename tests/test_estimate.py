@@ -0,0 +1,72 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from coverage_catalog_module import CoverageCatalog
+from database_connection_object_module import DatabaseConnection
+from datacube_basic_module import Datacube, Coverage
+from helper_methods import StubServer, wcs_responder
+
+# this tests the size estimates of queries made from cached coverage metadata
+class Test_estimate():
+    # cells, shape and bytes of a trimmed coverage, for every format
+    def test_trim(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            estimate = Datacube(my_dbc).coverage_instance('AvgLandTemp', 'c').subset('Lat(0:10), Long(0:20)', '$c').estimate()
+            assert estimate['shape'] == (12, 100, 200) and estimate['cells'] == 240000
+            assert estimate['scan_bytes'] == 240000 * 4
+            assert estimate['bytes']['BINARY'] == 240000 * 4
+            assert estimate['bytes']['CSV'] > estimate['bytes']['BINARY']
+            assert estimate['format'] == 'CSV' and estimate['response_bytes'] == estimate['bytes']['CSV']
+            # No query is sent, only the metadata request
+            assert stub.queries == [] and len(stub.get_requests) == 1
+
+    # a sliced axis is left out, and the configured format is reported
+    def test_slice_and_format(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            datacube = Datacube(my_dbc).coverage_instance('AvgLandTemp', 'c').subset('ansi("2014-01")', '$c').set_format('GEOTIFF')
+            estimate = datacube.estimate()
+            assert estimate['shape'] == (1800, 3600)
+            assert estimate['response_bytes'] == estimate['bytes']['GEOTIFF'] > 1800 * 3600 * 4
+
+    # an aggregation returns a single value, but the server still reads the whole subset
+    def test_aggregation(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            datacube = Datacube(my_dbc).coverage_instance('AvgLandTemp', 'c').subset('Lat(0:10), Long(0:20)', '$c')
+            datacube.agg({'low': ('MIN', None), 'high': ('MAX', None)})
+            estimate = datacube.estimate()
+            assert estimate['cells'] == 2 and estimate['shape'] == ()
+            assert estimate['scan_cells'] == 240000
+
+    # cached metadata is used without a request, also across Datacube instances sharing the dbc
+    def test_no_request_when_cached(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            Datacube(my_dbc).coverage_instance('mean_summer_airtemp', 'm').estimate()
+            estimate = Datacube(my_dbc).coverage_instance('mean_summer_airtemp', 'm').subset('Lat(-30:-20)', '$m').estimate()
+            assert len(stub.get_requests) == 1
+            assert estimate['shape'][1] == 886 and estimate['shape'][0] < 711
+            assert estimate['bytes']['BINARY'] == estimate['cells']
+
+    # expressions over several coverages are bounded by their largest operand, with one metadata request
+    def test_compute(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            catalog = CoverageCatalog(my_dbc)
+            a, b = Coverage(['AvgLandTemp'], 'a'), Coverage(['mean_summer_airtemp'], 'b')
+            estimate = Datacube(my_dbc).compute(a + b).estimate(catalog)
+            assert estimate['cells'] == 12 * 1800 * 3600
+            assert estimate['scan_cells'] == 12 * 1800 * 3600 + 711 * 886
+            assert len(stub.get_requests) == 1 and catalog.stats['requests_sent'] == 1
+
+    # subsets outside the coverage and queries without coverages are rejected
+    def test_invalid(self):
+        with StubServer(get_responder=wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(ValueError):
+                Datacube(my_dbc).coverage_instance('AvgLandTemp', 'c').subset('Lat(0:100)', '$c').estimate()
+            with pytest.raises(ValueError):
+                Datacube(my_dbc).subset('Lat(0:10)').estimate()
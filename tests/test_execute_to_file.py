@@ -0,0 +1,94 @@
+import sys
+import os
+import io
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from query_cache_module import QueryCache
+from helper_methods import StubServer
+
+# A rendered map that is larger than one chunk
+IMAGE = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 12000
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('ansi("2014-07")', '$c').set_format('PNG')
+
+# Records the size of every write
+class RecordingFile(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(len(data))
+        return super().write(data)
+
+# this tests streaming undecoded results to files and file objects
+class Test_execute_to_file():
+    # the body is written in chunks, and the transfer is reported
+    def test_stream(self):
+        with StubServer(lambda query: IMAGE) as stub, DatabaseConnection(stub.url) as my_dbc:
+            datacube = make_datacube(my_dbc)
+            destination = RecordingFile()
+            report = datacube.execute_to_stream(destination, chunk_size=65536)
+            assert destination.getvalue() == IMAGE
+            assert report['bytes'] == len(IMAGE) and report['bytes_per_second'] > 0
+            assert len(destination.writes) > 1 and max(destination.writes) <= 65536
+            assert 'image/png' in stub.queries[0] and datacube.variables == []
+
+    # the file is complete once it exists, and no temporary file is left behind
+    def test_file(self, tmp_path):
+        with StubServer(lambda query: IMAGE) as stub, DatabaseConnection(stub.url) as my_dbc:
+            path = tmp_path / 'map.png'
+            report = make_datacube(my_dbc).execute_to_file(path)
+            assert path.read_bytes() == IMAGE
+            assert report['path'] == str(path) and report['bytes'] == len(IMAGE)
+            assert os.listdir(tmp_path) == ['map.png']
+
+    # a failed query leaves the previous file as it was
+    def test_failure(self, tmp_path):
+        with StubServer(lambda query: (500, b'error')) as stub, DatabaseConnection(stub.url) as my_dbc:
+            path = tmp_path / 'map.png'
+            path.write_bytes(b'old map')
+            with pytest.raises(Exception):
+                make_datacube(my_dbc).execute_to_file(str(path))
+            assert path.read_bytes() == b'old map' and os.listdir(tmp_path) == ['map.png']
+
+    # new files get the permissions the umask allows, replaced files keep theirs
+    @pytest.mark.skipif(os.name != 'posix', reason="POSIX permissions")
+    def test_permissions(self, tmp_path):
+        umask = os.umask(0o022)
+        try:
+            with StubServer(lambda query: IMAGE) as stub, DatabaseConnection(stub.url) as my_dbc:
+                make_datacube(my_dbc).execute_to_file(tmp_path / 'map.png')
+                assert os.stat(tmp_path / 'map.png').st_mode & 0o777 == 0o644
+                os.chmod(tmp_path / 'map.png', 0o640)
+                make_datacube(my_dbc).execute_to_file(tmp_path / 'map.png')
+                assert os.stat(tmp_path / 'map.png').st_mode & 0o777 == 0o640
+        finally:
+            os.umask(umask)
+
+    # cached results are streamed as well
+    def test_cached(self, tmp_path):
+        with StubServer(lambda query: IMAGE) as stub, DatabaseConnection(stub.url, cache=QueryCache()) as my_dbc:
+            my_dbc.cache.put(stub.url, make_datacube(my_dbc).construct_query(), IMAGE)
+            make_datacube(my_dbc).execute_to_file(tmp_path / 'map.png')
+            assert (tmp_path / 'map.png').read_bytes() == IMAGE and stub.queries == []
+
+    # invalid destinations and chunk sizes are rejected before the query is sent
+    def test_invalid(self):
+        with StubServer(lambda query: IMAGE) as stub, DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(TypeError):
+                make_datacube(my_dbc).execute_to_stream('map.png')
+            with pytest.raises(ValueError):
+                make_datacube(my_dbc).execute_to_stream(io.BytesIO(), chunk_size=0)
+            with pytest.raises(TypeError):
+                make_datacube(my_dbc).execute_to_file(42)
+            assert stub.queries == []
@@ -0,0 +1,77 @@
+import sys
+import os
+import re
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from prepared_query_module import PreparedQuery
+from helper_methods import StubServer
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(${low}:${high}), ansi("${month}")', '$c')
+
+# Answers a count() query with the sum of its latitude bounds
+def bounds_responder(query):
+    low, high = re.search(r'Lat\(([-\d.]+):([-\d.]+)\)', query).groups()
+    return str(float(low) + float(high)).encode('utf-8')
+
+# this tests prepare() and bind()
+class Test_prepare():
+    # binding gives the same text as building the query with the values
+    def test_same_as_builder(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        prepared = make_datacube(my_dbc).count('$c > ${threshold}').prepare()
+        assert prepared.parameters == ('low', 'high', 'month', 'threshold')
+        built = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(30:60.5), ansi("2014-07")', '$c').count('$c > 12')
+        assert prepared.bind(low=30, high=60.5, month='2014-07', threshold=12) == built.construct_query()
+
+    # preparing leaves the datacube as it was
+    def test_instance_unchanged(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        datacube = make_datacube(my_dbc).avg()
+        query = datacube.construct_query()
+        datacube.prepare()
+        assert datacube.construct_query() == query
+
+    # missing, unknown and unusable values are rejected
+    def test_invalid_parameters(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        prepared = make_datacube(my_dbc).avg().prepare()
+        with pytest.raises(ValueError):
+            prepared.bind(low=1, high=2)
+        with pytest.raises(ValueError):
+            prepared.bind(low=1, high=2, month='2014-07', other=3)
+        with pytest.raises(TypeError):
+            prepared.bind(low=1, high=[2], month='2014-07')
+
+    # string values can't break out of their slot
+    def test_hostile_value(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        prepared = make_datacube(my_dbc).avg().prepare()
+        for month in ['2014-07")] return encode($c, "text/csv") (', '2014-07"', '2014 return 1', '2014-07]', '2014-07)', '{1}']:
+            with pytest.raises(ValueError):
+                prepared.bind(low=1, high=2, month=month)
+        assert 'ansi("2014-07-01T00:00:00.000Z")' in prepared.bind(low=1, high=2, month='2014-07-01T00:00:00.000Z')
+
+    # a '${' that isn't a slot is reported when preparing
+    def test_malformed_slot(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(ValueError):
+            Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(${1low}:10)', '$c').prepare()
+
+    # a batch of parameter sets is rendered and executed in order
+    def test_many(self):
+        with StubServer(bounds_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            prepared = make_datacube(my_dbc).count().prepare()
+            param_sets = [{'low': low, 'high': low + 10, 'month': '2014-01'} for low in range(0, 80, 10)]
+            assert len(prepared.bind_many(param_sets)) == 8
+            assert prepared.execute_many(param_sets, max_workers=3) == [[2.0 * low + 10] for low in range(0, 80, 10)]
+            assert prepared.execute(low=1, high=2, month='2014-01') == [3.0]
+            assert len(stub.queries) == 9
@@ -0,0 +1,104 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from query_ast_module import Query, Binding, VariableList, Expression, Aggregation, Struct, Encode, render_query, substitute_variables
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+
+def make_datacube():
+    my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(0:10)', '$c')
+
+# this tests the query tree nodes
+class Test_nodes():
+    # nodes can't be changed after they are built
+    def test_immutable(self):
+        node = Aggregation('AVG', VariableList())
+        with pytest.raises(AttributeError):
+            node.operation = 'MIN'
+        with pytest.raises(AttributeError):
+            node.extra = 1
+
+    # equal trees are equal and hash alike
+    def test_equality(self):
+        first = Struct((('min', Aggregation('MIN', VariableList())), ('count', Aggregation('COUNT', Expression('$c > 1')))))
+        second = Struct([('min', Aggregation('MIN', VariableList())), ('count', Aggregation('COUNT', Expression('$c > 1')))])
+        assert first == second and hash(first) == hash(second)
+        assert first != first.replace(items=first.items[:1])
+        assert len({first, second}) == 1
+
+    # replace() derives a variant and rejects unknown fields
+    def test_replace(self):
+        node = Encode(Expression('$c * 2'), 'image/png')
+        variant = node.replace(mime_type='text/csv')
+        assert variant.operand is node.operand and variant.mime_type == 'text/csv'
+        with pytest.raises(TypeError):
+            node.replace(format='text/csv')
+
+    # unknown aggregations are rejected
+    def test_unknown_aggregation(self):
+        with pytest.raises(ValueError):
+            Aggregation('MEDIAN', VariableList())
+
+# this tests rendering and building queries from a Datacube
+class Test_render():
+    # the tree renders the text the builder always produced
+    def test_same_text(self):
+        assert make_datacube().avg().construct_query() == 'for $c in (AvgLandTemp)\nreturn \navg($c[Lat(0:10)] )'
+        assert make_datacube().agg(['min', ('count', '$c > 1')]).construct_query() == \
+            'for $c in (AvgLandTemp)\nreturn \n{min: min($c[Lat(0:10)] ); count: count($c[Lat(0:10)] > 1)}'
+        assert make_datacube().encode('$c * 2').set_format('PNG').construct_query() == \
+            'for $c in (AvgLandTemp)\nreturn \nencode($c[Lat(0:10)] * 2, "image/png")'
+        assert make_datacube().set_format('CSV').construct_query() == \
+            'for $c in (AvgLandTemp)\nreturn \nencode($c[Lat(0:10)] , "text/csv")'
+
+    # equal settings build equal trees, and rendering them again is a cache hit
+    def test_memoized(self):
+        query = make_datacube().avg().build_query()
+        assert query == make_datacube().avg().build_query()
+        hits = render_query.cache_info().hits
+        make_datacube().avg().construct_query()
+        assert render_query.cache_info().hits == hits + 1
+
+    # variants with another subset leave the original untouched
+    def test_with_subset(self):
+        query = make_datacube().avg().build_query()
+        variant = query.with_subset('$c', 'Lat(10:20)')
+        assert variant.render() == 'for $c in (AvgLandTemp)\nreturn \navg($c[Lat(10:20)] )'
+        assert query.render() == 'for $c in (AvgLandTemp)\nreturn \navg($c[Lat(0:10)] )'
+        assert variant.bindings is query.bindings
+        with pytest.raises(ValueError):
+            query.with_subset('$d', 'Lat(1)')
+
+    # trees can be built directly
+    def test_direct(self):
+        query = Query([Binding('$c', ['AvgLandTemp'])], [('$c', 'Lat(0:10)')], None, Aggregation('AVG', VariableList()))
+        assert query == make_datacube().avg().build_query()
+        assert query.fingerprint() == make_datacube().avg().fingerprint()
+
+# this tests the replacement of variables with their subsets
+class Test_substitute_variables():
+    # a variable that is the prefix of another one only matches itself
+    def test_prefix_variables(self):
+        subsets = (('$c', 'Lat(1)'), ('$c1', 'Lat(2)'))
+        assert substitute_variables('$c + $c1 - $c12', subsets) == '$c[Lat(1)] + $c1[Lat(2)] - $c12'
+
+    # variables without a subset and string literals are left alone
+    def test_untouched(self):
+        subsets = (('$c', 'Lat(1)'), ('$d', None))
+        assert substitute_variables('$d + $c > "$c"', subsets) == '$d + $c[Lat(1)] > "$c"'
+        assert substitute_variables('$c + 1', (('$c', None),)) == '$c + 1'
+
+    # the builder renders both variables of a query with their own subsets
+    def test_datacube_prefix(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        query = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").coverage_instance("AvgLandTemp", "c1") \
+            .subset('Lat(1)', '$c').subset('Lat(2)', '$c1').set_format('CSV').encode('$c + $c1').construct_query()
+        assert query.endswith('encode($c[Lat(1)] + $c1[Lat(2)], "text/csv")')
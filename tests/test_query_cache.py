@@ -0,0 +1,148 @@
+import sys
+import os
+import threading
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from query_cache_module import QueryCache
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer
+
+URL = "https://ows.rasdaman.org/rasdaman/ows"
+QUERY = 'for $c in (AvgLandTemp) return avg($c)'
+
+# Fake clock so that expiry can be tested without sleeping
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+# this tests the in-memory tier
+class Test_memory_cache():
+    # a stored result is found again for the same endpoint only
+    def test_hit_and_miss(self):
+        cache = QueryCache()
+        assert cache.get(URL, QUERY) is None
+        cache.put(URL, QUERY, b'12.5')
+        assert cache.get(URL, QUERY) == b'12.5'
+        assert cache.get("http://localhost/rasdaman/ows", QUERY) is None
+        assert cache.stats['hits'] == 1 and cache.stats['misses'] == 2
+
+    # the least recently used entries are evicted once the byte limit is exceeded
+    def test_lru_eviction(self):
+        cache = QueryCache(max_bytes=10)
+        cache.put(URL, 'q1', b'aaaa')
+        cache.put(URL, 'q2', b'bbbb')
+        cache.get(URL, 'q1')
+        cache.put(URL, 'q3', b'cccc')
+        assert cache.get(URL, 'q2') is None
+        assert cache.get(URL, 'q1') == b'aaaa' and cache.get(URL, 'q3') == b'cccc'
+        assert cache.stats['evictions'] == 1 and cache.current_bytes == 8
+
+    # coverages can have their own TTL, the default applies otherwise
+    def test_ttl_per_coverage(self):
+        clock = Clock()
+        cache = QueryCache(default_ttl=100, coverage_ttls={'AvgLandTemp': 10}, clock=clock)
+        cache.put(URL, QUERY, b'12.5')
+        cache.put(URL, 'for $c in (mean_summer_airtemp) return avg($c)', b'7')
+        clock.now += 50
+        assert cache.get(URL, QUERY) is None
+        assert cache.get(URL, 'for $c in (mean_summer_airtemp) return avg($c)') == b'7'
+        assert cache.stats['expirations'] == 1
+
+    # invalid sizes are rejected
+    def test_bad_size(self):
+        with pytest.raises(TypeError):
+            QueryCache(max_bytes='1MB')
+        with pytest.raises(ValueError):
+            QueryCache(max_bytes=-1)
+
+# this tests the on-disk tier
+class Test_disk_cache():
+    # a new cache over the same directory finds the stored results
+    def test_survives_restart(self, tmp_path):
+        QueryCache(directory=str(tmp_path)).put(URL, QUERY, b'12.5')
+        cache = QueryCache(directory=str(tmp_path))
+        assert cache.get(URL, QUERY) == b'12.5'
+        assert cache.get(URL, QUERY) == b'12.5'
+        assert cache.stats['disk_hits'] == 1 and cache.stats['hits'] == 1
+
+    # expired entries are removed from disk
+    def test_disk_expiry(self, tmp_path):
+        clock = Clock()
+        QueryCache(directory=str(tmp_path), default_ttl=10, clock=clock).put(URL, QUERY, b'12.5')
+        clock.now += 20
+        assert QueryCache(directory=str(tmp_path), clock=clock).get(URL, QUERY) is None
+        assert os.listdir(tmp_path) == []
+
+    # the disk tier deletes its least recently used entries once it exceeds its budget, also after a restart
+    def test_disk_budget(self, tmp_path):
+        cache = QueryCache(max_bytes=0, directory=str(tmp_path), max_disk_bytes=10)
+        cache.put(URL, 'for $c in (A) return 1', b'1234')
+        cache.put(URL, 'for $c in (B) return 1', b'5678')
+        assert cache.get(URL, 'for $c in (A) return 1') == b'1234'
+        cache.put(URL, 'for $c in (C) return 1', b'9012')
+        assert cache.stats['disk_evictions'] == 1 and cache.disk_bytes == 8
+        assert cache.get(URL, 'for $c in (B) return 1') is None
+        assert len(os.listdir(tmp_path)) == 4
+        restarted = QueryCache(max_bytes=0, directory=str(tmp_path), max_disk_bytes=10)
+        assert restarted.disk_bytes == 8
+        restarted.put(URL, 'for $c in (D) return 1', b'3456')
+        assert len(os.listdir(tmp_path)) == 4 and restarted.disk_bytes == 8
+        # results larger than the budget aren't written
+        restarted.put(URL, 'for $c in (E) return 1', b'x' * 11)
+        assert len(os.listdir(tmp_path)) == 4
+        with pytest.raises(ValueError):
+            QueryCache(directory=str(tmp_path), max_disk_bytes=-1)
+
+    # lookups in memory don't wait for a slow disk write
+    def test_write_outside_lock(self, tmp_path):
+        cache = QueryCache(directory=str(tmp_path))
+        cache.put(URL, QUERY, b'12.5')
+        writing, release = threading.Event(), threading.Event()
+        write_disk = cache._write_disk
+
+        def slow_write(*args):
+            writing.set()
+            release.wait(5)
+            write_disk(*args)
+
+        cache._write_disk = slow_write
+        writer = threading.Thread(target=cache.put, args=(URL, 'for $c in (B) return 1', b'1'))
+        writer.start()
+        assert writing.wait(5)
+        assert cache.get(URL, QUERY) == b'12.5'
+        release.set()
+        writer.join()
+        assert cache.get(URL, 'for $c in (B) return 1') == b'1'
+
+# this tests the cache in front of send_query()
+class Test_cached_connection():
+    # repeated queries are answered from the cache and decoded the same way
+    def test_repeated_query(self):
+        with StubServer(lambda query: b'12.5 13.5') as stub, DatabaseConnection(stub.url, cache=QueryCache()) as my_dbc:
+            results = [Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute() for _ in range(3)]
+            streamed = list(Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").execute_stream(chunk_size=3))
+            assert results == [[12.5, 13.5]] * 3 and streamed == [12.5, 13.5]
+            assert len(stub.queries) == 1
+
+    # failed queries aren't cached
+    def test_errors_not_cached(self):
+        with StubServer(lambda query: (400, b'bad query')) as stub, DatabaseConnection(stub.url, cache=QueryCache()) as my_dbc:
+            for _ in range(2):
+                with pytest.raises(Exception):
+                    my_dbc.send_query('for $c in')
+            assert len(stub.queries) == 2
+
+    # the cache must be a QueryCache
+    def test_bad_cache(self):
+        with pytest.raises(TypeError):
+            DatabaseConnection(URL, cache={})
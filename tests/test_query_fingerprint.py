@@ -0,0 +1,72 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from query_fingerprint_module import canonicalize_query, fingerprint_query, tokenize_query
+from query_cache_module import QueryCache
+from helper_methods import create_good_dco
+
+URL = "https://ows.rasdaman.org/rasdaman/ows"
+
+# this tests canonicalize_query()
+class Test_canonicalize_query():
+    # whitespace and keyword case don't matter
+    def test_whitespace_and_case(self):
+        assert canonicalize_query('for $c in (AvgLandTemp) return avg($c)') == \
+            canonicalize_query('FOR  $c\n in (AvgLandTemp)\n\tRETURN avg( $c )')
+
+    # variables are renamed by first appearance
+    def test_alpha_renaming(self):
+        assert canonicalize_query('for $c in (AvgLandTemp) return avg($c)') == \
+            canonicalize_query('for $c1 in (AvgLandTemp) return avg($c1)')
+
+    # the order of for bindings doesn't matter, the binding of each variable does
+    def test_binding_order(self):
+        first = 'for $a in (A), $b in (B) return encode($a - $b, "text/csv")'
+        assert canonicalize_query(first) == canonicalize_query('for $b in (B), $a in (A) return encode($a - $b, "text/csv")')
+        assert canonicalize_query(first) != canonicalize_query('for $a in (A), $b in (B) return encode($b - $a, "text/csv")')
+
+    # axis subsets are ordered and numbers normalized, strings are left alone
+    def test_subsets_and_numbers(self):
+        assert canonicalize_query('for $c in (AvgLandTemp) return $c[Long(8.80), Lat(53.08), ansi("2014-01")]') == \
+            canonicalize_query('for $c in (AvgLandTemp) return $c[ansi("2014-01"), Lat(53.080), Long(8.8)]')
+        assert canonicalize_query('for $c in (AvgLandTemp) return $c[ansi("2014-01")]') != \
+            canonicalize_query('for $c in (AvgLandTemp) return $c[ansi("2014-1")]')
+
+    # integers and decimals stay different, arithmetic operands aren't reordered
+    def test_unsafe_rewrites_avoided(self):
+        assert tokenize_query('007 1.50 1e1') == ['7', '1.5', '10.0']
+        assert canonicalize_query('for $c in (A) return $c + 1') != canonicalize_query('for $c in (A) return 1 + $c')
+
+    # coverage and axis names spelled like keywords keep their case, keywords around them don't
+    def test_names_like_keywords(self):
+        assert canonicalize_query('for $c in (Count) return avg($c)') != canonicalize_query('for $c in (count) return avg($c)')
+        assert canonicalize_query('for $c in (A) return $c[Max(0:1)]') != canonicalize_query('for $c in (A) return $c[max(0:1)]')
+        assert canonicalize_query('for $c in (A), $d in (B, Sum) return 1') != canonicalize_query('for $c in (A), $d in (B, sum) return 1')
+        assert canonicalize_query('for $c in (A) return {Min: 1}') != canonicalize_query('for $c in (A) return {min: 1}')
+        assert canonicalize_query('FOR $c IN (Count) RETURN MAX($c[Lat(0:1)])') == canonicalize_query('for $c in (Count) return max($c[Lat(0:1)])')
+        assert tokenize_query('coverage Avg over $x Log(0:2) values 1')[:6] == ['coverage', 'Avg', 'over', '$x', 'Log', '(']
+
+    # non-string input is rejected
+    def test_not_string(self):
+        with pytest.raises(TypeError):
+            canonicalize_query(12)
+
+# this tests fingerprints as cache keys
+class Test_fingerprint_key():
+    # equivalent spellings share one cache entry
+    def test_cache_key(self):
+        cache = QueryCache()
+        cache.put(URL, 'for $c in (AvgLandTemp) return avg($c[Lat(53.08), Long(8.80)])', b'12.5')
+        assert cache.get(URL, 'for $c1 in (AvgLandTemp)\nreturn avg($c1[Long(8.8), Lat(53.08)])') == b'12.5'
+
+    # a Datacube reports the fingerprint of its query
+    def test_datacube_fingerprint(self):
+        my_dco = create_good_dco().subset(var_name='$c', subset='ansi("2014-07")')
+        assert my_dco.fingerprint() == fingerprint_query(my_dco.construct_query())
@@ -0,0 +1,117 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from query_optimizer_module import fold_constants, push_trims, merge_subset_chains, optimize_query
+from query_ast_module import Query, Binding, Expression
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from expression_builder import Variable, Scalar
+
+def make_datacube(optimize=True):
+    my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+    return Datacube(my_dbc, optimize=optimize).coverage_instance("AvgLandTemp", "c").subset('Lat(0:10), Long(0:40)', '$c')
+
+# this tests constant folding
+class Test_fold_constants():
+    # arithmetic on number literals is replaced by its value
+    def test_fold(self):
+        assert fold_constants('$c > 10 + 5 * 2') == '$c > 20'
+        assert fold_constants('(3 + 4) * 2') == '14'
+        assert fold_constants('$c - 4 * 5 + 1') == '$c - 20 + 1'
+        assert fold_constants('7 / 2') == '3.5'
+
+    # numbers bound tighter by a neighbouring operator, strings and divisions by zero are kept
+    def test_unchanged(self):
+        for text in ['$c * 3 + 4', '3 + 4 * $c', '$c / 2 * 3', '1 / 0 + $c', '"1 + 2"', '$c1 + $c2']:
+            assert fold_constants(text) == text
+
+    # results and operands that aren't finite numbers can't be written as WCPS literals
+    def test_not_finite(self):
+        for text in ['$c > 1e400 - 1', '$c > 1e300 * 1e300', '$c < 2 * 1e308 - 1']:
+            assert fold_constants(text) == text
+
+# this tests moving trims onto variables and merging subsets
+class Test_subsets():
+    # a trim of a cell by cell expression is moved onto its variables
+    def test_push_trims(self):
+        assert push_trims('($c - $d)[Lat(0:10)]') == '($c[Lat(0:10)] - $d[Lat(0:10)])'
+        assert push_trims('(abs($c) * 2)[Lat(1)]') == '(abs($c[Lat(1)]) * 2)'
+
+    # trims of aggregations and structs are kept
+    def test_push_trims_unchanged(self):
+        for text in ['(avg($c))[Lat(1)]', '({red: $c})[Lat(1)]', '($c + 1)']:
+            assert push_trims(text) == text
+
+    # subsets applied one after the other become one subset when the later one lies within the earlier one
+    def test_merge(self):
+        assert merge_subset_chains('$c[Lat(0:10)][Lat(0:10)]') == '$c[Lat(0:10)]'
+        assert merge_subset_chains('$c[Lat(0:10)][Lat(2:5)] + 1') == '$c[Lat(2:5)] + 1'
+        assert merge_subset_chains('$c[Lat(0:10)][Long(*:5)]') == '$c[Lat(0:10), Long(*:5)]'
+        assert merge_subset_chains('$c[Lat(0:10)][Lat(20:25)]') == '$c[Lat(0:10)][Lat(20:25)]'
+
+# this tests the optimizer on whole queries
+class Test_optimize_query():
+    # operands used several times are bound once with let
+    def test_let(self):
+        datacube = make_datacube().agg({'mi': 'min', 'ma': 'max', 'av': 'avg', 'su': 'sum', 'co': 'count'})
+        query = datacube.construct_query()
+        assert 'let $e0 := $c[Lat(0:10), Long(0:40)]\n' in query
+        assert query.endswith('{mi: min($e0 ); ma: max($e0 ); av: avg($e0 ); su: sum($e0 ); co: count($e0 )}')
+        report = datacube.optimization_report
+        assert report['changes'] == [('let', '$e0', '$c[Lat(0:10), Long(0:40)]')]
+        assert report['length_after'] < report['length_before']
+
+    # operands using the iterator variable of a condense expression stay where it is bound
+    def test_condense_not_bound(self):
+        operand = '$c[ansi($t), Lat(0:10), Long(0:20)]'
+        result = Expression(f'condense + over $t ansi(0:11) using {operand} * {operand}')
+        query = Query((Binding('$c', ('AvgLandTemp',)),), (('$c', None),), None, result)
+        optimized, report = optimize_query(query)
+        assert optimized.lets == () and report['changes'] == []
+        assert optimized.render() == query.render()
+        # operands of outer variables are bound with let outside of the condense expression only
+        outer = '$c[Lat(0:10), Long(0:20)]'
+        result = Expression(f'{outer} + {outer} + (condense + over $t ansi(0:11) using {outer})')
+        optimized, _ = optimize_query(Query((Binding('$c', ('AvgLandTemp',)),), (('$c', None),), None, result))
+        assert optimized.lets == (('$e0', outer),)
+        assert optimized.render().endswith(f'$e0 + $e0 + (condense + over $t ansi(0:11) using {outer})')
+
+    # a subsetted variable trimmed again in an expression is subset once
+    def test_merged_subset(self):
+        datacube = make_datacube().set_format('CSV').encode('($c - 273.15)[Lat(2:4)]')
+        assert datacube.construct_query().endswith('encode(($c[Lat(2:4), Long(0:40)] - 273.15), "text/csv")')
+        assert [change[0] for change in datacube.optimization_report['changes']] == ['push_trims', 'merge_subsets']
+
+    # folding works on where conditions too, and conditions that are always true are dropped
+    def test_where(self):
+        datacube = make_datacube().where(Variable("c").greater_than(Scalar(10).add(5))).count('$c > 1 + 1')
+        assert datacube.construct_query() == 'for $c in (AvgLandTemp)\nwhere $c > 15\nreturn \ncount($c[Lat(0:10), Long(0:40)] > 2)'
+        query = Query((Binding('$c', ('AvgLandTemp',)),), (('$c', None),), '2 > 1', Expression('$c'))
+        optimized, report = optimize_query(query)
+        assert optimized.where is None and ('drop_where', 'where', None) in report['changes']
+
+    # without optimize=True, queries are sent as they are built
+    def test_disabled(self):
+        datacube = make_datacube(optimize=False).count('$c > 1 + 1')
+        assert datacube.construct_query().endswith('count($c[Lat(0:10), Long(0:40)] > 1 + 1)')
+        assert datacube.optimization_report is None
+
+    # optimizing an optimized query changes nothing
+    def test_idempotent(self):
+        optimized, _ = make_datacube(optimize=False).agg({'mi': 'min', 'ma': 'max', 'av': 'avg'}).optimized_query()
+        again, report = optimize_query(optimized)
+        assert again.render() == optimized.render() and report['changes'] == []
+
+    # only query trees are optimized
+    def test_type(self):
+        with pytest.raises(TypeError):
+            optimize_query('for $c in (AvgLandTemp) return $c')
+        with pytest.raises(TypeError):
+            Datacube(DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows"), optimize='yes')
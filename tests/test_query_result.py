@@ -0,0 +1,67 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import numpy as np
+import pytest
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from query_result_module import QueryResult
+from helper_methods import StubServer
+
+# Counts the calls of the decoder of a Datacube
+class CountingDecoder:
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.calls = []
+
+    def __call__(self, content, return_type=None, **settings):
+        self.calls.append(return_type)
+        return self.decoder(content, return_type=return_type, **settings)
+
+# this tests the lazily decoded results of execute_lazy()
+class Test_query_result():
+    # the query is sent, but the response is only decoded on access
+    def test_execute_lazy(self):
+        with StubServer(lambda query: b'1.5 2.5 3') as stub, DatabaseConnection(stub.url) as my_dbc:
+            datacube = Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)', '$c')
+            result = datacube.execute_lazy()
+            assert len(stub.queries) == 1 and datacube.variables == []
+            assert result.raw == b'1.5 2.5 3' and len(result) == 9 and result.views == {}
+            assert result.as_list() == [1.5, 2.5, 3.0]
+            assert result.value() == Datacube(my_dbc).decode_response(b'1.5 2.5 3')
+
+    # every view is decoded once and cached
+    def test_views_cached(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            decoder = CountingDecoder(Datacube(my_dbc).decode_response)
+            result = QueryResult(b'1 2 3 4', {'output_format': None}, decoder)
+            assert decoder.calls == []
+            array = result.as_array()
+            assert result.as_array() is array and np.array_equal(array, [1, 2, 3, 4])
+            result.as_list()
+            result.as_list()
+            assert decoder.calls == ['array', 'list']
+
+    # binary results are decoded in their shape
+    def test_binary(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            content = np.arange(6, dtype='<f4').tobytes()
+            result = QueryResult(content, {'output_format': 'BINARY', 'cell_type': '<f4', 'shape': (2, 3)}, Datacube(my_dbc).decode_response)
+            assert result.as_grid().shape == (2, 3)
+            assert result.as_list() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+    # images aren't decoded as numbers, and only images can be opened as such
+    def test_images(self):
+        with DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows") as my_dbc:
+            image = QueryResult(b'\x89PNG', {'output_format': 'PNG'}, Datacube(my_dbc).decode_response)
+            assert image.value() == b'\x89PNG' and image.format == 'PNG'
+            with pytest.raises(ValueError):
+                image.as_list()
+            with pytest.raises(ValueError):
+                QueryResult(b'1', {'output_format': None}, Datacube(my_dbc).decode_response).as_image()
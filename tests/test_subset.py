@@ -0,0 +1,77 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from subset_module import AxisSubset, parse_subset, format_subset, split_axis, time_steps
+
+# this tests parse_subset() and format_subset()
+class Test_parse_subset():
+    # trims, slices, quoted bounds and CRS annotations are recognized
+    def test_parse(self):
+        axes = parse_subset('Lat(30:60), Long:"EPSG:4326"(8.80), ansi("2014-01":"2014-12")')
+        assert axes == [AxisSubset('Lat', 30.0, 60.0), AxisSubset('Long', 8.8, crs='EPSG:4326'),
+                        AxisSubset('ansi', '2014-01', '2014-12')]
+        assert [axis.is_slice for axis in axes] == [False, True, False]
+
+    # an open bound keeps the subset a trim
+    def test_open_bound(self):
+        (axis,) = parse_subset('Lat(30:*)')
+        assert not axis.is_slice and axis.high is None
+        assert format_subset([axis]) == 'Lat(30:*)'
+
+    # formatting gives back an equivalent subset string
+    def test_round_trip(self):
+        subset = 'Lat(-90:90.5), Long:"EPSG:4326"(8.8), ansi("2014-07")'
+        assert format_subset(parse_subset(subset)) == subset
+
+    # malformed subsets are rejected
+    def test_invalid(self):
+        with pytest.raises(TypeError):
+            parse_subset(None)
+        with pytest.raises(ValueError):
+            parse_subset('Lat(abc:10)')
+        with pytest.raises(ValueError):
+            parse_subset('Lat 30')
+
+# this tests split_axis()
+class Test_split_axis():
+    # pieces share their bounds and the last one is cut at the upper bound
+    def test_split(self):
+        pieces = split_axis(AxisSubset('Lat', -90.0, 90.0), 50)
+        assert [(piece.low, piece.high) for piece in pieces] == [(-90, -40), (-40, 10), (10, 60), (60, 90)]
+
+    # rounding doesn't add an empty piece at the end
+    def test_fractional(self):
+        assert len(split_axis(AxisSubset('Lat', 0.0, 0.3), 0.1)) == 3
+
+    # slices, dates and non-positive sizes can't be split
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            split_axis(AxisSubset('Lat', 30.0), 10)
+        with pytest.raises(ValueError):
+            split_axis(AxisSubset('ansi', '2014-01', '2014-12'), 1)
+        with pytest.raises(ValueError):
+            split_axis(AxisSubset('Lat', 0.0, 10.0), 0)
+
+# this tests the precision of time_steps()
+class Test_time_steps():
+    # steps finer than the spelling of the start would repeat coordinates and are rejected
+    def test_finer_than_start(self):
+        with pytest.raises(ValueError):
+            time_steps('2014-01', '2014-03', 'P10D')
+        with pytest.raises(ValueError):
+            time_steps('2014', '2015', 'P6M')
+        with pytest.raises(ValueError):
+            time_steps('2014-01', '2014-03', 'P1W')
+
+    # steps as coarse as the start or coarser are written without repeats
+    def test_same_precision(self):
+        assert time_steps('2014', '2016', 'P12M') == ['2014', '2015', '2016']
+        assert time_steps('2014-01', '2015-01', 'P1Y') == ['2014-01', '2015-01']
+        assert time_steps('2014-01-01', '2014-01-21', 'P10D') == ['2014-01-01', '2014-01-11', '2014-01-21']
@@ -0,0 +1,98 @@
+import sys
+import os
+import re
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+import numpy as np
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from helper_methods import StubServer, make_geotiff, wcs_responder
+
+# A one degree grid with cell edges on whole degrees; a trim returns the cells it overlaps, latitudes north
+# first like the AvgLandTemp fixture describes them (or south first if ascending is set)
+def cell_values(query, ascending=False):
+    lat_low, lat_high = (float(bound) for bound in re.search(r'Lat\(([^:]+):([^)]+)\)', query).groups())
+    long_low, long_high = (float(bound) for bound in re.search(r'Long\(([^:]+):([^)]+)\)', query).groups())
+    lats = np.arange(np.ceil(lat_high) - 1, np.floor(lat_low) - 1, -1)
+    if ascending:
+        lats = lats[::-1]
+    longs = np.arange(np.floor(long_low), np.ceil(long_high))
+    return lats[:, None] * 1000.0 + longs[None, :]
+
+def to_csv(grid):
+    return ','.join('{' + ','.join(str(value) for value in row) + '}' for row in grid).encode('utf-8')
+
+def csv_responder(query):
+    return to_csv(cell_values(query))
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(-30:40), ansi("2014-07"), Long(0:100)', '$c')
+
+# this tests execute_tiled()
+class Test_execute_tiled():
+    # the stitched tiles equal the untiled result
+    def test_same_as_untiled(self):
+        with StubServer(csv_responder, wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            expected = make_datacube(my_dbc).execute(return_type='grid')
+            stub.queries.clear()
+            result = make_datacube(my_dbc).execute_tiled({'Lat': 20, 'Long': 30}, max_workers=3)
+            assert result.shape == (70, 100)
+            assert np.array_equal(result, expected)
+            # 4 x 4 tiles, each one asked for once
+            assert len(set(stub.queries)) == len(stub.queries) == 16
+            assert all('ansi("2014-07")' in query for query in stub.queries)
+
+    # a single tiled axis, with GeoTIFF tiles
+    def test_one_axis_geotiff(self):
+        responder = lambda query: make_geotiff(cell_values(query).astype('<i4'))
+        with StubServer(responder, wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = make_datacube(my_dbc).set_format('GEOTIFF').execute_tiled({'Long': 25})
+            assert len(stub.queries) == 4
+            assert result.dtype == np.int32
+            assert np.array_equal(result, cell_values('Lat(-30:40), Long(0:100)'))
+
+    # the result's dimensions can be given in another order than the subset
+    def test_axis_order(self):
+        with StubServer(lambda query: to_csv(cell_values(query).T), wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = make_datacube(my_dbc).execute_tiled({'Lat': 35}, axis_order=['Long', 'Lat'])
+            assert np.array_equal(result, cell_values('Lat(-30:40), Long(0:100)').T)
+
+    # tiles are stitched in the order the grid stores them, whether it's given or described
+    def test_directions(self):
+        with StubServer(csv_responder, wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = make_datacube(my_dbc).execute_tiled({'Lat': 30})
+            assert result[0, 0] == 39000 and result[-1, 0] == -30000
+            assert len(stub.get_requests) == 1
+        with StubServer(lambda query: to_csv(cell_values(query, ascending=True))) as stub, DatabaseConnection(stub.url) as my_dbc:
+            result = make_datacube(my_dbc).execute_tiled({'Lat': 30}, axis_order=['Lat', 'Long'], directions={'Lat': 1})
+            assert np.array_equal(result, cell_values('Lat(-30:40), Long(0:100)', ascending=True))
+            # without a description the order of the tiles is unknown
+            with pytest.raises(ValueError):
+                make_datacube(my_dbc).execute_tiled({'Lat': 30}, axis_order=['Lat', 'Long'])
+            with pytest.raises(ValueError):
+                make_datacube(my_dbc).execute_tiled({'Lat': 30}, directions={'Lat': 1})
+            assert len(stub.queries) == 3
+
+    # tile sizes that don't match the grid are reported instead of stitched wrongly
+    def test_misaligned(self):
+        with StubServer(csv_responder, wcs_responder) as stub, DatabaseConnection(stub.url) as my_dbc:
+            with pytest.raises(ValueError):
+                make_datacube(my_dbc).execute_tiled({'Long': 7.3})
+
+    # queries that can't be split are rejected before anything is sent
+    def test_invalid(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(ValueError):
+            make_datacube(my_dbc).avg().execute_tiled({'Lat': 10})
+        with pytest.raises(ValueError):
+            make_datacube(my_dbc).execute_tiled({'ansi': 1})
+        with pytest.raises(ValueError):
+            make_datacube(my_dbc).set_format('PNG').execute_tiled({'Lat': 10})
+        with pytest.raises(TypeError):
+            make_datacube(my_dbc).execute_tiled([('Lat', 10)])
@@ -0,0 +1,80 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+import numpy as np
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from subset_module import time_steps
+from helper_methods import StubServer, time_responder
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80), ansi("2000-01")', '$c')
+
+# this tests time_steps()
+class Test_time_steps():
+    # steps keep the spelling of the start and the end is included when it falls on a step
+    def test_steps(self):
+        assert time_steps("2014-01", "2014-07", "P3M") == ['2014-01', '2014-04', '2014-07']
+        assert time_steps("2014-01-30", "2014-03-30", "P1M") == ['2014-01-30', '2014-02-28', '2014-03-30']
+        assert time_steps("2014-01-01", "2014-01-20", "P1W") == ['2014-01-01', '2014-01-08', '2014-01-15']
+
+    # unknown steps and times are rejected
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            time_steps("2014-01", "2014-07", "1 month")
+        with pytest.raises(ValueError):
+            time_steps("2014-01", "2014-07", "P0M")
+        with pytest.raises(ValueError):
+            time_steps("January", "2014-07")
+
+# this tests time_series()
+class Test_time_series():
+    # one query per step, results in time order, the existing time slice is replaced
+    def test_per_step(self):
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            times, values = make_datacube(my_dbc).avg().time_series("2014-01", "2014-12", max_workers=4)
+            assert times == time_steps("2014-01", "2014-12")
+            assert values == [float(month) for month in range(1, 13)]
+            assert len(stub.queries) == 12
+            assert all('2000-01' not in query for query in stub.queries)
+
+    # aggregations are batched into struct queries
+    def test_batched(self):
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            times, values = make_datacube(my_dbc).avg().time_series("2014-01", "2014-12", batch_size=5)
+            assert values == [float(month) for month in range(1, 13)]
+            assert len(stub.queries) == 3
+
+    # rejected batches are split until the server accepts them
+    def test_adaptive_batches(self):
+        with StubServer(time_responder(max_fields=3)) as stub, DatabaseConnection(stub.url) as my_dbc:
+            times, values = make_datacube(my_dbc).avg().time_series("2014-01", "2014-12", batch_size=12, max_workers=1)
+            assert values == [float(month) for month in range(1, 13)]
+            # 12 is rejected, 6 is rejected, 3 fits; later batches start at 3
+            assert len(stub.queries) == 1 + 1 + 2 + 2
+
+    # grids are stacked along a leading time axis
+    def test_stacked(self):
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            times, values = make_datacube(my_dbc).encode('$c').time_series("2014-01", "2014-03", return_type='grid', batch_size=4)
+            assert values.shape == (3, 2)
+            assert values[:, 0].tolist() == [1.0, 2.0, 3.0]
+            # only aggregations are batched
+            assert len(stub.queries) == 3
+
+    # invalid settings are reported before anything is sent
+    def test_invalid(self):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(ValueError):
+            make_datacube(my_dbc).avg().time_series("2014-01", "2014-12", batch_size=0)
+        with pytest.raises(TypeError):
+            make_datacube(my_dbc).avg().time_series("2014-01", "2014-12", max_workers='4')
+        with pytest.raises(ValueError):
+            Datacube(my_dbc).time_series("2014-01", "2014-12")
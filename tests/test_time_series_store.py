@@ -0,0 +1,94 @@
+import sys
+import os
+
+# Get the path to the src directory
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Add the src directory to the Python path
+sys.path.insert(0, src_dir)
+
+import pytest
+from datacube_basic_module import Datacube
+from database_connection_object_module import DatabaseConnection
+from time_series_store_module import TimeSeriesStore
+from helper_methods import StubServer, time_responder
+
+def make_datacube(my_dbc):
+    return Datacube(my_dbc).coverage_instance("AvgLandTemp", "c").subset('Lat(53.08), Long(8.80)', '$c')
+
+# this tests the TimeSeriesStore
+class Test_TimeSeriesStore():
+    # updates are kept in memory and survive a new store on the same directory
+    def test_persisted(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        store.update('k', {'2014-01': 1.5, '2014-02': [1.0, 2.0]})
+        steps = store.load('k')
+        store.update('k', {'2014-02': 3.0})
+        # the loaded dict is updated in place
+        assert steps == {'2014-01': 1.5, '2014-02': 3.0}
+        assert TimeSeriesStore(str(tmp_path)).load('k') == steps
+
+    # compaction keeps the latest value of every step
+    def test_compact(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        store.update('k', {'2014-01': 1.0})
+        store.update('k', {'2014-01': 2.0})
+        store.compact('k')
+        assert open(os.path.join(str(tmp_path), 'k.jsonl')).read().count('\n') == 1
+        assert TimeSeriesStore(str(tmp_path)).load('k') == {'2014-01': 2.0}
+
+    # a line cut off by a crash is skipped
+    def test_partial_line(self, tmp_path):
+        with open(os.path.join(str(tmp_path), 'k.jsonl'), 'w') as series_file:
+            series_file.write('{"time": "2014-01", "value": 1.0}\n{"time": "2014-0')
+        assert TimeSeriesStore(str(tmp_path)).load('k') == {'2014-01': 1.0}
+
+    # clear() removes series from memory and disk
+    def test_clear(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        store.update('k', {'2014-01': 1.0})
+        store.clear()
+        assert store.load('k') == {}
+        assert os.listdir(str(tmp_path)) == []
+
+# this tests Datacube.refresh()
+class Test_refresh():
+    # only steps that aren't stored yet are fetched
+    def test_incremental(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            times, values = make_datacube(my_dbc).avg().refresh(store, "2014-01", "2014-06")
+            assert values == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+            assert len(stub.queries) == 6
+            stub.queries.clear()
+            # a new store on the same directory knows the first six months
+            times, values = make_datacube(my_dbc).avg().refresh(TimeSeriesStore(str(tmp_path)), "2014-01", "2014-08")
+            assert times[-1] == '2014-08' and values == [float(month) for month in range(1, 9)]
+            assert sorted(query.split('ansi("')[1][:7] for query in stub.queries) == ['2014-07', '2014-08']
+
+    # the latest stored steps can be fetched again
+    def test_refetch(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            make_datacube(my_dbc).avg().refresh(store, "2014-01", "2014-06")
+            stub.queries.clear()
+            make_datacube(my_dbc).avg().refresh(store, "2014-01", "2014-06", refetch=2)
+            assert sorted(query.split('ansi("')[1][:7] for query in stub.queries) == ['2014-05', '2014-06']
+
+    # different queries are stored as different series
+    def test_separate_series(self, tmp_path):
+        store = TimeSeriesStore(str(tmp_path))
+        with StubServer(time_responder()) as stub, DatabaseConnection(stub.url) as my_dbc:
+            make_datacube(my_dbc).avg().refresh(store, "2014-01", "2014-03")
+            make_datacube(my_dbc).max().refresh(store, "2014-01", "2014-03")
+            times, values = make_datacube(my_dbc).encode('$c').refresh(store, "2014-01", "2014-03", return_type='grid')
+            assert values.shape == (3, 2)
+            assert len(stub.queries) == 9
+
+    # results that aren't numbers can't be stored
+    def test_invalid(self, tmp_path):
+        my_dbc = DatabaseConnection("https://ows.rasdaman.org/rasdaman/ows")
+        with pytest.raises(ValueError):
+            make_datacube(my_dbc).set_format('PNG').refresh(TimeSeriesStore(str(tmp_path)), "2014-01", "2014-03")
+        with pytest.raises(TypeError):
+            make_datacube(my_dbc).refresh(str(tmp_path), "2014-01", "2014-03")